@@ -10,9 +10,13 @@ import time
 import logging
 import glob
 import math
+import json
+import hashlib
 import numpy as np
 import scipy as sp
 import copy
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
 import matplotlib.pyplot as plt
 import matplotlib
 from matplotlib.image import NonUniformImage
@@ -103,6 +107,7 @@ def mainAIMEC(cfgPath, cfg):
     cfgFlags = cfg['FLAGS']
     pressureLimit = float(cfgSetup['pressureLimit'])
     interpMethod = cfgSetup['interpMethod']
+    nCPU = cfgSetup.getint('nCPU', fallback=1)
 
     log.info('Prepare data for post-ptocessing')
     # Make domain transformation
@@ -114,19 +119,18 @@ def mainAIMEC(cfgPath, cfg):
     # assign pressure data
     log.info("Assigning pressure data to deskewed raster")
     newRasterPressure = assignData(cfgPath['pressurefileList'], rasterTransfo,
-                                   interpMethod)
+                                   interpMethod, nCPU=nCPU)
     newRasters['newRasterPressure'] = newRasterPressure
-    # assign depth data
+    # assign depth and speed data (only read when needed if lazyFields)
+    lazyFields = cfgSetup.getboolean('lazyFields', fallback=True)
     log.info("Assigning depth data to deskewed raster")
-    newRasterDepth = assignData(cfgPath['depthfileList'], rasterTransfo,
-                                interpMethod)
-    newRasters['newRasterDepth'] = newRasterDepth
+    newRasters['newRasterDepth'] = assignFieldData(cfgPath['depthfileList'], rasterTransfo,
+                                                   interpMethod, nCPU, lazyFields)
     # assign speed data
     if cfgPath['speedfileList']:
         log.info("Assigning speed data to deskewed raster")
-        newRasterSpeed = assignData(cfgPath['speedfileList'], rasterTransfo,
-                                    interpMethod)
-        newRasters['newRasterSpeed'] = newRasterSpeed
+        newRasters['newRasterSpeed'] = assignFieldData(cfgPath['speedfileList'], rasterTransfo,
+                                                       interpMethod, nCPU, lazyFields)
 
     # assign dem data
     log.info("Assigning dem data to deskewed raster")
@@ -174,25 +178,56 @@ def makeDomainTransfo(cfgPath, cfgSetup, cfgFlags):
     """
     # Read input parameters
     rasterSource = cfgPath['pressurefileList'][0]
+    interpMethod = cfgSetup['interpMethod']
+
+    log.info('Data-file %s analysed' % rasterSource)
+    # only the header of the result raster is needed for the transformation
+    header = IOf.readASCheader(rasterSource)
+
+    rasterTransfo = None
+    useCache = cfgSetup.getboolean('useTransfoCache', fallback=False)
+    if useCache:
+        cacheFile = getTransfoCacheFile(cfgPath, cfgSetup, header)
+        rasterTransfo, Avapath = readTransfoCache(cacheFile)
+    if rasterTransfo is None:
+        rasterTransfo, Avapath = computeDomainTransfo(cfgPath, cfgSetup, header)
+        if useCache:
+            writeTransfoCache(cacheFile, rasterTransfo, Avapath)
+    rasterTransfo['header'] = header
+
+    ###########################################################################
+    # visualisation
+    if cfgFlags.getboolean('plotFigure') or cfgFlags.getboolean('savePlot'):
+        inputData = {}
+        inputData['avalData'] = transform(rasterSource, rasterTransfo, interpMethod)
+        inputData['sourceData'] = IOf.readRaster(rasterSource)
+        inputData['Avapath'] = Avapath
+
+        outAimec.visuTransfo(rasterTransfo, inputData, cfgPath, cfgFlags)
+
+    return rasterTransfo
+
+
+def computeDomainTransfo(cfgPath, cfgSetup, header):
+    """
+    Compute the domain transformation (see makeDomainTransfo)
+
+    input: cfgPath, cfgSetup, header of the result rasters
+    ouput: rasterTransfo as a dictionary (without header)
+           Avapath: avalanche path (x, y, z)
+    """
     demSource = cfgPath['demSource']
     ProfileLayer = cfgPath['profileLayer']
-    outpath = cfgPath['pathResult']
     DefaultName = cfgPath['projectName']
 
     w = float(cfgSetup['domainWidth'])
     runoutAngle = float(cfgSetup['runoutAngle'])
-    interpMethod = cfgSetup['interpMethod']
 
-    log.info('Data-file %s analysed' % rasterSource)
     # read data
-    # read raster data
-    sourceData = IOf.readRaster(rasterSource)
     dem = IOf.readRaster(demSource)
-    header = sourceData['header']
     xllc = header.xllcorner
     yllc = header.yllcorner
     cellsize = header.cellsize
-    rasterdata = sourceData['rasterData']
     # Initialize transformation dictionary
     rasterTransfo = {}
     rasterTransfo['domainWidth'] = w
@@ -201,9 +236,9 @@ def makeDomainTransfo(cfgPath, cfgSetup, cfgFlags):
     rasterTransfo['cellsize'] = cellsize
 
     # read avaPath
-    Avapath = shpConv.readLine(ProfileLayer, DefaultName, sourceData['header'])
+    Avapath = shpConv.readLine(ProfileLayer, DefaultName, header)
     # read split point
-    splitPoint = shpConv.readPoints(cfgPath['splitPointSource'], sourceData['header'])
+    splitPoint = shpConv.readPoints(cfgPath['splitPointSource'], header)
     # add 'z' coordinate to the avaPath
     Avapath = geoTrans.projectOnRaster(dem, Avapath)
     # reverse avaPath if necessary
@@ -223,12 +258,11 @@ def makeDomainTransfo(cfgPath, cfgSetup, cfgFlags):
     rasterTransfo = getSArea(rasterTransfo)
 
     log.info('Size of rasterdata- old: %d x %d - new: %d x %d' % (
-        np.size(rasterdata, 0), np.size(rasterdata, 1),
+        header.nrows, header.ncols,
         np.size(rasterTransfo['gridx'], 0), np.size(rasterTransfo['gridx'], 1)))
 
     ##########################################################################
     # affect values
-    rasterTransfo['header'] = header
     # put back scale and origin
     rasterTransfo['s'] = rasterTransfo['s']*cellsize
     rasterTransfo['l'] = rasterTransfo['l']*cellsize
@@ -255,18 +289,91 @@ def makeDomainTransfo(cfgPath, cfgSetup, cfgFlags):
     indRunoutPoint = geoTrans.findAngleProfile(tmp, delta_ind)
     rasterTransfo['indRunoutPoint'] = indRunoutPoint
 
-    avalData = transform(rasterSource, rasterTransfo, interpMethod)
+    return rasterTransfo, Avapath
 
-    ###########################################################################
-    # visualisation
-    inputData = {}
-    inputData['avalData'] = avalData
-    inputData['sourceData'] = sourceData
-    inputData['Avapath'] = Avapath
 
-    outAimec.visuTransfo(rasterTransfo, inputData, cfgPath, cfgFlags)
+def getTransfoCacheFile(cfgPath, cfgSetup, header):
+    """
+    Return the cache file name of the domain transformation
+
+    The name contains a hash of the content of the DEM, the path and split
+    point shapefiles, the header of the result rasters, the raster precision
+    and the AIMECSETUP values the transformation depends on. Without
+    transfoCacheDir the cache is in Outputs/ana3AIMEC/transfoCache.
+    input: cfgPath, cfgSetup, header of the result rasters
+    ouput: cacheFile name of the cache file (.npz)
+    """
+    cacheDir = cfgSetup.get('transfoCacheDir', fallback='')
+    if cacheDir == '':
+        cacheDir = os.path.join(os.path.dirname(cfgPath['pathResult']), 'transfoCache')
+
+    keyDict = {'version': 1, 'header': IOf._header2dict(header),
+               'precision': str(IOf.getRasterDtype(IOf.getRasterConfig())),
+               'domainWidth': float(cfgSetup['domainWidth']),
+               'runoutAngle': float(cfgSetup['runoutAngle'])}
+    keyDict['dem'] = IOf._hashFile(cfgPath['demSource'])
+    for key in ['profileLayer', 'splitPointSource']:
+        # a shapefile consists of the .shp, .shx and .dbf file
+        baseName = os.path.splitext(cfgPath[key])[0]
+        keyDict[key] = [IOf._hashFile(baseName + ext) for ext in ['.shp', '.shx', '.dbf']
+                        if os.path.isfile(baseName + ext)]
+    key = hashlib.sha1(json.dumps(keyDict, sort_keys=True).encode()).hexdigest()
+    return os.path.join(cacheDir, 'rasterTransfo_%s.npz' % key)
+
+
+def readTransfoCache(cacheFile):
+    """
+    Read the domain transformation from its cache file
 
-    return rasterTransfo
+    input: cacheFile name of the cache file (see getTransfoCacheFile)
+    ouput: rasterTransfo as a dictionary (without header), None if there is
+           no valid cache
+           Avapath: avalanche path (x, y), None if there is no valid cache
+    """
+    if not os.path.isfile(cacheFile):
+        return None, None
+    try:
+        with np.load(cacheFile) as cache:
+            rasterTransfo = json.loads(str(cache['scalars']))
+            Avapath = {'x': cache['avaPathX'], 'y': cache['avaPathY']}
+            for key in cache.files:
+                if key not in ['scalars', 'avaPathX', 'avaPathY']:
+                    rasterTransfo[key] = cache[key]
+    except (OSError, ValueError, KeyError):
+        log.warning('Could not read domain transformation cache %s' % cacheFile)
+        return None, None
+    log.info('Domain transformation read from cache: %s' % cacheFile)
+    return rasterTransfo, Avapath
+
+
+def writeTransfoCache(cacheFile, rasterTransfo, Avapath):
+    """
+    Write the domain transformation to its cache file
+
+    The arrays are saved in a numpy archive, the scalars as json string. The
+    file is written to a temporary file first and then moved, so that a
+    concurrent read never sees a half written file.
+    input: cacheFile name of the cache file (see getTransfoCacheFile)
+           rasterTransfo dictionary (the header is not saved)
+           Avapath: avalanche path (x, y)
+    """
+    arrays = {'avaPathX': Avapath['x'], 'avaPathY': Avapath['y']}
+    scalars = {}
+    for key, value in rasterTransfo.items():
+        if isinstance(value, np.ndarray):
+            arrays[key] = value
+        elif key not in ['header', 'interpOperators']:
+            scalars[key] = value.item() if isinstance(value, np.generic) else value
+    arrays['scalars'] = np.array(json.dumps(scalars))
+    try:
+        os.makedirs(os.path.dirname(cacheFile), exist_ok=True)
+        tmpFile = '%s.%d.tmp' % (cacheFile, os.getpid())
+        with open(tmpFile, 'wb') as outfile:
+            np.savez(outfile, **arrays)
+        os.replace(tmpFile, cacheFile)
+        log.info('Domain transformation written to cache: %s' % cacheFile)
+    except OSError:
+        log.warning('Could not write domain transformation cache %s' % cacheFile)
 
 
 def split_section(DB, i):
@@ -311,6 +418,31 @@ def split_section(DB, i):
     return bxl, byl, bxr, byr, m
 
 
+def linspaceRows(start, stop, num):
+    """ Row wise linspace
+        Same as stacking np.linspace(start[k], stop[k], num) for all k (with
+        the same arithmetic, so the result is identical) but in one go
+        input: - start, stop 1D arrays of the first and last value of each row
+               - num number of values per row
+        ouput: - array of shape (len(start), num)
+    """
+    start = np.asarray(start, dtype=float)[:, np.newaxis]
+    stop = np.asarray(stop, dtype=float)[:, np.newaxis]
+    div = num - 1
+    delta = stop - start
+    y = np.arange(0, num, dtype=float)[np.newaxis, :]
+    if div > 0:
+        step = delta / div
+        # like np.linspace, divide first if the step is zero (underflow)
+        rows = np.where(step == 0, (y / div) * delta, y * step)
+    else:
+        rows = y * delta
+    rows = rows + start
+    if num > 1:
+        rows[:, -1] = stop[:, 0]
+    return rows
+
+
 def makeTransfoMat(rasterTransfo):
     """ Make transformation matrix.
         Takes a Domain Boundary and finds the (x,y) coordinates of the new
@@ -333,32 +465,23 @@ def makeTransfoMat(rasterTransfo):
     n2Tot = int(np.floor(nTot/2))
     lcoord = np.linspace(-n2Tot, n2Tot, nTot)  # this way, 0 is in lcoord
 
-    # initialize new_rasters
-    newGridRasterX = np.array([])  # xcoord of the points of the new raster
-    newGridRasterY = np.array([])  # ycoord of the points of the new raster
-    # loop on each section of the path
+    # boundary points of all segments of all sections (the last point of a
+    # section is the first one of the next section, only the last section
+    # keeps it), collected once instead of appending row by row
+    bxlAll, bylAll, bxrAll, byrAll = [], [], [], []
     for i in range(n_pnt-1):
         # split edges in segments
         bxl, byl, bxr, byr, m = split_section(rasterTransfo, i)
         # bxl, byl, bxr, byr reprensent the s direction (olong path)
-        # loop on segments of section
-        for j in range(m-1):
-            # this is the cross section segment (l direction)
-            x = np.linspace(bxl[j], bxr[j], nTot)  # line coordinates x
-            y = np.linspace(byl[j], byr[j], nTot)  # line coordinates y
-            # save x and y coordinates of the new raster points
-            if i == 0 and j == 0:
-                newGridRasterX = x.reshape(1, nTot)
-                newGridRasterY = y.reshape(1, nTot)
-            else:
-                newGridRasterX = np.append(newGridRasterX, x.reshape(1, nTot), axis=0)
-                newGridRasterY = np.append(newGridRasterY, y.reshape(1, nTot), axis=0)
-
-    # add last column
-    x = np.linspace(bxl[m-1], bxr[m-1], nTot)  # line coordinates x
-    y = np.linspace(byl[m-1], byr[m-1], nTot)  # line coordinates y
-    newGridRasterX = np.append(newGridRasterX, x.reshape(1, nTot), axis=0)
-    newGridRasterY = np.append(newGridRasterY, y.reshape(1, nTot), axis=0)
+        nKeep = m if i == n_pnt-2 else m-1
+        bxlAll.append(bxl[:nKeep])
+        bylAll.append(byl[:nKeep])
+        bxrAll.append(bxr[:nKeep])
+        byrAll.append(byr[:nKeep])
+
+    # each row is a cross section segment (l direction)
+    newGridRasterX = linspaceRows(np.concatenate(bxlAll), np.concatenate(bxrAll), nTot)
+    newGridRasterY = linspaceRows(np.concatenate(bylAll), np.concatenate(byrAll), nTot)
 
     rasterTransfo['l'] = lcoord
     rasterTransfo['gridx'] = newGridRasterX
@@ -417,12 +540,11 @@ def transform(fname, rasterTransfo, interpMethod):
     input:
             -fname = name of rasterfile to transform
             -rasterTransfo = transformation info
-            -interpolation method to chose between 'nearest' and 'bilinear'
+            -interpolation method to chose between 'nearest', 'bilinear' and 'bicubic'
     ouput:
             -new_data = z, pressure or depth... corresponding to fname on the new raster
     """
     name = os.path.basename(fname)
-    data = IOf.readRaster(fname)
 
     # read tranformation info
     newGridRasterX = rasterTransfo['gridx']
@@ -431,38 +553,155 @@ def transform(fname, rasterTransfo, interpMethod):
     n, m = np.shape(newGridRasterX)
     xx = newGridRasterX
     yy = newGridRasterY
-    Points = {}
-    Points['x'] = xx.flatten()
-    Points['y'] = yy.flatten()
-    Points, iib, ioob = geoTrans.projectOnRasterVect(data, Points, interp=interpMethod)
-    newData = Points['z'].reshape(n, m)
+    # only read the part of the raster covering the new raster (bicubic
+    # interpolation also needs the neighbour cells)
+    margin = rasterTransfo['cellsize'] if interpMethod == 'bicubic' else 0
+    data = IOf.readRasterWindow(fname, np.nanmin(xx) - margin, np.nanmax(xx) + margin,
+                                np.nanmin(yy) - margin, np.nanmax(yy) + margin)
+    log.debug('Data-file: %s - reading window of %d x %d cells' % (name, data['header'].nrows,
+                                                                  data['header'].ncols))
+    operator = getInterpOperator(rasterTransfo, data, interpMethod)
+    newData = geoTrans.applyInterpOperator(operator, data['rasterData']).reshape(n, m)
+    iib = operator['itot']
+    ioob = operator['ioob']
     log.info('Data-file: %s - %d raster values transferred - %d out of original raster bounds!' %
              (name, iib-ioob, ioob))
 
     return newData
 
 
-def assignData(fnames, rasterTransfo, interpMethod):
+def getInterpOperator(rasterTransfo, data, interpMethod):
+    """
+    Interpolation operator from a raster (window) to the new raster
+    The operator only depends on the header of the raster window, not on its
+    values, so it is built once (see geoTrans.makeInterpOperator) and kept in
+    rasterTransfo['interpOperators'] for the following rasters
+    input:
+            -rasterTransfo = transformation info
+            -data = raster window (see ascUtils.readRasterWindow)
+            -interpolation method to chose between 'nearest', 'bilinear' and 'bicubic'
+    ouput:
+            -operator = interpolation operator
+    """
+    header = data.get('parentHeader', data['header'])
+    key = (interpMethod, str(data['rasterData'].dtype), tuple(data.get('windowOffset', (0, 0))),
+           np.shape(data['rasterData']), header.nrows, header.ncols, header.xllcorner,
+           header.yllcorner, header.cellsize)
+    operators = rasterTransfo.setdefault('interpOperators', {})
+    if key not in operators:
+        Points = {}
+        Points['x'] = rasterTransfo['gridx'].flatten()
+        Points['y'] = rasterTransfo['gridy'].flatten()
+        operators[key] = geoTrans.makeInterpOperator(data, Points, interp=interpMethod)
+    return operators[key]
+
+
+def assignData(fnames, rasterTransfo, interpMethod, nCPU=1):
     """
     Affect value to the points of the new raster (after domain transormation)
     input:
             -fnames = list of names of rasterfiles to transform
             -rasterTransfo = transformation info
-            -interpolation method to chose between 'nearest' and 'bilinear'
-    ouput: avalData = z, pressure or depth... corresponding to fnames on the new rasters
+            -interpolation method to chose between 'nearest', 'bilinear' and 'bicubic'
+            -nCPU = number of processes used to transform the files
+    ouput: avalData = z, pressure or depth... corresponding to fnames on the new rasters,
+           stacked in one array of shape (number of files, nS, nL)
     """
 
     maxtopo = len(fnames)
-    avalData = np.array(([None] * maxtopo))
+    avalData = np.empty((maxtopo, ) + np.shape(rasterTransfo['gridx']))
 
     log.info('Transfer data of %d file(s) from old to new raster' % maxtopo)
-    for i in range(maxtopo):
-        fname = fnames[i]
-        avalData[i] = transform(fname, rasterTransfo, interpMethod)
+    nCPU = min(nCPU, maxtopo)
+    if nCPU > 1:
+        newRasters = assignDataParallel(fnames, rasterTransfo, interpMethod, nCPU)
+    else:
+        newRasters = (transform(fname, rasterTransfo, interpMethod) for fname in fnames)
+    for i, newData in enumerate(newRasters):
+        # keep the dtype of the rasters (float32 or float64)
+        if i == 0 and newData.dtype != avalData.dtype:
+            avalData = avalData.astype(newData.dtype)
+        avalData[i] = newData
 
     return avalData
 
 
+def assignFieldData(fnames, rasterTransfo, interpMethod, nCPU, lazyFields):
+    """
+    Assign the data of a field to the new raster, either all files at once
+    (see assignData) or lazily (see cLazyRasters)
+    """
+    if lazyFields:
+        return cLazyRasters(fnames, rasterTransfo, interpMethod)
+    return assignData(fnames, rasterTransfo, interpMethod, nCPU=nCPU)
+
+
+class cLazyRasters:
+    """
+    Rasters transformed to the new raster on demand
+    Indexing with a simulation number reads and transforms the corresponding
+    file. Only the reference simulation (index 0, also used for the plots)
+    and the last accessed simulation are kept, so at most two simulations are
+    in memory; accessing any other simulation again reads the file again.
+    """
+    def __init__(self, fnames, rasterTransfo, interpMethod):
+        self.fnames = fnames
+        self.rasterTransfo = rasterTransfo
+        self.interpMethod = interpMethod
+        self.cache = {}
+
+    def __len__(self):
+        return len(self.fnames)
+
+    def __getitem__(self, i):
+        i = range(len(self.fnames))[i]
+        if i not in self.cache:
+            # keep the reference simulation and replace the last accessed one
+            self.cache = {key: value for key, value in self.cache.items() if key == 0}
+            self.cache[i] = transform(self.fnames[i], self.rasterTransfo, self.interpMethod)
+        return self.cache[i]
+
+
+def assignDataParallel(fnames, rasterTransfo, interpMethod, nCPU):
+    """
+    Transform the files with a pool of nCPU processes
+    The new grid (gridx, gridy) is shared with the processes through shared
+    memory instead of being sent with every file. The transformed rasters are
+    yielded in the order of fnames.
+    """
+    grid = np.stack((rasterTransfo['gridx'], rasterTransfo['gridy']))
+    shm = shared_memory.SharedMemory(create=True, size=grid.nbytes)
+    try:
+        np.ndarray(grid.shape, dtype=grid.dtype, buffer=shm.buf)[:] = grid
+        with ProcessPoolExecutor(max_workers=nCPU, initializer=_initTransformWorker,
+                                 initargs=(shm.name, grid.shape, grid.dtype.str,
+                                           rasterTransfo['cellsize'], interpMethod)) as executor:
+            for newData in executor.map(_transformWorker, fnames):
+                yield newData
+    finally:
+        shm.close()
+        shm.unlink()
+
+
+# grid and settings of a worker process of assignDataParallel
+_workerData = {}
+
+
+def _initTransformWorker(shmName, shape, dtype, cellsize, interpMethod):
+    """ Attach a worker process to the shared grid """
+    # the shared memory is owned (and unlinked) by the parent process
+    shm = shared_memory.SharedMemory(name=shmName, create=False)
+    grid = np.ndarray(shape, dtype=dtype, buffer=shm.buf)
+    _workerData['shm'] = shm
+    _workerData['rasterTransfo'] = {'gridx': grid[0], 'gridy': grid[1], 'cellsize': cellsize}
+    _workerData['interpMethod'] = interpMethod
+
+
+def _transformWorker(fname):
+    """ Transform one file in a worker process """
+    return transform(fname, _workerData['rasterTransfo'], _workerData['interpMethod'])
+
+
 # -----------------------------------------------------------
 # Aimec analysis tools
 # -----------------------------------------------------------
@@ -507,59 +746,38 @@ def analyzeFields(rasterTransfo, pLim, newRasters, cfgPath):
 
     resAnalysis = {}
 
-    # initialize Arrays
     nTopo = len(fname)
-    runout = np.empty((3, nTopo))
-    runoutMean = np.empty((3, nTopo))
-    ampp = np.empty((nTopo))
-    mmpp = np.empty((nTopo))
-    amd = np.empty((nTopo))
-    mmd = np.empty((nTopo))
-    ams = np.empty((nTopo))
-    mms = np.empty((nTopo))
-    elevRel = np.empty((nTopo))
-    deltaH = np.empty((nTopo))
-    grIndex = np.empty((nTopo))
-    grGrad = np.empty((nTopo))
-    releaseMass = np.empty((nTopo))
-    entrainedMass = np.empty((nTopo))
-
     n = np.shape(lcoord)[0]
-    pCrossAll = np.zeros((nTopo, len(scoord)))
+
+    # area of the cells for each simulation, cells without pressure value
+    # in this or one of the previous simulations are not taken into account
+    nanMask = np.logical_or.accumulate(np.isnan(dataPressure[:nTopo]), axis=0)
+    rasterArea = np.where(nanMask, np.nan, rasterTransfo['rasterArea'])
+    rasterTransfo['rasterArea'][nanMask[-1]] = np.nan
+
+    # Mean max in each Cross-Section for each field (all simulations at once)
+    ampp, mmpp, cInd, pCrossAll = getMaxMeanValues(dataPressure[:nTopo], rasterArea, pLim, cInd=None)
+    amd, mmd = getFieldMaxMeanValues(dataDepth, rasterArea, pLim, cInd)
+    ams, mms = getFieldMaxMeanValues(dataSpeed, rasterArea, pLim, cInd)
+    #    Runout
+    cupper = cInd['cupper']
+    clower = cInd['clower']
+    clowerm = cInd['clowerm']
+    runout = np.array([scoord[clower] - sBeta, x[clower], y[clower]])
+    runoutMean = np.array([scoord[clowerm] - sBeta, x[clower], y[clower]])
+
+    elevRel = dataDEM[cupper, int(np.floor(n/2)+1)]
+    deltaH = dataDEM[cupper, int(np.floor(n/2)+1)] - dataDEM[clower, int(np.floor(n/2)+1)]
+
+    # analyze mass
+    massResults = np.array([readWrite(fnameMass[i]) for i in range(nTopo)]).reshape((nTopo, 4))
+    releaseMass, entrainedMass, grIndex, grGrad = massResults.T
+    if np.any(releaseMass != releaseMass[0]):
+        log.warning('Release masses differs between simulations!')
+
     log.info('{: <10} {: <10} {: <10} {: <10} {: <10} {: <10} {: <10} {: <10}'.format(
         'Sim number ', 'Runout ', 'ampp ', 'mmpp ', 'amd ', 'mmd ', 'GI ', 'GR '))
-    # For each data set
     for i in range(nTopo):
-        rasterdataPres = dataPressure[i]
-        rasterdataDepth = dataDepth[i]
-        rasterdataSpeed = dataSpeed[i]
-        rasterArea = rasterTransfo['rasterArea']
-        rasterArea[np.where(np.isnan(rasterdataPres))] = np.nan
-
-        # Mean max in each Cross-Section for each field
-        ampp[i], mmpp[i], cInd, pCrossAll[i] = getMaxMeanValues(rasterdataPres, rasterArea, pLim, cInd=None)
-        amd[i], mmd[i], cInd, _ = getMaxMeanValues(rasterdataDepth, rasterArea, pLim, cInd=cInd)
-        ams[i], mms[i], cInd, _ = getMaxMeanValues(rasterdataSpeed, rasterArea, pLim, cInd=cInd)
-        #    Runout
-        cupper = cInd['cupper']
-        clower = cInd['clower']
-        cupperm = cInd['cupperm']
-        clowerm = cInd['clowerm']
-        runout[0, i] = scoord[clower] - sBeta
-        runout[1, i] = x[clower]
-        runout[2, i] = y[clower]
-        runoutMean[0, i] = scoord[clowerm] - sBeta
-        runoutMean[1, i] = x[clower]
-        runoutMean[2, i] = y[clower]
-
-        elevRel[i] = dataDEM[cupper, int(np.floor(n/2)+1)]
-        deltaH[i] = dataDEM[cupper, int(np.floor(n/2)+1)] - dataDEM[clower, int(np.floor(n/2)+1)]
-
-        # analyze mass
-        releaseMass[i], entrainedMass[i], grIndex[i], grGrad[i] = readWrite(fnameMass[i])
-        if not (releaseMass[i] == releaseMass[0]):
-            log.warning('Release masses differs between simulations!')
-
         log.info('{: <10} {:<10.4f} {:<10.4f} {:<10.4f} {:<10.4f} {:<10.4f} {:<10.4f} {:<10.4f}'.format(
             *[i+1, runout[0, i], ampp[i], mmpp[i], amd[i], mmd[i], grIndex[i], grGrad[i]]))
 
@@ -598,46 +816,50 @@ def analyzeArea(rasterTransfo, resAnalysis, pLim, newRasters, cfgPath, cfgFlags)
     cellarea = rasterTransfo['rasterArea']
     indRunoutPoint = rasterTransfo['indRunoutPoint']
 
-    # initialize Arrays
     nTopo = len(fname)
-    TP = np.empty((nTopo))
-    FN = np.empty((nTopo))
-    FP = np.empty((nTopo))
-    TN = np.empty((nTopo))
 
+    """
+    area
+    # true positive: reality(mask)=1, model(rasterdata)=1
+    # false negative: reality(mask)=1, model(rasterdata)=0
+    # false positive: reality(mask)=0, model(rasterdata)=1
+    # true negative: reality(mask)=0, model(rasterdata)=0
+    """
+    # for each pressure-file pLim is introduced (1/3/.. kPa), where the avalanche has stopped
+    newRasterData = np.nan_to_num(dataPressure[:nTopo])
+    newRasterData[:, 0:indRunoutPoint] = 0
+    newRasterData[newRasterData < pLim] = 0
+    newRasterData[newRasterData >= pLim] = 1
     # take first simulation as reference
-    newMask = copy.deepcopy(dataPressure[0])
-    # prepare mask for area resAnalysis
-    newMask[0:indRunoutPoint] = 0
-    newMask[np.where(np.nan_to_num(newMask) < pLim)] = 0
-    newMask[np.where(np.nan_to_num(newMask) >= pLim)] = 1
+    newMask = newRasterData[0]
 
-    # comparison rasterdata with mask
-    log.info('{: <15} {: <15} {: <15} {: <15} {: <15}'.format(
-        'Sim number ', 'TP ', 'FN ', 'FP ', 'TN'))
     # rasterinfo
-    nStart, m_start = np.nonzero(np.nan_to_num(newMask))
+    nStart, m_start = np.nonzero(newMask)
     nStart = min(nStart)
 
     nTot = len(scoord)
 
+    # subareas of all simulations
+    refArea = (newMask[nStart:nTot+1] == True)
+    simArea = (newRasterData[:, nStart:nTot+1] == True)
+    cellareaRunout = cellarea[nStart:nTot+1]
+    TP = np.sum(np.where(refArea & simArea, cellareaRunout, 0), axis=(1, 2))
+    FP = np.sum(np.where(~refArea & simArea, cellareaRunout, 0), axis=(1, 2))
+    FN = np.sum(np.where(refArea & ~simArea, cellareaRunout, 0), axis=(1, 2))
+    TN = np.sum(np.where(~refArea & ~simArea, cellareaRunout, 0), axis=(1, 2))
+
+    # comparison rasterdata with mask
+    log.info('{: <15} {: <15} {: <15} {: <15} {: <15}'.format(
+        'Sim number ', 'TP ', 'FN ', 'FP ', 'TN'))
     for i in range(nTopo):
-        rasterdata = dataPressure[i]
-
-        """
-        area
-        # true positive: reality(mask)=1, model(rasterdata)=1
-        # false negative: reality(mask)=1, model(rasterdata)=0
-        # false positive: reality(mask)=0, model(rasterdata)=1
-        # true negative: reality(mask)=0, model(rasterdata)=0
-        """
-        # for each pressure-file pLim is introduced (1/3/.. kPa), where the avalanche has stopped
-        newRasterData = copy.deepcopy(rasterdata)
-        newRasterData[0:indRunoutPoint] = 0
-        newRasterData[np.where(np.nan_to_num(newRasterData) < pLim)] = 0
-        newRasterData[np.where(np.nan_to_num(newRasterData) >= pLim)] = 1
-
-        if cfgFlags.getboolean('savePlot') and i > 0:
+        # take reference (first simulation) as normalizing area
+        areaSum = TP[i] + FN[i]
+        log.info('{: <15} {:<15.4f} {:<15.4f} {:<15.4f} {:<15.4f}'.format(
+            *[i+1, TP[i]/areaSum, FN[i]/areaSum, FP[i]/areaSum, TN[i]/areaSum]))
+
+    # plot comparison to reference for each simulation
+    if cfgFlags.getboolean('savePlot'):
+        for i in range(1, nTopo):
             # read paths
             pathResult = cfgPath['pathResult']
             projectName = cfgPath['dirName']
@@ -675,7 +897,7 @@ def analyzeArea(rasterTransfo, resAnalysis, pLim, newRasters, cfgPath, cfgFlags)
             im = NonUniformImage(ax2, extent=[lcoord.min(), lcoord.max(),
                                               scoord.min(), scoord.max()], cmap=cmap)
             im.set_clim(vmin=-0.000000001, vmax=0.000000001)
-            im.set_data(lcoord, scoord, newRasterData-newMask)
+            im.set_data(lcoord, scoord, newRasterData[i]-newMask)
             ref0 = ax2.images.append(im)
             # cbar = ax2.figure.colorbar(im, ax=ax2, extend='both', use_gridspec=True)
             # cbar.ax.set_ylabel('peak pressure [kPa]')
@@ -690,38 +912,6 @@ def analyzeArea(rasterTransfo, resAnalysis, pLim, newRasters, cfgPath, cfgFlags)
             fig.savefig(outname, transparent=True)
             plt.close(fig)
 
-        tpInd = np.where((newMask[nStart:nTot+1] == True) &
-                         (newRasterData[nStart:nTot+1] == True))
-        fpInd = np.where((newMask[nStart:nTot+1] == False) &
-                         (newRasterData[nStart:nTot+1] == True))
-        fnInd = np.where((newMask[nStart:nTot+1] == True) &
-                         (newRasterData[nStart:nTot+1] == False))
-        tnInd = np.where((newMask[nStart:nTot+1] == False) &
-                         (newRasterData[nStart:nTot+1] == False))
-
-        # Teilrasterpunkte
-        tpCount = len(tpInd[0])
-        fpCount = len(fpInd[0])
-        fnCount = len(fnInd[0])
-        tnCount = len(tnInd[0])
-
-        # subareas
-        tp = sum(cellarea[tpInd[0] + nStart, tpInd[1]])
-        fp = sum(cellarea[fpInd[0] + nStart, fpInd[1]])
-        fn = sum(cellarea[fnInd[0] + nStart, fnInd[1]])
-        tn = sum(cellarea[tnInd[0] + nStart, tnInd[1]])
-
-        # take reference (first simulation) as normalizing area
-        areaSum = tp + fn
-
-        TP[i] = tp
-        FN[i] = fn
-        FP[i] = fp
-        TN[i] = tn
-
-        log.info('{: <15} {:<15.4f} {:<15.4f} {:<15.4f} {:<15.4f}'.format(
-            *[i+1, tp/areaSum, fn/areaSum, fp/areaSum, tn/areaSum]))
-
     resAnalysis['TP'] = TP
     resAnalysis['FN'] = FN
     resAnalysis['FP'] = FP
@@ -750,49 +940,92 @@ def readWrite(fname_ent):
 
 
 def getMaxMeanValues(rasterdataA, rasterArea, pLim, cInd=None):
+    """
+    Get the cross section max and mean values of a field for all simulations
+    input:
+            -rasterdataA = field of all simulations (nSim, nS, nL)
+            -rasterArea = cell areas for each simulation (nSim, nS, nL), NaN for
+            cells that are not taken into account
+            -pLim = threshold to determine the runout
+            -cInd = cross section indices of the runout (computed from this field if None)
+    ouput:
+            -ama, mma = mean and max of the cross section max values between
+            cupper and clower for each simulation (nSim)
+            -cInd = dictionary with cupper, clower, cupperm, clowerm (nSim)
+            -aCrossMax = cross section max values (nSim, nS)
+    """
     # get mean max for each cross section for A field
-    aCrossMean = np.nansum(rasterdataA*rasterArea, axis=1)/np.nansum(rasterArea, axis=1)
-    # aCrossMean = np.nanmean(rasterdataA, axis=1)
-    aCrossMax = np.nanmax(rasterdataA, 1)
+    # (accumulate in float64 also for float32 rasters)
+    aCrossMean = (np.nansum(rasterdataA*rasterArea, axis=2, dtype=np.float64) /
+                  np.nansum(rasterArea, axis=2, dtype=np.float64))
+    aCrossMax = np.nanmax(rasterdataA, 2).astype(np.float64)
     # also get the Area corresponding to those cells
-    indACrossMax = np.nanargmax(rasterdataA, 1)
-    ind1 = np.arange(np.shape(rasterdataA)[0])
-    AreaACrossMax = rasterArea[ind1, indACrossMax]
+    indACrossMax = np.nanargmax(rasterdataA, 2)
+    AreaACrossMax = np.take_along_axis(rasterArea, indACrossMax[:, :, np.newaxis], axis=2)[:, :, 0]
 
     #   Determine runout according to maximum and averaged values
-    # search in max values
     if not cInd:
-        lindex = np.nonzero(aCrossMax > pLim)[0]
-        if lindex.any():
-            cupper = min(lindex)
-            clower = max(lindex)
-        else:
-            log.error('No average pressure values > threshold found. threshold = %10.4f, too high?' % pLim)
-            cupper = 0
-            clower = 0
-            # search in mean values
-            lindex = np.nonzero(aCrossMean > pLim)[0]
-        if lindex.any():
-            cupperm = min(lindex)
-            clowerm = max(lindex)
-        else:
+        # search in max values
+        cupper, clower, found = getThresholdRange(aCrossMax > pLim)
+        # search in mean values
+        cupperm, clowerm, foundm = getThresholdRange(aCrossMean > pLim)
+        for i in np.nonzero(~found)[0]:
             log.error('No average pressure values > threshold found. threshold = %10.4f, too high?' % pLim)
-            cupperm = 0
-            clowerm = 0
+            if not foundm[i]:
+                log.error('No average pressure values > threshold found. threshold = %10.4f, too high?' % pLim)
+        # if found in the max values, these also give the runout for the mean values
         cInd = {}
         cInd['cupper'] = cupper
         cInd['clower'] = clower
-        cInd['cupperm'] = cupperm
-        cInd['clowerm'] = clowerm
+        cInd['cupperm'] = np.where(found, cupper, cupperm)
+        cInd['clowerm'] = np.where(found, clower, clowerm)
     else:
         cupper = cInd['cupper']
         clower = cInd['clower']
-        cupperm = cInd['cupperm']
-        clowerm = cInd['clowerm']
 
     # Mean max of of a in each Cross-Section
-    ama = np.nansum((aCrossMax*AreaACrossMax)[cupper:clower+1]) / \
-        np.nansum(AreaACrossMax[cupper:clower+1])
-    mma = max(aCrossMax[cupper:clower+1])
+    sInd = np.arange(np.shape(rasterdataA)[1])
+    inRunout = (sInd >= cupper[:, np.newaxis]) & (sInd <= clower[:, np.newaxis])
+    ama = np.nansum(np.where(inRunout, aCrossMax*AreaACrossMax, np.nan), axis=1) / \
+        np.nansum(np.where(inRunout, AreaACrossMax, np.nan), axis=1)
+    mma = np.max(np.where(inRunout, aCrossMax, -np.inf), axis=1)
 
     return ama, mma, cInd, aCrossMax
+
+
+def getFieldMaxMeanValues(dataField, rasterArea, pLim, cInd):
+    """
+    Get mean and max of the cross section max values of a field (see
+    getMaxMeanValues) for given runout indices cInd
+    Lazily loaded fields (cLazyRasters) are analyzed one simulation after the
+    other, so that only one simulation is in memory.
+    """
+    nTopo = np.shape(rasterArea)[0]
+    if isinstance(dataField, np.ndarray):
+        ama, mma, _, _ = getMaxMeanValues(dataField[:nTopo], rasterArea, pLim, cInd=cInd)
+        return ama, mma
+
+    ama = np.empty(nTopo)
+    mma = np.empty(nTopo)
+    for i in range(nTopo):
+        cIndSim = {key: value[i:i+1] for key, value in cInd.items()}
+        amaSim, mmaSim, _, _ = getMaxMeanValues(dataField[i][np.newaxis], rasterArea[i:i+1], pLim,
+                                                cInd=cIndSim)
+        ama[i] = amaSim[0]
+        mma[i] = mmaSim[0]
+    return ama, mma
+
+
+def getThresholdRange(exceed):
+    """
+    Get the first and last cross section where a threshold is exceeded
+    input: exceed = boolean array (nSim, nS)
+    ouput: first, last = indices of the first and last True value for each
+           simulation (0 if not found), found = True if found
+    A threshold exceeded only in the first cross section does not count as found.
+    """
+    nS = np.shape(exceed)[1]
+    found = np.any(exceed[:, 1:], axis=1)
+    first = np.where(found, np.argmax(exceed, axis=1), 0)
+    last = np.where(found, nS - 1 - np.argmax(exceed[:, ::-1], axis=1), 0)
+    return first, last, found
@@ -8,43 +8,82 @@
 import os
 import sys
 import glob
-import subprocess
+import re
+import shlex
 import shutil
+import asyncio
 import numpy as np
 import logging
 from avaframe.in3Utils import fileHandlerUtils as fU
 from avaframe.in3Utils import ascUtils as aU
+import avaframe.in2Trans.shpConversion as shpConv
 
 # create local logger
 # change log level in calling module to DEBUG to see log messages
 log = logging.getLogger(__name__)
 
 
-def execSamos(samosAT, cintFile, avaDir, fullOut=False, simName=''):
+# SamosAT output lines that are logged if the full output is not printed
+samosLogPattern = re.compile(r'BatchSamos|error')
+# buffer size of the SamosAT log files in bytes
+samosLogBuffer = 1 << 16
+
+
+async def _streamSamos(stream, logFile, fullOut):
+    """ Log the lines of a SamosAT output stream and save them to logFile """
+    while True:
+        line = await stream.readline()
+        if not line:
+            break
+        line = line.decode(errors='replace')
+        if logFile is not None:
+            logFile.write(line)
+        if fullOut or samosLogPattern.search(line):
+            log.info(line.rstrip())
+
+
+async def execSamosAsync(samosAT, cintFile, avaDir, fullOut=False, simName='', timeout=None):
     """ Execute compiled SamosAT file using cintFile to set configuration
-        and run options """
+        and run options
 
-    runCommand = samosAT + ' -offscreen ' + cintFile
+        stdout and stderr are streamed without blocking other SamosAT
+        processes and saved to Outputs/com1DFA/start<simName>.log if a
+        simName is given. If the run takes longer than timeout seconds the
+        process is killed and a TimeoutError is raised.
+    """
 
-    proc = subprocess.Popen(runCommand, shell=True, stdout=subprocess.PIPE,
-                            universal_newlines=True)
+    # no shell is used, keep backslashes of windows paths
+    runCommand = shlex.split(samosAT, posix=(os.name != 'nt')) + ['-offscreen', cintFile]
+    proc = await asyncio.create_subprocess_exec(*runCommand, stdout=asyncio.subprocess.PIPE,
+                                                stderr=asyncio.subprocess.PIPE)
 
     # initialise log file to save stoudt
+    logFile = None
     if simName != '':
-        f_log = open(os.path.join(avaDir, 'Outputs', 'com1DFA', 'start%s.log' % (simName)), 'w')
-    # FSO--- loop through output
-    for line in proc.stdout:
-        if simName != '':
-            f_log.write(line)
-        if fullOut:
-            log.info((line.rstrip()))
-        elif 'BatchSamos' in line:
-            log.info(line.rstrip())
-        elif 'error' in line:
-            log.info(line.rstrip())
+        logFile = open(os.path.join(avaDir, 'Outputs', 'com1DFA', 'start%s.log' % (simName)), 'w',
+                       buffering=samosLogBuffer)
+    try:
+        await asyncio.wait_for(asyncio.gather(_streamSamos(proc.stdout, logFile, fullOut),
+                                              _streamSamos(proc.stderr, logFile, fullOut),
+                                              proc.wait()), timeout)
+    except asyncio.TimeoutError:
+        raise TimeoutError('SamosAT run of %s exceeded the timeout of %s s' % (cintFile, timeout))
+    finally:
+        # kill the process if it is still running (timeout or cancelled)
+        if proc.returncode is None:
+            proc.kill()
+            await proc.wait()
+        if logFile is not None:
+            logFile.close()
 
-    # make process wait for previous process to finish
-    reVal = proc.wait()
+    return proc.returncode
+
+
+def execSamos(samosAT, cintFile, avaDir, fullOut=False, simName='', timeout=None):
+    """ Execute compiled SamosAT file and wait for it to finish
+        (see execSamosAsync) """
+
+    return asyncio.run(execSamosAsync(samosAT, cintFile, avaDir, fullOut, simName, timeout))
 
 
 def initialiseRun(avaDir, flagEnt, flagRes, inputf='shp'):
@@ -87,6 +126,14 @@ def initialiseRun(avaDir, flagEnt, flagRes, inputf='shp'):
     # Initialise DEM
     demFile = glob.glob(inputDir+os.sep+'*.asc')
 
+    # Check that the release, entrainment and resistance areas are on the DEM
+    if inputf != 'nxyz' and demFile:
+        header = aU.readASCheader(demFile[0])
+        for shpFile in relFiles + entFiles + resFiles:
+            if shpFile:
+                Areas = shpConv.SHP2Array(shpFile, os.path.basename(shpFile))
+                shpConv.checkExtent(Areas, header, 'Area of %s exceeds dem extent' % shpFile)
+
     # Initialise full experiment log file
     with open(os.path.join(workDir, 'ExpLog.txt'), 'w') as logFile:
         logFile.write("NoOfSimulation,SimulationRunName,Mu\n")
@@ -95,6 +142,148 @@ def initialiseRun(avaDir, flagEnt, flagRes, inputf='shp'):
     return demFile[0], relFiles, entFiles[0], resFiles[0]
 
 
+async def runSimStep(samosAT, cintFile, avaDir, fullOut, relName, simName='', timeout=None):
+    """ Run one SamosAT step of the simulations of release area relName and
+        raise a RuntimeError if SamosAT fails (see execSamosAsync) """
+
+    reVal = await execSamosAsync(samosAT, cintFile, avaDir, fullOut, simName, timeout)
+    if reVal != 0:
+        raise RuntimeError('SamosAT failed with exit code %d for release area %s (%s)' %
+                           (reVal, relName, os.path.basename(cintFile)))
+
+
+async def runSimJob(cfgGen, avaDir, dem, cellSize, ent, res, job):
+    """ Run the simulations of one release area in its own work directory
+
+        The SamosAT project, the cint files and the results of the release
+        area (job['rel']) are saved in job['jobDir'], so that several release
+        areas can be run at the same time (see gatherSimJobs).
+    """
+
+    samosAT = cfgGen['samosAT']
+    flagVarMu = cfgGen.getboolean('flagVarMu')
+    fullOut = cfgGen.getboolean('flagOut')
+    timeout = cfgGen.getfloat('timeout', fallback=0)
+    timeout = timeout if timeout > 0 else None
+    modPath = os.path.dirname(__file__)
+
+    # Set release areas and simulation name
+    rel = job['rel']
+    relName = job['relName']
+    simName = relName
+    countRel = job['countRel']
+    log.info('Release area: %s - perform simulations' % (relName))
+
+    # Isolated work directory of the release area
+    jobDir = job['jobDir']
+    if os.path.isdir(jobDir):
+        shutil.rmtree(jobDir)
+    os.makedirs(jobDir)
+    resDir = jobDir
+
+    # Initialise CreateProject cint file
+    templateFile = os.path.join(modPath, 'CreateProject.cint')
+    workFile = os.path.join(jobDir, 'CreateProject.cint')
+    projDir = os.path.join(jobDir, simName)
+    demName = os.path.splitext(os.path.basename(dem))[0]
+
+    # Set Parameters in cint file
+    copyReplace(templateFile, workFile, '##BASEPATH##', avaDir)
+    copyReplace(workFile, workFile, '##PROJECTDIR##', projDir)
+    copyReplace(workFile, workFile, '##DHMFILE##', dem)
+    copyReplace(workFile, workFile, '##DHMNAME##', demName)
+    copyReplace(workFile, workFile, '##CELLSIZE##', cellSize)
+    copyReplace(workFile, workFile, '##RELFILE##', rel)
+    copyReplace(workFile, workFile, '##RESFILE##', ent)
+    copyReplace(workFile, workFile, '##ENTFILE##', res)
+    # Setup Project
+    await runSimStep(samosAT, workFile, avaDir, fullOut, relName, timeout=timeout)
+
+    # Initialise CreateSimulations cint file and set parameters
+    templateFile = os.path.join(modPath, 'CreateSimulations.cint')
+    workFile = os.path.join(jobDir, 'CreateSimulations.cint')
+    copyReplace(templateFile, workFile, '##BASEPATH##', os.getcwd())
+    copyReplace(workFile, workFile, '##PROJECTDIR##', projDir)
+    copyReplace(workFile, workFile, '##BASESIMNAME##', simName)
+    await runSimStep(samosAT, workFile, avaDir, fullOut, relName, timeout=timeout)
+
+    # If mu shall be varied
+    if flagVarMu:
+        varFile = os.path.join(jobDir, simName+'_VarMu.txt')
+        varF = open(varFile, 'w')
+        # Important write Mu in correct sequence from small to big
+        varF.write('0.055\n')
+        varF.write('0.155\n')
+        varF.close()
+        templateFile = os.path.join(modPath, 'varyMuRunExport.cint')
+        workFile = os.path.join(jobDir, 'varyMuRunExport.cint')
+    else:
+        templateFile = os.path.join(modPath, '%s.cint' % (cfgGen['RunCint']))
+        workFile = os.path.join(jobDir, '%s.cint' % (cfgGen['RunCint']))
+    copyReplace(templateFile, workFile, '##BASEPATH##', os.getcwd())
+    copyReplace(workFile, workFile, '##PROJECTDIR##', projDir)
+    copyReplace(workFile, workFile, '##RESDIR##', resDir)
+    copyReplace(workFile, workFile, '##COUNTREL##', countRel)
+
+    await runSimStep(samosAT, workFile, avaDir, fullOut, relName, simName=relName, timeout=timeout)
+
+
+async def runSimJobs(cfgGen, avaDir, dem, cellSize, ent, res, jobs):
+    """ Run the simulation jobs (see runSimJob) with up to nCPU SamosAT
+        processes at once and report the progress """
+
+    nCPU = max(min(cfgGen.getint('nCPU', fallback=1), len(jobs)), 1)
+    # the mu variations of a release area are run within its job (varyMuRunExport.cint)
+    log.info('Running %d release areas with %d SamosAT processes at once' % (len(jobs), nCPU))
+    semaphore = asyncio.Semaphore(nCPU)
+    nDone = 0
+
+    async def runJob(job):
+        nonlocal nDone
+        async with semaphore:
+            await runSimJob(cfgGen, avaDir, dem, cellSize, ent, res, job)
+        nDone = nDone + 1
+        log.info('Finished release area %s (%d of %d)' % (job['relName'], nDone, len(jobs)))
+
+    # all jobs are run to the end, errors are reported afterwards
+    results = await asyncio.gather(*[runJob(job) for job in jobs], return_exceptions=True)
+    errors = [(job['relName'], result) for job, result in zip(jobs, results)
+              if isinstance(result, Exception)]
+    for relName, error in errors:
+        log.error('Simulations of release area %s failed: %s' % (relName, error))
+    if errors:
+        raise RuntimeError('Simulations failed for release areas: %s' %
+                           ', '.join(relName for relName, error in errors)) from errors[0][1]
+
+
+def gatherSimJobs(avaDir, jobs):
+    """ Collect the results of the simulation jobs (see runSimJob) in
+        Work/com1DFA as if the release areas were run one after the other:
+        the experiment logs are appended to ExpLog.txt in the order of the
+        jobs and the result directories are moved to FullOutput_mu_*
+    """
+
+    workDir = os.path.join(avaDir, 'Work', 'com1DFA')
+    with open(os.path.join(workDir, 'ExpLog.txt'), 'a') as logFile:
+        for job in jobs:
+            jobDir = job['jobDir']
+            jobLog = os.path.join(jobDir, 'ExpLog.txt')
+            if os.path.isfile(jobLog):
+                with open(jobLog, 'r') as jobLogFile:
+                    logFile.write(jobLogFile.read())
+            for resultDir in sorted(glob.glob(os.path.join(jobDir, 'FullOutput_mu_*'))):
+                outDir = os.path.join(workDir, os.path.basename(resultDir))
+                if not os.path.isdir(outDir):
+                    os.makedirs(outDir)
+                for item in os.listdir(resultDir):
+                    outItem = os.path.join(outDir, item)
+                    if os.path.isdir(outItem):
+                        shutil.rmtree(outItem)
+                    elif os.path.isfile(outItem):
+                        os.remove(outItem)
+                    shutil.move(os.path.join(resultDir, item), outItem)
+
+
 def copyReplace(origFile, workFile, searchString, replString):
     """ Modifiy cintFiles to be used to set simulation configuration"""
 
@@ -122,16 +311,11 @@ def runSamos(cfg, avaDir):
 
     # Setup configuration
     cfgGen = cfg['GENERAL']
-    samosAT = cfgGen['samosAT']
     flagEnt = cfgGen.getboolean('flagEnt')
     flagRes = cfgGen.getboolean('flagRes')
     flagVarMu = cfgGen.getboolean('flagVarMu')
     inputf = cfgGen['inputf']
-    fullOut = cfgGen.getboolean('flagOut')
     cfgAimec = cfg['AIMEC']
-    resDir = os.path.join(avaDir, 'Work', 'com1DFA')
-    # Get path of module
-    modPath = os.path.dirname(__file__)
 
     # Log chosen settings
     log.info('The chosen settings: entrainment - %s , resistance - %s ' % (flagEnt, flagRes))
@@ -146,76 +330,28 @@ def runSamos(cfg, avaDir):
     demData = aU.readASCheader(dem)
     cellSize = demData.cellsize
 
-    # Counter for release area loop
+    # One simulation job per release area, the simulations are numbered as
+    # if the release areas were run one after the other
     countRel = 0
-
-    # Loop through release areas
+    jobs = []
     for rel in rels:
+        job = {'rel': rel, 'countRel': countRel}
+        job['relName'] = os.path.splitext(os.path.basename(rel))[0]
+        job['jobDir'] = os.path.join(avaDir, 'Work', 'com1DFA', 'jobs', job['relName'])
+        jobs.append(job)
+        # Count total number of simulations
+        countRel = countRel + (3 if flagVarMu else 2)
+
+    # Run up to nCPU jobs (SamosAT processes) at once
+    asyncio.run(runSimJobs(cfgGen, avaDir, dem, cellSize, ent, res, jobs))
 
-        # Set release areas and simulation name
-        relName = os.path.splitext(os.path.basename(rel))[0]
-        simName = relName
-        log.info('Release area: %s - perform simulations' % (relName))
-
-        # Initialise CreateProject cint file
-        templateFile = os.path.join(modPath, 'CreateProject.cint')
-        workFile = os.path.join(avaDir, 'Work', 'com1DFA', 'CreateProject.cint')
-        projDir = os.path.join(avaDir, 'Work', 'com1DFA', simName)
-        demName = os.path.splitext(os.path.basename(dem))[0]
-
-        # Set Parameters in cint file
-        copyReplace(templateFile, workFile, '##BASEPATH##', avaDir)
-        copyReplace(workFile, workFile, '##PROJECTDIR##', projDir)
-        copyReplace(workFile, workFile, '##DHMFILE##', dem)
-        copyReplace(workFile, workFile, '##DHMNAME##', demName)
-        copyReplace(workFile, workFile, '##CELLSIZE##', cellSize)
-        copyReplace(workFile, workFile, '##RELFILE##', rel)
-        copyReplace(workFile, workFile, '##RESFILE##', ent)
-        copyReplace(workFile, workFile, '##ENTFILE##', res)
-        # Setup Project
-        execSamos(samosAT, workFile, avaDir, fullOut)
-
-        # Initialise CreateSimulations cint file and set parameters
-        templateFile = os.path.join(modPath, 'CreateSimulations.cint')
-        workFile = os.path.join(avaDir, 'Work', 'com1DFA', 'CreateSimulations.cint')
-        copyReplace(templateFile, workFile, '##BASEPATH##', os.getcwd())
-        copyReplace(workFile, workFile, '##PROJECTDIR##', projDir)
-        copyReplace(workFile, workFile, '##BASESIMNAME##', simName)
-        execSamos(samosAT, workFile, avaDir, fullOut)
-
-        # If mu shall be varied
-        if flagVarMu:
-            varFile = os.path.join(avaDir, 'Work' ,'com1DFA', simName+'_VarMu.txt')
-            varF = open(varFile, 'w')
-            # Important write Mu in correct sequence from small to big
-            varF.write('0.055\n')
-            varF.write('0.155\n')
-            varF.close()
-            templateFile = os.path.join(modPath, 'varyMuRunExport.cint')
-            workFile = os.path.join(avaDir, 'Work', 'com1DFA', 'varyMuRunExport.cint')
-            copyReplace(templateFile, workFile, '##BASEPATH##', os.getcwd())
-            copyReplace(workFile, workFile, '##PROJECTDIR##', projDir)
-            copyReplace(workFile, workFile, '##RESDIR##', resDir)
-            copyReplace(workFile, workFile, '##COUNTREL##', countRel)
-            # Count total number of simulations
-            countRel = countRel + 3
-
-        else:
-            templateFile = os.path.join(modPath, '%s.cint' % (cfgGen['RunCint']))
-            workFile = os.path.join(avaDir, 'Work', 'com1DFA', '%s.cint' % (cfgGen['RunCint']))
-            copyReplace(templateFile, workFile, '##BASEPATH##', os.getcwd())
-            copyReplace(workFile, workFile, '##PROJECTDIR##', projDir)
-            copyReplace(workFile, workFile, '##RESDIR##', resDir)
-            copyReplace(workFile, workFile, '##COUNTREL##', countRel)
-            # Count total number of simulations
-            countRel = countRel + 2
-
-        execSamos(samosAT, workFile, avaDir, fullOut, relName)
+    # Collect the results of the jobs in Work/com1DFA
+    gatherSimJobs(avaDir, jobs)
 
     log.info('Avalanche Simulations performed')
 
     # Setup input from com1DFA and exort to Outputs/com1DFA
-    fU.exportcom1DFAOutput(avaDir)
+    fU.exportcom1DFAOutput(avaDir, cfgGen)
 
 
     log.info('Exported results to Outputs/com1DFA')
@@ -6,9 +6,12 @@
 
 import os
 import glob
-import pickle
 import logging
+import warnings
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
 import numpy as np
+import scipy.spatial
 import matplotlib.pyplot as plt
 
 # Local imports
@@ -62,24 +65,36 @@ def setEqParameters(smallAva, customParam):
     return eqParameters
 
 
-def com2ABMain(dem, Avapath, splitPoint, saveOutPath, cfgsetup):
+def com2ABMain(dem, Avapath, splitPoint, cfgsetup, *args):
     """ Loops on the given Avapath and runs com2AB to compute AlpahBeta model
     Inputs : dem header and rater (as np array),
             Avapath and Split points .shp file,
-            optional output save path,
             avalanche type,
             reamplind lenght for the Avapath
-    Outputs : writes raw results to saveOutPath
+    Outputs : resAB: results of all paths as one table (see com2ABBatch)
+    The former call com2ABMain(dem, Avapath, splitPoint, saveOutPath, cfgsetup)
+    is deprecated: saveOutPath is ignored, nothing is written to it.
     """
+    if args:
+        warnings.warn('com2ABMain(dem, Avapath, splitPoint, saveOutPath, cfgsetup) is deprecated, '
+                      'use com2ABMain(dem, Avapath, splitPoint, cfgsetup) and pass the returned '
+                      'results to outAB.writeABpostOut', DeprecationWarning, stacklevel=2)
+        cfgsetup = args[0]
     smallAva = cfgsetup.getboolean('smallAva')
     customParam = cfgsetup.getboolean('customParam')
     # customParam = str(customParam or None)
     distance = float(cfgsetup['distance'])
+    equalSpacing = cfgsetup.getboolean('equalSpacing', fallback=False)
+
+    if cfgsetup.getboolean('batch', fallback=False):
+        eqParams = setEqParameters(smallAva, customParam)
+        return com2ABBatch(dem, Avapath, splitPoint, eqParams, distance, equalSpacing=equalSpacing)
 
     NameAva = Avapath['Name']
     StartAva = Avapath['Start']
     LengthAva = Avapath['Length']
 
+    avapaths = []
     for i in range(len(NameAva)):
         name = NameAva[i]
         start = StartAva[i]
@@ -88,33 +103,264 @@ def com2ABMain(dem, Avapath, splitPoint, saveOutPath, cfgsetup):
         avapath['x'] = Avapath['x'][int(start):int(end)]
         avapath['y'] = Avapath['y'][int(start):int(end)]
         avapath['Name'] = name
-        com2AB(dem, avapath, splitPoint, saveOutPath,
-               smallAva, customParam, distance)
+        avapaths.append(avapath)
+
+    eqParams = setEqParameters(smallAva, customParam)
+    nCPU = min(cfgsetup.getint('nCPU', fallback=1), len(avapaths))
+    if nCPU > 1:
+        # paths computed in parallel, results collected in the order of the paths
+        eqOuts = list(com2ABParallel(dem, avapaths, splitPoint, eqParams, distance, equalSpacing, nCPU))
+    else:
+        eqOuts = [com2ABPath(dem, avapath, splitPoint, eqParams, distance, equalSpacing=equalSpacing)
+                  for avapath in avapaths]
 
+    return makeABtable(eqOuts, eqParams)
 
-def com2AB(dem, avapath, splitPoint, OutPath,
-           smallAva, customParam, distance):
+
+def com2ABBatch(dem, Avapath, splitPoint, eqParams, distance, equalSpacing=False):
+    """ Computes the AlphaBeta model for all paths of Avapath at once
+    The profiles of all paths are packed one after the other (as the paths in
+    Avapath), the DEM is read for all profiles in one projection and the
+    quadratic fit and the beta point search are done for all profiles
+    together. The results are the same as com2AB (up to the round off of
+    the quadratic fit).
+    Inputs : dem header and rater (as np array),
+            Avapath (as read from the .shp file),
+            Split points,
+            eqParams (see setEqParameters),
+            resampling lenght for the Avapath,
+            resampling at equal arc length (see geoTrans.resampleLine)
+    Outputs : resAB: dictionary (table with one row per path) with Name,
+            Start and Length of each profile in the packed profile
+            coordinates x, y, z, s, and for each path indSplit, CuSplit,
+            ids10Point (indices in the profile), polyCoeffs (quadratic fit),
+            beta, alpha, alphaSD, as well as SDs and eqParams
+    """
+    abVersion = '4.1'
+    log.info('Running Alpha Beta %s on %d paths', abVersion, len(Avapath['Name']))
+    nPaths = len(Avapath['Name'])
+
+    # resample the paths and pack the profiles
+    xList = []
+    yList = []
+    sList = []
+    for i in range(nPaths):
+        start = int(Avapath['Start'][i])
+        end = start + int(Avapath['Length'][i])
+        x, y, s = geoTrans.resampleLine(Avapath['x'][start:end], Avapath['y'][start:end],
+                                        distance=distance, equalSpacing=equalSpacing)
+        xList.append(x)
+        yList.append(y)
+        sList.append(s)
+    length = np.array([len(s) for s in sList])
+    # the profiles are packed, a profile of one point would use the next one
+    if np.any(length < 2):
+        names = [Avapath['Name'][i] for i in np.flatnonzero(length < 2)]
+        raise ValueError('Avalanche paths need at least two points: %s' % ', '.join(names))
+    start = np.concatenate(([0], np.cumsum(length)[:-1]))
+    end = start + length - 1
+    x = np.concatenate(xList)
+    y = np.concatenate(yList)
+    s = np.concatenate(sList)
+    # path of each profile point
+    iPath = np.repeat(np.arange(nPaths), length)
+
+    # make the profiles (one projection for all paths)
+    Points = {'x': x, 'y': y}
+    Points, _, _ = geoTrans.projectOnRasterVect(dem, Points)
+    z = Points['z']
+
+    # project split point on the profiles: profile point closest to any
+    # split point (as geoTrans.findSplitPoint), with one nearest neighbour
+    # query of all profile points
+    splitTree = scipy.spatial.cKDTree(np.column_stack((splitPoint['x'], splitPoint['y'])))
+    dist, _ = splitTree.query(np.column_stack((x, y)))
+    isMin = dist == np.minimum.reduceat(dist, start)[iPath]
+    _, first = np.unique(iPath[isMin], return_index=True)
+    indSplit = np.flatnonzero(isMin)[first] - start
+
+    # profiles go from top to bottom (see geoTrans.checkProfile)
+    flip = z[end] > z[start]
+    if np.any(flip):
+        log.info('%d profiles reversed' % np.count_nonzero(flip))
+        flipPoint = flip[iPath]
+        ind = np.arange(len(s))
+        ind[flipPoint] = (start + end)[iPath][flipPoint] - ind[flipPoint]
+        x = x[ind]
+        y = y[ind]
+        z = z[ind]
+        s = np.where(flipPoint, s[end][iPath] - s[ind], s)
+        indSplit[flip] = length[flip] - indSplit[flip] - 1
+    CuSplit = s[start + indSplit]
+
+    # find the beta point: first point under 10° (see geoTrans.prepareAngleProfile)
+    betaValue = 10
+    deltaInd = np.maximum(np.floor(30/(s[start+1] - s[start])).astype(int), 1)
+    ds = np.abs(np.diff(s, prepend=s[0]))
+    dz = np.abs(np.diff(z, prepend=z[0]))
+    ds[start] = 0.0
+    dz[start] = 0.0
+    angle = np.rad2deg(np.arctan2(dz, ds))
+    below = (angle < betaValue) & (angle >= 0.0) & (s > CuSplit[iPath])
+    below[start] = False
+    ids10Point = geoTrans.findAngleProfileBatch(below, iPath, deltaInd, nPaths,
+                                                names=Avapath['Name']) - start
+
+    # quadratic fit of all profiles
+    polyCoeffs = polyfit2Batch(s, z, iPath, nPaths)
+    zFit = (polyCoeffs[iPath, 0]*s + polyCoeffs[iPath, 1])*s + polyCoeffs[iPath, 2]
+    # Get H0: max - min for parabola
+    H0 = np.maximum.reduceat(zFit, start) - np.minimum.reduceat(zFit, start)
+    # get beta
+    dzBeta = z[start] - z[start + ids10Point]
+    beta = np.rad2deg(np.arctan2(dzBeta, s[start + ids10Point]))
+    # get Alpha
+    k1 = eqParams['k1']
+    k2 = eqParams['k2']
+    k3 = eqParams['k3']
+    k4 = eqParams['k4']
+    SD = eqParams['SD']
+    alpha = k1 * beta + k2 * (2 * polyCoeffs[:, 0]) + k3 * H0 + k4
+    # get Alpha standard deviations
+    SDs = [SD, -1*SD, -2*SD]
+    alphaSD = alpha[:, np.newaxis] + SDs
+
+    resAB = {}
+    resAB['Name'] = list(Avapath['Name'])
+    resAB['Start'] = start
+    resAB['Length'] = length
+    resAB['x'] = x
+    resAB['y'] = y
+    resAB['z'] = z
+    resAB['s'] = s
+    resAB['indSplit'] = indSplit
+    resAB['CuSplit'] = CuSplit
+    resAB['ids10Point'] = ids10Point
+    resAB['polyCoeffs'] = polyCoeffs
+    resAB['beta'] = beta
+    resAB['alpha'] = alpha
+    resAB['SDs'] = SDs
+    resAB['alphaSD'] = alphaSD
+    resAB['eqParams'] = eqParams
+    return resAB
+
+
+def polyfit2Batch(s, z, iPath, nPaths):
+    """ Least squares fit of a polynom of degree 2 for each path
+    (like np.polyfit(s, z, 2) per path) using the normal equations with s
+    scaled to [0, 1] per path
+    Inputs : packed profile coordinates s and z,
+            path of each point,
+            number of paths
+    Outputs : coefficients of each path (highest power first)
+    """
+    sMax = np.zeros(nPaths)
+    np.maximum.at(sMax, iPath, np.abs(s))
+    sMax[sMax == 0] = 1
+    t = s / sMax[iPath]
+    # sums of t**k (k = 0 to 4) and of z*t**k (k = 0 to 2) per path
+    tPow = np.stack([t**k for k in range(5)])
+    sumT = np.stack([np.bincount(iPath, weights=tPow[k], minlength=nPaths) for k in range(5)], axis=1)
+    sumZ = np.stack([np.bincount(iPath, weights=z*tPow[k], minlength=nPaths) for k in range(3)], axis=1)
+    # normal equations for the coefficients of t**2, t and 1
+    lhs = np.stack([sumT[:, 4-i-j] for i in range(3) for j in range(3)], axis=1).reshape(nPaths, 3, 3)
+    rhs = np.stack([sumZ[:, 2-i] for i in range(3)], axis=1)
+    coeffs = np.linalg.solve(lhs, rhs[:, :, np.newaxis])[:, :, 0]
+    # back to s
+    coeffs[:, 0] = coeffs[:, 0] / sMax**2
+    coeffs[:, 1] = coeffs[:, 1] / sMax
+    return coeffs
+
+
+def makeABtable(eqOuts, eqParams):
+    """ Pack the results of com2ABPath (eqOut) of several paths in one table
+    (as returned by com2ABBatch) """
+    length = np.array([len(eqOut['s']) for eqOut in eqOuts], dtype=int)
+    resAB = {}
+    resAB['Name'] = [eqOut['Name'] for eqOut in eqOuts]
+    resAB['Start'] = np.concatenate(([0], np.cumsum(length)[:-1])).astype(int)
+    resAB['Length'] = length
+    for key in ['x', 'y', 'z', 's']:
+        resAB[key] = np.concatenate([eqOut[key] for eqOut in eqOuts])
+    for key in ['indSplit', 'ids10Point']:
+        resAB[key] = np.array([eqOut[key] for eqOut in eqOuts], dtype=int)
+    for key in ['CuSplit', 'beta', 'alpha']:
+        resAB[key] = np.array([eqOut[key] for eqOut in eqOuts], dtype=float)
+    # np.poly1d drops leading zero coefficients
+    polyCoeffs = np.zeros((len(eqOuts), 3))
+    for i, eqOut in enumerate(eqOuts):
+        coeffs = eqOut['poly'].coeffs
+        polyCoeffs[i, 3-len(coeffs):] = coeffs
+    resAB['polyCoeffs'] = polyCoeffs
+    resAB['SDs'] = [eqParams['SD'], -1*eqParams['SD'], -2*eqParams['SD']]
+    resAB['alphaSD'] = np.array([eqOut['alphaSD'] for eqOut in eqOuts], dtype=float).reshape(-1, 3)
+    resAB['eqParams'] = eqParams
+    return resAB
+
+
+def getABpath(resAB, i):
+    """ Get the results of path i from the table of com2ABBatch in the form
+    of the results of com2ABPath (eqOut) """
+    start = resAB['Start'][i]
+    end = start + resAB['Length'][i]
+    eqOut = {}
+    eqOut['Name'] = resAB['Name'][i]
+    for key in ['x', 'y', 'z', 's']:
+        eqOut[key] = resAB[key][start:end]
+    for key in ['indSplit', 'CuSplit', 'ids10Point', 'beta', 'alpha', 'alphaSD']:
+        eqOut[key] = resAB[key][i]
+    eqOut['poly'] = np.poly1d(resAB['polyCoeffs'][i])
+    eqOut['SDs'] = resAB['SDs']
+    return eqOut
+
+
+def com2AB(dem, avapath, splitPoint, smallAva, customParam, distance, *args, equalSpacing=False):
     """ Computes the AlphaBeta model given an input raster (of the dem),
     an avalanche path and split points
     Inputs : dem header and rater (as np array),
             single avapath as np array,
             Split points as np array,
-            output save path,
             avalanche type,
-            resamplind lenght for the Avapath
-    Outputs : writes raw results to OutPath
+            resamplind lenght for the Avapath,
+            resampling at equal arc length (see geoTrans.resampleLine)
+    Outputs : eqParams (see setEqParameters) and eqOut (see com2ABPath)
+    The former call com2AB(dem, avapath, splitPoint, OutPath, smallAva,
+    customParam, distance) is deprecated: OutPath is ignored, nothing is
+    written to it.
+    """
+    if len(args) > 1:
+        raise TypeError('com2AB() takes 6 positional arguments (7 in the deprecated form with '
+                        'OutPath) but %d were given' % (6 + len(args)))
+    if args:
+        warnings.warn('com2AB(dem, avapath, splitPoint, OutPath, smallAva, customParam, distance) is '
+                      'deprecated, use com2AB(dem, avapath, splitPoint, smallAva, customParam, distance), '
+                      'the results are returned', DeprecationWarning, stacklevel=2)
+        smallAva, customParam, distance = customParam, distance, args[0]
+    eqParams = setEqParameters(smallAva, customParam)
+    eqOut = com2ABPath(dem, avapath, splitPoint, eqParams, distance, equalSpacing=equalSpacing)
+    return eqParams, eqOut
+
+
+def com2ABPath(dem, avapath, splitPoint, eqParams, distance, equalSpacing=False):
+    """ Computes the AlphaBeta model of one avalanche path
+    Inputs : dem header and rater (as np array),
+            single avapath as np array,
+            Split points as np array,
+            eqParams (see setEqParameters),
+            resamplind lenght for the Avapath,
+            resampling at equal arc length (see geoTrans.resampleLine)
+    Outputs : eqOut: profile and alpha beta results of the path
     """
     name = avapath['Name']
     abVersion = '4.1'
     log.info('Running Alpha Beta %s on: %s ', abVersion, name)
-    eqParams = setEqParameters(smallAva, customParam)
 
     # TODO: make rest work with dict
 
     # read inputs, ressample ava path
     # make pofile and project split point on path
     AvaProfile, projSplitPoint = geoTrans.prepareLine(
-        dem, avapath, distance, splitPoint)
+        dem, avapath, distance, splitPoint, equalSpacing=equalSpacing)
 
     # Sanity check if first element of AvaProfile[3,:]
     # (i.e z component) is highest:
@@ -124,14 +370,54 @@ def com2AB(dem, avapath, splitPoint, OutPath,
     AvaProfile['indSplit'] = projSplitPoint['indSplit']  # index of split point
 
     eqOut = calcAB(AvaProfile, eqParams)
-    savename = name + '_com2AB_eqparam.pickle'
-    saveFile = os.path.join(OutPath, savename)
-    with open(saveFile, 'wb') as handle:
-        pickle.dump(eqParams, handle, protocol=pickle.HIGHEST_PROTOCOL)
-    savename = name + '_com2AB_eqout.pickle'
-    saveFile = os.path.join(OutPath, savename)
-    with open(saveFile, 'wb') as handle:
-        pickle.dump(eqOut, handle, protocol=pickle.HIGHEST_PROTOCOL)
+    return eqOut
+
+
+def com2ABParallel(dem, avapaths, splitPoint, eqParams, distance, equalSpacing, nCPU):
+    """ Computes the AlphaBeta model of the avalanche paths with a pool of
+    nCPU processes
+    The DEM raster is shared with the processes through shared memory instead
+    of being sent with every path. The results (eqOut, see com2ABPath) are
+    yielded in the order of avapaths.
+    """
+    rasterData = np.ascontiguousarray(dem['rasterData'])
+    shm = shared_memory.SharedMemory(create=True, size=rasterData.nbytes)
+    try:
+        np.ndarray(rasterData.shape, dtype=rasterData.dtype, buffer=shm.buf)[:] = rasterData
+        # send the paths in chunks (a few per process) to limit the communication
+        chunksize = max(1, len(avapaths) // (4 * nCPU))
+        with ProcessPoolExecutor(max_workers=nCPU, initializer=_initABWorker,
+                                 initargs=(shm.name, rasterData.shape, rasterData.dtype.str,
+                                           dem['header'], splitPoint, eqParams, distance,
+                                           equalSpacing)) as executor:
+            for eqOut in executor.map(_ABWorker, avapaths, chunksize=chunksize):
+                yield eqOut
+    finally:
+        shm.close()
+        shm.unlink()
+
+
+# DEM and settings of a worker process of com2ABParallel
+_workerData = {}
+
+
+def _initABWorker(shmName, shape, dtype, header, splitPoint, eqParams, distance, equalSpacing):
+    """ Attach a worker process to the shared DEM """
+    # the shared memory is owned (and unlinked) by the parent process
+    shm = shared_memory.SharedMemory(name=shmName, create=False)
+    _workerData['shm'] = shm
+    _workerData['dem'] = {'header': header,
+                          'rasterData': np.ndarray(shape, dtype=dtype, buffer=shm.buf)}
+    _workerData['splitPoint'] = splitPoint
+    _workerData['eqParams'] = eqParams
+    _workerData['distance'] = distance
+    _workerData['equalSpacing'] = equalSpacing
+
+
+def _ABWorker(avapath):
+    """ Compute one avalanche path in a worker process """
+    return com2ABPath(_workerData['dem'], avapath, _workerData['splitPoint'], _workerData['eqParams'],
+                      _workerData['distance'], equalSpacing=_workerData['equalSpacing'])
 
 
 def readABinputs(cfgAva):
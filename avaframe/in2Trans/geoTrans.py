@@ -6,6 +6,9 @@
 
 import math
 import numpy as np
+import scipy as sp
+import scipy.sparse
+import scipy.spatial
 import copy
 import logging
 
@@ -14,166 +17,276 @@ import logging
 log = logging.getLogger(__name__)
 
 
-def projectOnRaster(dem, Points):
+def projectOnRaster(dem, Points, interp='bilinear'):
     """ Projects the points Points on Raster using a bilinear interpolation
-    and returns the z coord
+    and returns the z coord (see projectOnRasterVect)
     Input :
     Points: list of points (x,y) 2 rows as many columns as Points
     Output:
     PointsZ: list of points (x,y,z) 3 rows as many columns as Points
+    """
+    Points, _, _ = projectOnRasterVect(dem, Points, interp=interp)
+    return Points
+
+
+def _cubicWeights(t):
+    """ Weights of the cells -1, 0, 1 and 2 for cubic convolution (Keys, a = -0.5)
+    at the position t in [0, 1) of the cell """
+    t2 = t*t
+    t3 = t2*t
+    return [-0.5*t3 + t2 - 0.5*t, 1.5*t3 - 2.5*t2 + 1, -1.5*t3 + 2*t2 + 0.5*t, 0.5*t3 - 0.5*t2]
+
 
-    TODO: test
+def _getInterpWeights(dem, Points, interp, dtype, outOfBounds='nan'):
+    """ Find the raster cells and the interpolation weights of the points
+
+    The weights are separable: the value of a point is the sum over the cells
+    (rows[j], cols[i]) of rasterData[rows[j], cols[i]]*wx[i]*wy[j].
+    Input : dem (raster or raster window), Points (x, y), interp ('nearest',
+    'bilinear' or 'bicubic'), the dtype of the interpolation and the out of
+    bounds policy ('nan', 'clip' or 'raise', see projectOnRasterVect)
+    Output: mask of the points inside the raster, rows and wy (number of
+    points inside x number of rows of the stencil), cols and wx (same for the
+    columns), rows and cols are indices in rasterData, total number of points
+    and number of points out of bounds
     """
-    header = dem['header']
-    rasterdata = dem['rasterData']
+    if interp not in ['nearest', 'bilinear', 'bicubic']:
+        raise ValueError('Unknown interpolation method %s - options are nearest, bilinear or bicubic'
+                         % interp)
+    if outOfBounds not in ['nan', 'clip', 'raise']:
+        raise ValueError('Unknown out of bounds policy %s - options are nan, clip or raise' % outOfBounds)
+    # coordinates are always computed in the full raster
+    header = dem.get('parentHeader', dem['header'])
+    rowOffset, colOffset = dem.get('windowOffset', (0, 0))
+    nrowWin, ncolWin = np.shape(dem['rasterData'])
     xllcorner = header.xllcorner
     yllcorner = header.yllcorner
     cellsize = header.cellsize
-    xcoor = Points['x']
-    ycoor = Points['y']
-    zcoor = np.array([])
-    for i in range(np.shape(xcoor)[0]):
-        Lx = (xcoor[i] - xllcorner) / cellsize
-        Ly = (ycoor[i] - yllcorner) / cellsize
-        Lx0 = int(np.floor(Lx))
-        try:
-            Ly0 = int(np.floor(Ly))
-            Lx1 = int(np.floor(Lx)) + 1
-            Ly1 = int(np.floor(Ly)) + 1
-            dx = Lx - Lx0
-            dy = Ly - Ly0
-            try:
-                f11 = rasterdata[Ly0][Lx0]
-                f12 = rasterdata[Ly1][Lx0]
-                f21 = rasterdata[Ly0][Lx1]
-                f22 = rasterdata[Ly1][Lx1]
-                # using bilinear interpolation on the cell
-                value = f11*(1-dx)*(1-dy) + f21*dx*(1-dy) + f12*(1-dx)*dy + f22*dx*dy
-            except IndexError:
-                value = np.NaN
-        except ValueError :
-            value = np.NaN
-
-        zcoor = np.append(zcoor, value)
 
-    Points['z'] = zcoor
-    return Points
+    # find coordinates in normalized ref (origin (0,0) and cellsize 1)
+    # relative to the lower left cell of rasterData
+    Lx = (Points['x'] - xllcorner) / cellsize - colOffset
+    Ly = (Points['y'] - yllcorner) / cellsize - rowOffset
+    if outOfBounds == 'clip':
+        Lx = np.clip(Lx, 0, ncolWin-1)
+        Ly = np.clip(Ly, 0, nrowWin-1)
+
+    # find out of bound indexes
+    mask = ~np.isnan(Lx+Ly)
+    if outOfBounds != 'clip':
+        mask[mask] = ((Lx[mask] >= 0) & (Lx[mask] < (ncolWin-1)) &
+                      (Ly[mask] >= 0) & (Ly[mask] < (nrowWin-1)))
+    itot = np.size(mask)
+    ioob = itot - np.count_nonzero(mask)
+    if outOfBounds == 'raise' and ioob > 0:
+        raise ValueError('%d of %d points are out of the raster bounds' % (ioob, itot))
+
+    # find coordinates of the lower left corner of the cell on the raster
+    Lx = Lx[mask]
+    Ly = Ly[mask]
+    # (points on the upper or right border, only when clipping, are in the last cell)
+    Lx0 = np.minimum(np.floor(Lx).astype('int'), ncolWin-2)
+    Ly0 = np.minimum(np.floor(Ly).astype('int'), nrowWin-2)
+    dx = Lx - Lx0
+    dy = Ly - Ly0
+    if interp == 'nearest':
+        dx = np.round(dx)
+        dy = np.round(dy)
+    dx = dx.astype(dtype)
+    dy = dy.astype(dtype)
+
+    if interp == 'bicubic':
+        # 4 x 4 cells, cells outside of rasterData are replaced by the border cells
+        stencil = np.arange(-1, 3)
+        cols = np.clip(Lx0[:, np.newaxis] + stencil, 0, ncolWin-1)
+        rows = np.clip(Ly0[:, np.newaxis] + stencil, 0, nrowWin-1)
+        wx = np.stack(_cubicWeights(dx), axis=1)
+        wy = np.stack(_cubicWeights(dy), axis=1)
+    else:
+        cols = np.stack((Lx0, Lx0+1), axis=1)
+        rows = np.stack((Ly0, Ly0+1), axis=1)
+        wx = np.stack((1-dx, dx), axis=1)
+        wy = np.stack((1-dy, dy), axis=1)
+
+    return mask, rows, wy, cols, wx, itot, ioob
 
 
-def projectOnRasterVect(dem, Points, interp='bilinear'):
+def projectOnRasterVect(dem, Points, interp='bilinear', outOfBounds='nan', nanPolicy='propagate'):
     """
-    Vectorized version of projectOnRaster
-    Projects the points Points on Raster using a bilinear interpolation
-    and returns the z coord
+    Vectorized projection of points on a raster
+    Projects the points Points on Raster using a nearest, bilinear or bicubic
+    (cubic convolution) interpolation and returns the z coord
+    The raster can also be a window of a raster (see ascUtils.getRasterWindow),
+    then points outside of the window are treated as out of bounds (for
+    bicubic, the border cells of the window are used outside of the window).
     Input :
     Points: list of points (x,y) 2 rows as many columns as Points
+    interp: 'nearest', 'bilinear' or 'bicubic'
+    outOfBounds: points out of the raster get nan ('nan'), the value at the
+    closest point of the raster ('clip') or raise a ValueError ('raise')
+    nanPolicy: a nan value in the cells used for a point gives nan
+    ('propagate') or is left out, the weights of the other cells are
+    normalized ('ignore', nan if all cells are nan)
     Output:
     PointsZ: list of points (x,y,z) 3 rows as many columns as Points
-
-    TODO: test
+    itot, ioob: total number of points and number of points out of bounds
     """
-    header = dem['header']
+    if nanPolicy not in ['propagate', 'ignore']:
+        raise ValueError('Unknown nan policy %s - options are propagate or ignore' % nanPolicy)
     rasterdata = dem['rasterData']
-    ncol = header.ncols
-    nrow = header.nrows
-    xllcorner = header.xllcorner
-    yllcorner = header.yllcorner
-    cellsize = header.cellsize
-    xcoor = Points['x']
-    ycoor = Points['y']
-    zcoor = np.array([])
-
-    # initialize outputs
-    zcoor = np.ones((np.shape(xcoor)))*np.NaN
-    dx = np.ones((np.shape(xcoor)))*np.NaN
-    dy = np.ones((np.shape(xcoor)))*np.NaN
-    f11 = np.ones((np.shape(xcoor)))*np.NaN
-    f12 = np.ones((np.shape(xcoor)))*np.NaN
-    f21 = np.ones((np.shape(xcoor)))*np.NaN
-    f22 = np.ones((np.shape(xcoor)))*np.NaN
 
-    # find coordinates in normalized ref (origin (0,0) and cellsize 1)
-    Lxx = (xcoor - xllcorner) / cellsize
-    Lyy = (ycoor - yllcorner) / cellsize
-    Lx = copy.deepcopy(Lxx)
-    Ly = copy.deepcopy(Lyy)
-
-    # find out of bound indexes
-    Lx[np.where((Lxx < 0))] = np.NaN
-    Ly[np.where((Lxx < 0))] = np.NaN
-    Lx[np.where(Lxx >= (ncol-1))] = np.NaN
-    Ly[np.where(Lxx >= (ncol-1))] = np.NaN
-    Lx[np.where(Lyy < 0)] = np.NaN
-    Ly[np.where(Lyy < 0)] = np.NaN
-    Lx[np.where(Lyy >= (nrow-1))] = np.NaN
-    Ly[np.where(Lyy >= (nrow-1))] = np.NaN
-
-    # find index of index of not nan value
-    mask = ~np.isnan(Lx+Ly)
-    maskInd = np.argwhere(~np.isnan(Lx+Ly))[:, 0]
-    itot = len(Lx)
-    iinb = len(maskInd)
-    ioob = itot - iinb
-
-    # find coordinates of the 4 nearest cornes on the raster
-    Lx0 = np.floor(Lx).astype('int')
-    Ly0 = np.floor(Ly).astype('int')
-    Lx1 = Lx0 + 1
-    Ly1 = Ly0 + 1
-    # prepare for bilinear interpolation (do not take out of bound into account)
-    if interp == 'nearest':
-        dx[mask] = np.round(Lx[mask] - Lx0[mask])
-        dy[mask] = np.round(Ly[mask] - Ly0[mask])
-    elif interp == 'bilinear':
-        dx[mask] = Lx[mask] - Lx0[mask]
-        dy[mask] = Ly[mask] - Ly0[mask]
-
-    f11[mask] = rasterdata[Ly0[mask], Lx0[mask]]
-    f12[mask] = rasterdata[Ly1[mask], Lx0[mask]]
-    f21[mask] = rasterdata[Ly0[mask], Lx1[mask]]
-    f22[mask] = rasterdata[Ly1[mask], Lx1[mask]]
-    # using bilinear interpolation on the cell
-    zcoor = f11*(1-dx)*(1-dy) + f21*dx*(1-dy) + f12*(1-dx)*dy + f22*dx*dy
+    # interpolation in float32 for float32 rasters, otherwise float64
+    dtype = np.float32 if rasterdata.dtype == np.float32 else np.float64
+    mask, rows, wy, cols, wx, itot, ioob = _getInterpWeights(dem, Points, interp, dtype,
+                                                            outOfBounds=outOfBounds)
+    zcoor = np.full(np.shape(Points['x']), np.NaN, dtype=dtype)
+    # values of the cells (points inside x rows x columns)
+    f = rasterdata[rows[:, :, np.newaxis], cols[:, np.newaxis, :]].astype(dtype, copy=False)
+    if nanPolicy == 'propagate':
+        # sum in the order f11*(1-dx)*(1-dy) + f21*dx*(1-dy) + f12*(1-dx)*dy + f22*dx*dy
+        z = np.zeros(np.shape(f)[0], dtype=dtype)
+        for j in range(np.shape(rows)[1]):
+            for i in range(np.shape(cols)[1]):
+                z = z + f[:, j, i]*wx[:, i]*wy[:, j]
+    else:
+        w = wy[:, :, np.newaxis]*wx[:, np.newaxis, :]
+        w = np.where(np.isnan(f), 0, w)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            z = np.nansum(f*w, axis=(1, 2)) / np.sum(w, axis=(1, 2))
+    zcoor[mask] = z
 
     Points['z'] = zcoor
     return Points, itot, ioob
 
 
-def prepareLine(dem, avapath, distance=10, Point=None):
+def makeInterpOperator(dem, Points, interp='bilinear'):
+    """
+    Interpolation of a raster on points as sparse matrix
+    The interpolation weights only depend on the raster header (or window) and
+    on the points, so they are computed once and applied to any raster with
+    the same header (see applyInterpOperator), which gives the same values as
+    projectOnRasterVect (up to round off).
+    Input :
+    dem: raster or raster window (only the header and the shape and dtype of
+    rasterData are used)
+    Points: points (x,y)
+    interp: 'nearest', 'bilinear' or 'bicubic'
+    Output:
+    operator: dictionary with the sparse matrix (number of points x number of
+    raster cells), the mask of the points inside the raster, the raster shape
+    and the total number and number of out of bound points (itot, ioob)
+    """
+    rasterShape = np.shape(dem['rasterData'])
+    dtype = np.float32 if dem['rasterData'].dtype == np.float32 else np.float64
+    mask, rows, wy, cols, wx, itot, ioob = _getInterpWeights(dem, Points, interp, dtype)
+
+    # one row of weights per point inside the raster (in the same order as
+    # in projectOnRasterVect), points out of bounds have an empty row.
+    # Zero weights are kept, so that nan values of the cells propagate
+    ncolWin = rasterShape[1]
+    nCells = np.shape(rows)[1]*np.shape(cols)[1]
+    weights = (wy[:, :, np.newaxis]*wx[:, np.newaxis, :]).reshape(-1, nCells)
+    cells = (rows[:, :, np.newaxis]*ncolWin + cols[:, np.newaxis, :]).reshape(-1, nCells)
+    indptr = np.concatenate(([0], np.cumsum(nCells*mask.ravel())))
+    matrix = sp.sparse.csr_matrix((weights.ravel(), cells.ravel(), indptr),
+                                  shape=(itot, rasterShape[0]*ncolWin))
+
+    operator = {}
+    operator['matrix'] = matrix
+    operator['mask'] = mask.ravel()
+    operator['rasterShape'] = rasterShape
+    operator['itot'] = itot
+    operator['ioob'] = ioob
+    return operator
+
+
+def applyInterpOperator(operator, rasterData):
+    """
+    Interpolate a raster or a stack of rasters with an interpolation operator
+    (see makeInterpOperator)
+    Input :
+    operator: interpolation operator
+    rasterData: raster of the operator shape or stack of rasters (number of
+    rasters x raster shape)
+    Output:
+    values at the points (1D array for one raster, number of rasters x number
+    of points for a stack), nan for points out of bounds
+    """
+    rasterShape = operator['rasterShape']
+    nCells = rasterShape[0]*rasterShape[1]
+    if np.shape(rasterData)[-2:] != tuple(rasterShape):
+        raise ValueError('Raster of shape %s does not fit the interpolation operator (%s)' %
+                         (np.shape(rasterData), tuple(rasterShape)))
+    dtype = np.float32 if rasterData.dtype == np.float32 else np.float64
+    # one sparse matrix product for all rasters (cells x rasters)
+    values = operator['matrix'] @ rasterData.reshape(-1, nCells).T
+    values = values.T.astype(dtype, copy=False)
+    values[:, ~operator['mask']] = np.NaN
+    if np.ndim(rasterData) == 2:
+        values = values[0]
+    return values
+
+
+def resampleLine(xcoor, ycoor, distance=10, equalSpacing=False):
+    """ Resample a line with a max intervall of distance between points
+
+    Each segment of the line is split in the smallest number of equal parts
+    not longer than distance (the vertices of the line are kept). With
+    equalSpacing, the whole line is split in equal parts of arc length
+    instead (the vertices are in general not kept).
+    Inputs : - x and y coordinates of the line
+             - a resampling distance
+             - equalSpacing
+    Outputs : - x, y and curvilinear coordinate s of the resampled line
+    """
+    xcoor = np.asarray(xcoor)
+    ycoor = np.asarray(ycoor)
+    Vx = np.diff(xcoor)
+    Vy = np.diff(ycoor)
+    D = np.sqrt(Vx**2 + Vy**2)
+
+    if equalSpacing:
+        sLine = np.concatenate(([0], np.cumsum(D)))
+        nd = int(np.floor(sLine[-1] / distance) + 1)
+        s = np.linspace(0, sLine[-1], nd + 1)
+        return np.interp(s, sLine, xcoor), np.interp(s, sLine, ycoor), s
+
+    # number of new points per segment
+    nd = (np.floor(D / distance) + 1).astype(int)
+    # segment of each new point and its number j (1 to nd) on the segment
+    iSeg = np.repeat(np.arange(np.size(nd)), nd)
+    j = np.arange(1, np.sum(nd) + 1) - np.repeat(np.cumsum(nd) - nd, nd)
+    ndSeg = nd[iSeg]
+    # s of the first point of each segment (accumulated segment after segment)
+    # D * nd / nd is not a no-op: the former point by point loop took S0 from
+    # the last point of the previous segment, S0 + D * j / nd with j = nd, and
+    # (D * nd) / nd can differ from D in the last bit. Keep it to get the
+    # same s bit for bit (see test_resampleLine).
+    S0 = np.concatenate(([0], np.cumsum(D * nd / nd)))[:-1]
+    xcoornew = np.concatenate((xcoor[:1], j / ndSeg * Vx[iSeg] + xcoor[:-1][iSeg]))
+    ycoornew = np.concatenate((ycoor[:1], j / ndSeg * Vy[iSeg] + ycoor[:-1][iSeg]))
+    s = np.concatenate(([0.], S0[iSeg] + D[iSeg] * j / ndSeg))
+    return xcoornew, ycoornew, s
+
+
+def prepareLine(dem, avapath, distance=10, Point=None, equalSpacing=False):
     """ 1- Resample the avapath line with a max intervall of distance=10m
-    between points (projected distance on the horizontal plane).
+    between points (projected distance on the horizontal plane), see
+    resampleLine.
     2- Make avalanche profile out of the path (affect a z value using the dem)
     3- Get projection of points on the profil (closest point)
     Inputs : - a dem dictionary
              - a avapath line dictionary
              - a resampling Distance
              - a point dictionary (optional, can contain several point)
+             - equalSpacing: resample at equal arc length (see resampleLine)
     Outputs : - the resampled avaprofile
               - the projection of the point on the profile (if several points
               were give in input, only the closest point to the profile
               is projected)
-
-    TODO: test
     """
-    xcoor = avapath['x']
-    ycoor = avapath['y']
-    xcoornew = np.array([xcoor[0]])
-    ycoornew = np.array([ycoor[0]])
-    s = np.array([0])  # curvilinear coordinate allong the path
-    # loop on the points of the avapath
-    for i in range(np.shape(xcoor)[0] - 1):
-        Vx = xcoor[i + 1] - xcoor[i]
-        Vy = ycoor[i + 1] - ycoor[i]
-        D = np.sqrt(Vx**2 + Vy**2)
-        nd = int(np.floor(D / distance) + 1)
-        # Resample each segment
-        S0 = s[-1]
-        for j in range(1, nd + 1):
-            xn = j / (nd) * Vx + xcoor[i]
-            yn = j / (nd) * Vy + ycoor[i]
-            xcoornew = np.append(xcoornew, xn)
-            ycoornew = np.append(ycoornew, yn)
-            s = np.append(s, S0 + D * j / nd)
+    xcoornew, ycoornew, s = resampleLine(avapath['x'], avapath['y'], distance=distance,
+                                         equalSpacing=equalSpacing)
 
     ResampAvaPath = avapath
     ResampAvaPath['x'] = xcoornew
@@ -190,20 +303,13 @@ def prepareLine(dem, avapath, distance=10, Point=None):
     return AvaProfile, projPoint
 
 
-def findSplitPoint(AvaProfile, Points):
+def findSplitPoint(AvaProfile, Points, profileIndex=None):
     """ Finds the closest point in Points to the AvaProfile and returns
     its projection on AvaProfile.
+    The profile points are searched with a spatial index (see
+    makeProfileIndex), which can be given to reuse it for several calls.
     """
-    xcoor = AvaProfile['x']
-    ycoor = AvaProfile['y']
-    Dist = np.empty((0))
-    IndSplit = np.empty((0))
-    for i in range(len(Points['x'])):
-        dist = np.sqrt((xcoor - Points['x'][i])**2 +
-                       (ycoor - Points['y'][i])**2)
-        indSplit = np.argmin(dist)
-        IndSplit = np.append(IndSplit, indSplit)
-        Dist = np.append(Dist, dist[indSplit])
+    Dist, IndSplit = findNearestVertex(AvaProfile, Points, profileIndex=profileIndex)
 
     ind = np.argmin(Dist)
     indSplit = int(IndSplit[ind])
@@ -216,6 +322,128 @@ def findSplitPoint(AvaProfile, Points):
     return projPoint
 
 
+def makeProfileIndex(AvaProfile):
+    """ Spatial index of a profile (or any line) for findNearestVertex and
+    projectOnProfile
+    Returns a dictionary with a kd-tree of the points of the profile
+    ('vertices'), a kd-tree of the middle of its segments ('segments') and the
+    half length of the longest segment ('maxHalfLength')
+    """
+    xy = np.column_stack((AvaProfile['x'], AvaProfile['y']))
+    profileIndex = {}
+    profileIndex['vertices'] = sp.spatial.cKDTree(xy)
+    profileIndex['segments'] = sp.spatial.cKDTree((xy[1:] + xy[:-1]) / 2)
+    halfLength = np.sqrt(np.sum((xy[1:] - xy[:-1])**2, axis=1)) / 2
+    profileIndex['maxHalfLength'] = np.max(halfLength) if halfLength.size else 0.
+    return profileIndex
+
+
+def _nearTies(tree, xy, dist):
+    """ Candidates of a kd-tree at the distance dist (up to round off) of
+    each point xy: returns the point and the tree index of each candidate """
+    candidates = tree.query_ball_point(xy, dist * (1 + 1.e-8) + 1.e-8)
+    nCandidates = np.array([len(c) for c in candidates], dtype=int)
+    iPoint = np.repeat(np.arange(len(xy)), nCandidates)
+    iTree = np.concatenate(list(candidates) + [np.zeros(0, dtype=int)]).astype(int)
+    return iPoint, iTree
+
+
+def _firstMin(iPoint, dist):
+    """ Position of the first minimum of dist for each point (iPoint sorted) """
+    order = np.lexsort((np.arange(len(dist)), dist, iPoint))
+    _, first = np.unique(iPoint[order], return_index=True)
+    return order[first]
+
+
+def findNearestVertex(AvaProfile, Points, profileIndex=None):
+    """ Find the nearest point of the profile of each point in Points
+    Same result as computing the distance of each point to all profile points
+    (the first profile point is taken if several are at the same distance)
+    Inputs : - AvaProfile: dictionary with x, y
+             - Points: dictionary with x, y (any number of points)
+             - profileIndex: spatial index of AvaProfile (optional, see
+             makeProfileIndex)
+    Outputs : - dist: distance of each point to the nearest profile point
+              - ind: index of the nearest profile point
+    """
+    if profileIndex is None:
+        profileIndex = makeProfileIndex(AvaProfile)
+    xcoor = AvaProfile['x']
+    ycoor = AvaProfile['y']
+    xy = np.column_stack((np.atleast_1d(Points['x']), np.atleast_1d(Points['y'])))
+    distTree, ind = profileIndex['vertices'].query(xy, k=2)
+    ind = ind[:, 0]
+    # points with a second profile point at the same distance (up to the
+    # round off of the tree): take all profile points at this distance
+    tie = np.flatnonzero(distTree[:, 1] <= distTree[:, 0] * (1 + 1.e-8) + 1.e-8)
+    if tie.size:
+        iPoint, iVertex = _nearTies(profileIndex['vertices'], xy[tie], distTree[tie, 0])
+        dist = np.sqrt((xcoor[iVertex] - xy[tie[iPoint], 0])**2 + (ycoor[iVertex] - xy[tie[iPoint], 1])**2)
+        ind[tie] = iVertex[_firstMin(iPoint, dist)]
+    dist = np.sqrt((xcoor[ind] - xy[:, 0])**2 + (ycoor[ind] - xy[:, 1])**2)
+    return dist, ind
+
+
+def projectOnProfile(AvaProfile, Points, profileIndex=None):
+    """ Project each point of Points on the profile: nearest point on the
+    segments of the profile
+    Inputs : - AvaProfile: dictionary with x, y (and optionally z, s)
+             - Points: dictionary with x, y (any number of points)
+             - profileIndex: spatial index of AvaProfile (optional, see
+             makeProfileIndex)
+    Outputs : projPoints: dictionary with the x, y (z, s linearly
+              interpolated) coordinates of the projections, their distance
+              'dist' to the points, the segment 'indSegment' (from profile
+              point indSegment to indSegment+1) and the position 't' (0 to 1)
+              on the segment
+    """
+    if profileIndex is None:
+        profileIndex = makeProfileIndex(AvaProfile)
+    xcoor = np.asarray(AvaProfile['x'], dtype=float)
+    ycoor = np.asarray(AvaProfile['y'], dtype=float)
+    xy = np.column_stack((np.atleast_1d(Points['x']), np.atleast_1d(Points['y'])))
+    if len(xcoor) < 2:
+        # no segment, the projection is the only profile point
+        indSegment = np.zeros(len(xy), dtype=int)
+        t = np.zeros(len(xy))
+        xProj = np.full(len(xy), xcoor[0])
+        yProj = np.full(len(xy), ycoor[0])
+        dist = np.sqrt((xProj - xy[:, 0])**2 + (yProj - xy[:, 1])**2)
+    else:
+        # the nearest segment is at most as far as the nearest profile point,
+        # so its middle is closer than this distance plus its half length
+        distVertex, _ = profileIndex['vertices'].query(xy)
+        iPoint, indSegment = _nearTies(profileIndex['segments'], xy,
+                                       distVertex + profileIndex['maxHalfLength'])
+        dx = xcoor[indSegment+1] - xcoor[indSegment]
+        dy = ycoor[indSegment+1] - ycoor[indSegment]
+        length2 = dx**2 + dy**2
+        t = ((xy[iPoint, 0] - xcoor[indSegment])*dx + (xy[iPoint, 1] - ycoor[indSegment])*dy)
+        t = np.clip(np.divide(t, length2, out=np.zeros_like(t), where=length2 > 0), 0, 1)
+        xProj = xcoor[indSegment] + t*dx
+        yProj = ycoor[indSegment] + t*dy
+        dist = np.sqrt((xProj - xy[iPoint, 0])**2 + (yProj - xy[iPoint, 1])**2)
+        first = _firstMin(iPoint, dist)
+        indSegment = indSegment[first]
+        t = t[first]
+        xProj = xProj[first]
+        yProj = yProj[first]
+        dist = dist[first]
+
+    projPoints = {}
+    projPoints['x'] = xProj
+    projPoints['y'] = yProj
+    indEnd = np.minimum(indSegment + 1, len(xcoor) - 1)
+    for key in ['z', 's']:
+        if key in AvaProfile:
+            values = np.asarray(AvaProfile[key], dtype=float)
+            projPoints[key] = values[indSegment] + t*(values[indEnd] - values[indSegment])
+    projPoints['dist'] = dist
+    projPoints['indSegment'] = indSegment
+    projPoints['t'] = t
+    return projPoints
+
+
 def checkProfile(AvaProfile, projSplitPoint=None):
     """ check that the avalanche profiles goes from top to bottom """
     if projSplitPoint:
@@ -247,19 +475,53 @@ def findAngleProfile(tmp, deltaInd):
     Find the beta point: first point under the beta value given in
     prepareFind10Point. Make sure that the delta_ind next indexes are also
     under the beta value otherwise keep looking
+    Raises a ValueError if there is no such point
      """
-    i = 0
-    while True:
-        ind = tmp[0][i]
-        condition = True
-        for j in range(deltaInd):
-            condition = condition and (tmp[0][i+j+1] == ind+j+1)
-            if not condition:
-                i = i + j + 1
-                break
-        if condition:
-            idsAnglePoint = ind - 1
-            break
+    ind = np.asarray(tmp[0])
+    if ind.size == 0:
+        raise ValueError('No beta point found: no point of the profile is under the angle')
+    mask = np.zeros(ind[-1] + 1, dtype=bool)
+    mask[ind] = True
+    idsAnglePoint = findAngleProfileBatch(mask, np.zeros(len(mask), dtype=int), deltaInd, 1)[0]
+    return idsAnglePoint
+
+
+def findAngleProfileBatch(mask, iProfile, deltaInd, nProfiles, names=None):
+    """
+    Find the beta point of several profiles at once (see findAngleProfile):
+    point before the first run of deltaInd+1 consecutive points of a profile
+    that are under the beta value
+    input: mask: True for the points under the beta value (the profiles are
+           packed one after the other)
+           iProfile: profile of each point
+           deltaInd: int or array (one per profile)
+           nProfiles: number of profiles
+           names: names of the profiles for the error message (optional)
+    returns: idsAnglePoint: index (in the packed profiles) of the beta point
+             of each profile
+    Raises a ValueError naming the profiles without beta point
+    """
+    mask = np.asarray(mask, dtype=bool)
+    iProfile = np.asarray(iProfile)
+    runLength = np.broadcast_to(np.asarray(deltaInd) + 1, (nProfiles,))
+    # runs of consecutive points under the beta value (within one profile)
+    samePrevious = np.concatenate(([False], mask[:-1] & (iProfile[1:] == iProfile[:-1])))
+    sameNext = np.concatenate((mask[1:] & (iProfile[1:] == iProfile[:-1]), [False]))
+    runStart = np.flatnonzero(mask & ~samePrevious)
+    runEnd = np.flatnonzero(mask & ~sameNext)
+    runProfile = iProfile[runStart]
+    longRun = (runEnd - runStart + 1) >= runLength[runProfile]
+    # first long enough run of each profile
+    firstRun = np.full(nProfiles, -1)
+    profiles, first = np.unique(runProfile[longRun], return_index=True)
+    firstRun[profiles] = runStart[longRun][first]
+    if np.any(firstRun < 0):
+        if names is None:
+            names = np.arange(nProfiles)
+        missing = [str(name) for name, run in zip(names, firstRun) if run < 0]
+        raise ValueError('No beta point (deltaInd+1 consecutive points under the angle) found '
+                         'on the profiles: %s' % ', '.join(missing))
+    idsAnglePoint = firstRun - 1
     return idsAnglePoint
 
 
@@ -429,23 +691,14 @@ def poly2maskSimple(ydep, xdep, ncols, nrows):
            mask:            Raster of the polyline mask
 
     """
-    mask = np.zeros((nrows, ncols))
-    xyframe = findCellsCrossedByLineBresenham(xdep[0], ydep[0], xdep[1], ydep[1], 1)
-    xyframe = np.delete(xyframe, -1, 0)
-    xyframe = np.transpose(xyframe)
-    for i in range(1, len(xdep)-1):
-        xyline = findCellsCrossedByLineBresenham(xdep[i], ydep[i], xdep[i+1], ydep[i+1], 1)
-        # last point is first point of the next line
-        xyline = np.delete(xyline, -1, 0)
-        xyline = np.transpose(xyline)
-        xyframe = np.hstack((xyframe, xyline))
-
-    xyline = findCellsCrossedByLineBresenham(xdep[-1], ydep[-1], xdep[0], ydep[0], 1)
-    xyline = np.delete(xyline, -1, 0)
-    xyline = np.transpose(xyline)
-    xyframe = np.hstack((xyframe, xyline))
-    for i in range(0, len(xyframe[0, :])):
-        mask[xyframe[0, i], xyframe[1, i]] = 1
+    # cells crossed by the polygon edges (last point of each edge is first
+    # point of the next edge)
+    xyframe = []
+    for i in range(len(xdep)):
+        xyline = findCellsCrossedByLineBresenham(xdep[i-1], ydep[i-1], xdep[i], ydep[i], 1)
+        xyframe.append(np.transpose(np.delete(xyline, -1, 0)))
+    # the first edge goes from the first to the second point
+    xyframe = np.hstack(xyframe[1:] + xyframe[:1])
 
     # filling the inside of the polygon with ones
     i = xyframe[0]
@@ -474,27 +727,126 @@ def inpolygon(X, Y, xv, yv):
 
     Octave Implementation [IN, ON] = inpolygon (X, Y, xv, yv)
     """
+    xv = np.asarray(xv)
+    yv = np.asarray(yv)
     npol = len(xv)
-    lx = np.shape(X)[0]
-    ly = np.shape(Y)[1]
+    # edges from vertex i to vertex j = i-1 (the edge from vertex npol-2 to
+    # npol-1 is not used, as in the Octave implementation)
+    i = np.arange(npol-1)
+    j = (i - 1) % npol
+    X = np.asarray(X)
+    Y = np.asarray(Y)
+    # points sorted by scanline (Y value) and X
+    order = np.lexsort((X.ravel(), Y.ravel()))
+    Xs = X.ravel()[order]
+    Ys = Y.ravel()[order]
+    lineStart = np.flatnonzero(np.concatenate(([True], Ys[1:] != Ys[:-1]))) if Ys.size else np.zeros(0, dtype=int)
+    nCross = crossingNumber(Xs, Ys[lineStart], lineStart, xv[i], yv[i], xv[j], yv[j])
     IN = np.zeros(np.shape(X))
-    j = npol-1
-    for i in range(npol-1):
-        deltaxv = xv[j] - xv[i]
-        deltayv = yv[j] - yv[i]
-        # distance = [distance from (X,Y) to edge] * length(edge)
-        distance = deltaxv*(Y-yv[i]) - (X-xv[i])*deltayv
-        # is Y between the y-values of edge i,j
-        # AND (X,Y) on the left of the edge ?
-        for ii in range(lx):
-            for jj in range(ly):
-                if (((yv[i] <= Y[ii][jj] and Y[ii][jj] < yv[j]) or (yv[j] <= Y[ii][jj] and Y[ii][jj] < yv[i])) and 0 < distance[ii][jj]*deltayv):
-                    if IN[ii][jj] == 0:
-                        IN[ii][jj] = 1
-                    else:
-                        IN[ii][jj] = 0
-        j = i
-    for i in range(npol-1):
-        IN[yv[i]][xv[i]] = 1
+    IN.ravel()[order] = nCross % 2
+    IN[yv[:npol-1], xv[:npol-1]] = 1
 
     return IN
+
+
+def crossingNumber(X, lineY, lineStart, xStart, yStart, xEnd, yEnd):
+    """
+    Number of polygon edges crossed by the horizontal ray going from each
+    point to the left (even-odd rule: the point is inside if it is odd)
+    The edge from (xStart, yStart) to (xEnd, yEnd) is crossed if
+    yStart <= Y < yEnd (or yEnd <= Y < yStart) and the point is on the side
+    of the edge given by 0 < distance*(yEnd-yStart), with
+    distance = (xEnd-xStart)*(Y-yStart) - (X-xStart)*(yEnd-yStart).
+    On one scanline (points with the same Y), this test is True for the points
+    with X below a bound, which is found by a binary search on the sorted X of
+    the scanline (using the same test), so the result is the same as testing
+    every point against every edge.
+    input: X: x coordinate of the points, sorted by scanline and by X on a
+           scanline
+           lineY: Y of each scanline (increasing)
+           lineStart: index of the first point of each scanline
+           xStart, yStart, xEnd, yEnd: edges
+    returns: nCross: number of edges crossed (for each point)
+    """
+    nPoints = len(X)
+    lineEnd = np.append(lineStart[1:], nPoints).astype(int)
+    deltax = xEnd - xStart
+    deltay = yEnd - yStart
+    # scanlines yMin <= Y < yMax of each edge
+    lineLow = np.searchsorted(lineY, np.minimum(yStart, yEnd), side='left')
+    lineHigh = np.searchsorted(lineY, np.maximum(yStart, yEnd), side='left')
+    nLines = np.maximum(lineHigh - lineLow, 0)
+    edge = np.repeat(np.arange(len(xStart)), nLines)
+    line = np.repeat(lineLow - np.cumsum(nLines) + nLines, nLines) + np.arange(np.sum(nLines))
+    Y = lineY[line]
+    deltaxE = deltax[edge]
+    deltayE = deltay[edge]
+    xStartE = xStart[edge]
+    yStartE = yStart[edge]
+
+    # binary search of the first point of the scanline that is not on the
+    # side of the edge
+    low = lineStart[line]
+    high = lineEnd[line]
+    first = low.copy()
+    active = low < high
+    while np.any(active):
+        mid = (low + high) // 2
+        distance = deltaxE*(Y-yStartE) - (X[np.minimum(mid, nPoints-1)]-xStartE)*deltayE
+        onSide = 0 < distance*deltayE
+        low = np.where(active & onSide, mid + 1, low)
+        high = np.where(active & ~onSide, mid, high)
+        active = low < high
+    # points first to low-1 cross the edge
+    nCross = np.cumsum(np.bincount(first, minlength=nPoints+1) - np.bincount(low, minlength=nPoints+1))
+    return nCross[:nPoints]
+
+
+def shpPoly2Mask(Polygons, header):
+    """
+    Create a raster mask from polygons
+    Cell (i, j) is in the mask if the point (xllcorner + j*cellsize,
+    yllcorner + i*cellsize) is inside one of the polygons (even-odd rule, see
+    crossingNumber). As in projectOnRaster, the value of a cell sits at the
+    corner given by xllcorner and yllcorner, not at the cell center.
+    Usage:
+        mask = shpPoly2Mask(Polygons, header)
+       Input:
+           Polygons:  polygons as read by shpConversion.SHP2Array (x, y,
+                      Start and Length of each polygon)
+           header:    raster header (ncols, nrows, xllcorner, yllcorner,
+                      cellsize)
+       Output:
+           mask:      np array (nrows x ncols) of zeros and ones
+    """
+    ncols = header.ncols
+    nrows = header.nrows
+    xllc = header.xllcorner
+    yllc = header.yllcorner
+    csz = header.cellsize
+    mask = np.zeros((nrows, ncols))
+    for start, length in zip(Polygons['Start'], Polygons['Length']):
+        start = int(start)
+        end = start + int(length)
+        # polygon vertices in cell index coordinates, closed polygon
+        xv = (Polygons['x'][start:end] - xllc) / csz
+        yv = (Polygons['y'][start:end] - yllc) / csz
+        xEnd = np.roll(xv, -1)
+        yEnd = np.roll(yv, -1)
+        # only the cells in the bounding box of the polygon
+        col0 = max(int(np.ceil(np.min(xv))), 0)
+        col1 = min(int(np.floor(np.max(xv))), ncols-1)
+        row0 = max(int(np.ceil(np.min(yv))), 0)
+        row1 = min(int(np.floor(np.max(yv))), nrows-1)
+        if col1 < col0 or row1 < row0:
+            continue
+        nx = col1 - col0 + 1
+        ny = row1 - row0 + 1
+        X = np.tile(np.arange(col0, col1+1, dtype=float), ny)
+        lineY = np.arange(row0, row1+1, dtype=float)
+        lineStart = np.arange(ny) * nx
+        nCross = crossingNumber(X, lineY, lineStart, xv, yv, xEnd, yEnd)
+        inside = (nCross % 2).reshape(ny, nx) == 1
+        mask[row0:row1+1, col0:col1+1][inside] = 1
+
+    return mask
@@ -30,97 +30,69 @@ def SHP2Array(infile, defname=None):
     sf = shapefile.Reader(infile)
 
     # set defaults for variables
-    layername = None
-    d0 = None
-    rho = None
     sks = None
-    iso = None
 
     # get coordinate system
     prjfile = infile.replace('.shp', '.prj')
     if os.path.isfile(prjfile):
-        prjf = open(prjfile, 'r')
-        sks = prjf.readline()
+        with open(prjfile, 'r') as prjf:
+            sks = prjf.readline()
 
     # Start reading the shapefile
-    records = sf.shapeRecords()
+    records = sf.records()
     shps = sf.shapes()
 
     SHPdata = {}
     SHPdata['sks'] = sks
-    Name = []
-    Length = np.empty((0))
-    Start = np.empty((0))
-    Coordx = np.empty((0))
-    Coordy = np.empty((0))
-    Coordz = np.empty((0))
-    start = 0
-
-    for n, item in enumerate(shps):
-        pts = item.points
-        zs = [0.0] * len(pts)
-
-        # check if records are available and extract
-        if records:
-            # loop through fields
-            for (name, typ, size, deci), value in zip(sf.fields[1:], records[n].record):
-                # get entity name
-                name = name.lower()
-                if (name == 'name'):
-                    layername = str(value)
-                if (name == 'd0'):
-                    d0 = value
-                if (name == 'rho'):
-                    rho = value
-                if (name == 'sks'):
-                    sks = value
-                if (name == 'iso'):
-                    iso = value
-            # if name is still empty go through file again and take Layer instead
-            if ((type(layername) is bytes) or (layername is None)):
-                for (name, typ, size, deci), value in zip(sf.fields[1:], records[n].record):
-                    if (name == 'Layer'):
-                        layername = value
 
+    # name of each shape: from the name field or else from the Layer field
+    # (decoded column by column)
+    nameColumn = None
+    layerColumn = None
+    if records:
+        for i, (name, typ, size, deci) in enumerate(sf.fields[1:]):
+            if name.lower() == 'name':
+                nameColumn = [str(record[i]) for record in records]
+            if name == 'Layer':
+                layerColumn = [record[i] for record in records]
+    Name = []
+    layername = None
+    for n in range(len(shps)):
+        if nameColumn is not None:
+            layername = nameColumn[n]
+        # the Layer field is only used if the name is still empty (the name
+        # of the previous shape is kept otherwise)
+        if ((type(layername) is bytes) or (layername is None)) and layerColumn is not None:
+            layername = layerColumn[n]
         # if layer still not defined, use generic
         if layername is None:
             layername = defname
-
         Name.append(layername)
         log.debug('SHPConv: Found layer %s', layername)
 
-        Start = np.append(Start, start)
-        length = len(pts)
-        Length = np.append(Length, length)
-        start += length
-
-        for (pt, z) in zip(pts, zs):
-            Coordx = np.append(Coordx, pt[0])
-            Coordy = np.append(Coordy, pt[1])
-            Coordz = np.append(Coordz, z)
+    # convert the points of each shape in one go, offsets of the shapes from
+    # the cumulative length
+    shpCoords = [np.asarray(item.points, dtype=float)[:, :2] if len(item.points) else np.empty((0, 2))
+                 for item in shps]
+    Length = np.array([len(shpCoord) for shpCoord in shpCoords], dtype=float)
+    Start = np.concatenate(([0.], np.cumsum(Length)[:-1])) if len(shps) else np.empty((0))
+    coords = np.concatenate(shpCoords) if len(shps) else np.empty((0, 2))
 
     SHPdata['Name'] = Name
     SHPdata['Start'] = Start
     SHPdata['Length'] = Length
-    SHPdata['x'] = Coordx
-    SHPdata['y'] = Coordy
-    SHPdata['z'] = Coordz
+    SHPdata['x'] = coords[:, 0]
+    SHPdata['y'] = coords[:, 1]
+    SHPdata['z'] = np.zeros(len(coords))
     return SHPdata
 
+
 def readLine(fname, defname, header):
     """ Read avalanche path from  .shp"""
 
     log.debug('Reading avalanche path : %s ', fname)
     Line = SHP2Array(fname, defname)
-    coordx = Line['x']
-    coordy = Line['y']
-    for i in range(len(coordx)):
-        Lx = int(np.floor((coordx[i] - header.xllcorner) /
-                          header.cellsize))
-        Ly = int(np.floor((coordy[i] - header.yllcorner) /
-                          header.cellsize))
-        if (Ly < 0 or Ly > header.nrows or Lx < 0 or Lx > header.ncols):
-            raise ValueError('Avalanche path exceeds dem extend')
+    checkExtent(Line, header, 'Avalanche path exceeds dem extend')
     return Line
 
 
@@ -130,13 +102,25 @@ def readPoints(fname, header):
     log.debug('Reading split point : %s ', fname)
     defname = 'SHP'
     Points = SHP2Array(fname, defname)
-    Pointx = Points['x']
-    Pointy = Points['y']
-    for i in range(len(Pointx)):
-        Lx = int(np.floor((Pointx[i] - header.xllcorner) /
-                          header.cellsize))
-        Ly = int(np.floor((Pointy[i] - header.yllcorner) /
-                          header.cellsize))
-        if (Ly < 0 or Ly > header.nrows or Lx < 0 or Lx > header.ncols):
-            raise ValueError('Split point is not on the dem')
+    checkExtent(Points, header, 'Split point is not on the dem')
     return Points
+
+
+def checkExtent(SHPdata, header, errorText):
+    """ Check that all points of SHPdata lie on the dem, i.e. in the cells
+    0 to nrows-1 and 0 to ncols-1 of the raster given by header
+    Raises a ValueError (errorText followed by the names of the shapes and
+    the indices of their points that are not on the dem)
+    """
+    Lx = np.floor((SHPdata['x'] - header.xllcorner) / header.cellsize)
+    Ly = np.floor((SHPdata['y'] - header.yllcorner) / header.cellsize)
+    onDem = (Lx >= 0) & (Lx < header.ncols) & (Ly >= 0) & (Ly < header.nrows)
+    outside = np.flatnonzero(~onDem)
+    if outside.size:
+        start = np.asarray(SHPdata['Start'], dtype=int)
+        shape = np.searchsorted(start, outside, side='right') - 1
+        offending = []
+        for i in np.unique(shape):
+            points = outside[shape == i] - start[i]
+            offending.append('%s (points %s)' % (SHPdata['Name'][i], ', '.join(str(p) for p in points)))
+        raise ValueError('%s: %s' % (errorText, '; '.join(offending)))
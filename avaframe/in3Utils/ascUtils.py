@@ -4,10 +4,17 @@
     This file is part of Avaframe.
 """
 import os
+import gzip
+import itertools
+import json
+import hashlib
 from decimal import *
 import numpy as np
 import logging
 
+# Local imports
+from avaframe.in3Utils import cfgUtils
+
 
 # create local logger
 log = logging.getLogger(__name__)
@@ -35,11 +42,45 @@ def readASCheader(fname):
     """input: Filename (z.B.: 'xx/xx/file.asc')
     returns: ascHeader for filename (see class cASCheader)
     """
+    if _isTiledRaster(fname):
+        return _tileUtils().readTiledHeader(fname)
+    with _openASC(fname) as infile:
+        # only the six header lines are read
+        dhmInfo = _parseASCheader(itertools.islice(infile, 6))
+    return dhmInfo
+
+
+def _isTiledRaster(fname):
+    """ True if fname is a tiled raster file (see tileUtils.isTiledRaster) """
+    return os.path.splitext(fname)[1] == '.npz'
+
+
+def _tileUtils():
+    """ Return the tileUtils module
+
+    tileUtils builds on this module (headers and windows), so it is only
+    imported when a tiled raster is read to avoid a circular import.
+    """
+    import avaframe.in3Utils.tileUtils as tileU
+    return tileU
+
+
+def _openASC(fname, mode='r'):
+    """ Open an ascii raster file in text mode, gzip compressed if it ends with .gz """
+    if fname.endswith('.gz'):
+        return gzip.open(fname, mode + 't', compresslevel=6)
+    return open(fname, mode)
+
+
+def _parseASCheader(headerLines):
+    """ Parse the six header lines of an ascii raster
+
+    input: iterable over the lines of the file (or just the header lines)
+    returns: ascHeader (see class cASCheader)
+    """
     dhmInfo = cASCheader()
-    infile = open(fname, "r")
-    i = 0
     ln = 0
-    for aline in infile:
+    for aline in headerLines:
         item = aline.split()
         if ln == 0:
             dhmInfo.ncols = int(item[1])
@@ -68,7 +109,6 @@ def readASCheader(fname):
         dhmInfo.xllcorner = dhmInfo.xllcenter - dhmInfo.cellsize / 2
         dhmInfo.yllcorner = dhmInfo.yllcenter - dhmInfo.cellsize / 2
 
-    infile.close()
     return dhmInfo
 
 
@@ -83,93 +123,429 @@ def isEqualASCheader(headerA, headerB):
            (a.yllcorner == b.yllcorner) and (a.cellsize == b.cellsize)
 
 
-def readASCdata2numpyArray(fName, headerFile=None):
+def readASCdata2numpyArray(fName, headerFile=None, dtype=np.float64):
+    """ Read the data block of an ascii raster file to a numpy array
 
-    if headerFile is not None:
-        # open input File
-        infile = open(fName, "r")
+    The whole data block is parsed in one pass (no loop over the cells).
+    If no header is given, it is parsed from the same file handle, so the
+    file is only opened and read once.
 
-        # create numpy array with dimesions based on ncols and nrows
-        # initialize values of array with respective noDataValue obtained
-        # from the header file
-        data = np.zeros((headerFile.nrows, headerFile.ncols))
-        data = np.where(data == 0, float(headerFile.noDataValue), data)
+    input: fName: file name
+           headerFile: ascHeader of the file (optional)
+           dtype: dtype of the returned array (e.g. np.float32 or np.float64)
+    returns: data: numpy array of shape (nrows, ncols), first row is the
+             first data line of the file
+    """
+    with _openASC(fName) as infile:
+        headerLines = [infile.readline() for i in range(6)]
+        if headerFile is None:
+            headerFile = _parseASCheader(headerLines)
+        # parse data block in one go
+        data = np.fromstring(infile.read(), dtype=dtype, sep=' ')
 
-        i = 0  # index in vertical direction (row-count)
-        j = 0  # index in horizontal direction (column-count)
-        for aline in infile:
-            item = aline.split()
-            if i > 5:
-                for x in range(headerFile.ncols):
-                    data[i - 6, j] = float(item[x])
-                    j += 1
-                j = 0
-            i += 1
+    nrows = headerFile.nrows
+    ncols = headerFile.ncols
+    if data.size != nrows*ncols:
+        raise ValueError('Found %d values in %s, expected %d (nrows x ncols = %d x %d)' %
+                         (data.size, fName, nrows*ncols, nrows, ncols))
 
-    else:
-        header = readASCheader(fName)
-        infile = open(fName, "r")
-
-        # create numpy array with dimesions based on ncols and nrows
-        # initialize values of array with respective noDataValue obtained
-        # from the header file
-        data = np.zeros((header.nrows, header.ncols))
-        data = np.where(data == 0, float(header.noDataValue), data)
-
-        i = 0  # index in vertical direction (row-count)
-        j = 0  # index in horizontal direction (column-count)
-        for aline in infile:
-            item = aline.split()
-            if i > 5:
-                for x in range(header.ncols):
-                    data[i-6, j] = float(item[x])
-                    j += 1
-                j = 0
-            i += 1
-
-    return (data)
-
-def readRaster(fname):
-    """ Read raster file (.asc)"""
+    return data.reshape((nrows, ncols))
+
+
+def readRaster(fname, cfgRaster=None):
+    """ Read raster file (.asc)
+
+    If the binary raster cache is switched on (useCache in the RASTER section
+    of avaframeCfg.ini), the raster is taken from its binary copy as long as
+    this is still valid; otherwise the .asc file is parsed and the copy
+    (re)written.
+
+    input: fname: file name
+           cfgRaster: RASTER configuration section (optional, read from
+           avaframeCfg.ini if not given)
+    returns: dem: dictionary with header and rasterData (dtype set by
+             precision in the RASTER section, float64 by default)
+    """
+
+    if cfgRaster is None:
+        cfgRaster = getRasterConfig()
+    dtype = getRasterDtype(cfgRaster)
+
+    if _isTiledRaster(fname):
+        dem = _tileUtils().readTiledRaster(fname)
+        dem['rasterData'] = dem['rasterData'].astype(dtype, copy=False)
+        return dem
+
+    useCache = cfgRaster is not None and cfgRaster.getboolean('useCache', fallback=False)
+
+    if useCache:
+        dem = readRasterCache(fname, cfgRaster)
+        if dem is not None:
+            return dem
 
     log.debug('Reading dem : %s', fname)
     header = readASCheader(fname)
-    rasterdata = readASCdata2numpyArray(fname, header)
+    rasterdata = readASCdata2numpyArray(fname, header, dtype=dtype)
     rasterdata[rasterdata == header.noDataValue] = np.NaN
     dem = {}
     dem['header'] = header
     dem['rasterData'] = np.flipud(rasterdata)
+
+    if useCache:
+        writeRasterCache(fname, dem, cfgRaster)
+
     return dem
 
 
-def writeResultToAsc(header, resultArray, outType=None):
-    # print "choose output file location and name"
+def _getWindowIndices(header, xMin, xMax, yMin, yMax):
+    """ Return the index range of the cells needed to interpolate inside a bounding box
 
-    if outType is not None:
-        outfile = asksaveasfile(mode='w',
-                                defaultextension='.asc',
-                                title='Save Output File %s' % (outType),
-                                filetypes=[('ASCII', '*.asc')],
-                                initialfile='path.asc',
-                                initialdir=os.getcwd())
-    else:
-        outfile = asksaveasfile(mode='w',
-                                defaultextension='.asc',
-                                title='Save Output File',
-                                filetypes=[('ASCII', '*.asc')],
-                                initialfile='path.asc',
-                                initialdir=os.getcwd())
-
-    outfile.write("ncols %d\n" % header.ncols)
-    outfile.write("nrows %d\n" % header.nrows)
-    outfile.write("xllcorner %.2f\n" % header.xllcorner)
-    outfile.write("yllcorner %.2f\n" % header.yllcorner)
-    outfile.write("cellsize %.2f\n" % header.cellsize)
-    outfile.write("nodata_value %.2f\n" % header.noDataValue)
-
-    for i in range(resultArray.shape[0]):
-        for j in range(resultArray.shape[1]):
-            outfile.write("%f " % resultArray[i][j])
-        outfile.write("\n")
-
-    outfile.close()
+    Indices refer to the rasterData as returned by readRaster (first row is the
+    southern most row). The ranges are inclusive and clipped to the raster.
+    """
+    col0 = int(np.floor((xMin - header.xllcorner) / header.cellsize))
+    col1 = int(np.floor((xMax - header.xllcorner) / header.cellsize)) + 1
+    row0 = int(np.floor((yMin - header.yllcorner) / header.cellsize))
+    row1 = int(np.floor((yMax - header.yllcorner) / header.cellsize)) + 1
+    col0, col1 = [min(max(col, 0), header.ncols - 1) for col in [col0, col1]]
+    row0, row1 = [min(max(row, 0), header.nrows - 1) for row in [row0, row1]]
+    return row0, row1, col0, col1
+
+
+def _makeWindow(header, rasterData, row0, col0):
+    """ Build the raster dictionary of a window starting at cell (row0, col0) """
+    nrows, ncols = rasterData.shape
+    windowHeader = cASCheader()
+    windowHeader.nrows = nrows
+    windowHeader.ncols = ncols
+    windowHeader.cellsize = header.cellsize
+    windowHeader.xllcorner = header.xllcorner + col0 * header.cellsize
+    windowHeader.yllcorner = header.yllcorner + row0 * header.cellsize
+    windowHeader.xllcenter = windowHeader.xllcorner + header.cellsize / 2
+    windowHeader.yllcenter = windowHeader.yllcorner + header.cellsize / 2
+    windowHeader.noDataValue = header.noDataValue
+    window = {}
+    window['header'] = windowHeader
+    window['rasterData'] = rasterData
+    # position of the window in the full raster
+    window['parentHeader'] = header
+    window['windowOffset'] = (row0, col0)
+    return window
+
+
+def getRasterWindow(dem, xMin, xMax, yMin, yMax):
+    """ Cut the window covering a bounding box out of a raster
+
+    The window contains all cells needed to interpolate (bilinear) at any point
+    inside the bounding box. rasterData of the window is a view on the raster
+    (for a memory mapped raster only the window is read from disk).
+
+    input: dem: dictionary with header and rasterData (as returned by readRaster)
+           xMin, xMax, yMin, yMax: bounding box
+    returns: window: dictionary with header (of the window), rasterData,
+             parentHeader (header of the full raster) and windowOffset
+             (row and column of the first window cell in the full raster)
+    """
+    header = dem.get('parentHeader', dem['header'])
+    rowOffset, colOffset = dem.get('windowOffset', (0, 0))
+    row0, row1, col0, col1 = _getWindowIndices(header, xMin, xMax, yMin, yMax)
+    rasterData = dem['rasterData'][row0-rowOffset:row1+1-rowOffset, col0-colOffset:col1+1-colOffset]
+    return _makeWindow(header, rasterData, row0, col0)
+
+
+def readRasterWindow(fname, xMin, xMax, yMin, yMax, cfgRaster=None):
+    """ Read the window of a raster file covering a bounding box
+
+    If the binary raster cache is used, the window is cut out of the memory
+    mapped raster. Otherwise only the lines of the ascii file covering the
+    window are parsed.
+
+    input: fname: file name
+           xMin, xMax, yMin, yMax: bounding box
+           cfgRaster: RASTER configuration section (optional, read from
+           avaframeCfg.ini if not given)
+    returns: window: dictionary (see getRasterWindow)
+    """
+    if cfgRaster is None:
+        cfgRaster = getRasterConfig()
+    dtype = getRasterDtype(cfgRaster)
+
+    if _isTiledRaster(fname):
+        window = _tileUtils().readTiledWindow(fname, xMin, xMax, yMin, yMax)
+        window['rasterData'] = window['rasterData'].astype(dtype, copy=False)
+        return window
+
+    if cfgRaster is not None and cfgRaster.getboolean('useCache', fallback=False):
+        return getRasterWindow(readRaster(fname, cfgRaster=cfgRaster), xMin, xMax, yMin, yMax)
+
+    log.debug('Reading window of dem : %s', fname)
+    with _openASC(fname) as infile:
+        header = _parseASCheader([infile.readline() for i in range(6)])
+        row0, row1, col0, col1 = _getWindowIndices(header, xMin, xMax, yMin, yMax)
+        # the file starts with the northern most row
+        lineStart = header.nrows - 1 - row1
+        for i in range(lineStart):
+            infile.readline()
+        lines = [infile.readline() for i in range(row1 - row0 + 1)]
+    data = np.fromstring(''.join(lines), dtype=dtype, sep=' ')
+    if data.size != (row1 - row0 + 1) * header.ncols:
+        # data rows are wrapped over several lines, read the full raster
+        return getRasterWindow(readRaster(fname, cfgRaster=cfgRaster), xMin, xMax, yMin, yMax)
+
+    data = data.reshape((row1 - row0 + 1, header.ncols))[:, col0:col1+1]
+    data[data == header.noDataValue] = np.NaN
+    return _makeWindow(header, np.flipud(data), row0, col0)
+
+
+# RASTER section of the general configuration, read once (see getRasterConfig)
+_rasterConfig = {}
+
+
+def getRasterConfig():
+    """ Return the RASTER section of the general configuration
+
+    avaframeCfg.ini is only read at the first call, later calls return the
+    same section.
+
+    returns: configparser section or None if avaframeCfg.ini has no RASTER section
+    """
+    if 'cfgRaster' not in _rasterConfig:
+        cfgMain = cfgUtils.getGeneralConfig()
+        _rasterConfig['cfgRaster'] = cfgMain['RASTER'] if cfgMain.has_section('RASTER') else None
+    return _rasterConfig['cfgRaster']
+
+
+def getRasterDtype(cfgRaster):
+    """ Return the dtype of raster data
+
+    input: cfgRaster: RASTER configuration section or None
+    returns: numpy dtype set by precision (float32 or float64, float64 if
+             cfgRaster is None or has no precision)
+    """
+    precision = 'float64'
+    if cfgRaster is not None:
+        precision = cfgRaster.get('precision', fallback='float64')
+    if precision not in ['float32', 'float64']:
+        raise ValueError('Unknown raster precision %s - options are float32 or float64' % precision)
+    return np.dtype(precision)
+
+
+def _getCacheDir(fname, cfgRaster):
+    """ Return the cache directory of a raster
+
+    Without cacheDir, the cache is Work/rasterCache of the avalanche directory
+    (the folder containing the Inputs, Outputs or Work folder of the raster)
+    or of the current directory for rasters outside of an avalanche directory.
+    """
+    cacheDir = cfgRaster.get('cacheDir', fallback='')
+    if cacheDir != '':
+        return cacheDir
+    return os.path.join(_getWorkDir(fname), 'rasterCache')
+
+
+def _getWorkDir(fname):
+    """ Return the Work directory of the avalanche directory of a file
+
+    The avalanche directory is the folder containing the Inputs, Outputs or
+    Work folder of the file. For files outside of an avalanche directory, the
+    Work directory of the current directory is returned.
+    """
+    parts = os.path.abspath(fname).split(os.sep)
+    for i in range(len(parts) - 2, 0, -1):
+        if parts[i] in ['Inputs', 'Outputs', 'Work']:
+            return os.path.join(os.sep.join(parts[:i]) or os.sep, 'Work')
+    return 'Work'
+
+
+def _getCacheNames(fname, cfgRaster):
+    """ Return the file names of the cached array (.npy) and its meta data (.json)
+
+    The cache files are written to the cache directory (see _getCacheDir) and
+    named after the raster and a hash of its absolute path (so that rasters
+    with the same name in different folders do not collide).
+    """
+    cacheDir = _getCacheDir(fname, cfgRaster)
+    pathHash = hashlib.sha1(os.path.abspath(fname).encode()).hexdigest()[:16]
+    cacheBase = os.path.join(cacheDir, '%s_%s' % (os.path.basename(fname), pathHash))
+    return cacheBase + '.npy', cacheBase + '.json'
+
+
+def _hashFile(fname, blockSize=2**20):
+    """ Return the sha1 hash of the file content """
+    sha = hashlib.sha1()
+    with open(fname, 'rb') as infile:
+        for block in iter(lambda: infile.read(blockSize), b''):
+            sha.update(block)
+    return sha.hexdigest()
+
+
+def _header2dict(header):
+    """ Convert a cASCheader to a dictionary (for json) """
+    return {key: getattr(header, key) for key in ['nrows', 'ncols', 'cellsize', 'xllcorner',
+                                                  'xllcenter', 'yllcorner', 'yllcenter',
+                                                  'noDataValue']}
+
+
+def _dict2header(headerDict):
+    """ Convert a dictionary back to a cASCheader """
+    header = cASCheader()
+    for key, value in headerDict.items():
+        setattr(header, key, value)
+    return header
+
+
+def readRasterCache(fname, cfgRaster):
+    """ Read a raster from its binary cache
+
+    The cache is used if the size of the source file did not change and either
+    its modification time or (if only the modification time changed, e.g. after
+    copying) its content hash is the same as when the cache was written.
+    The array is memory mapped copy on write, so changing it does not
+    affect the cache.
+
+    input: fname: file name of the .asc raster
+           cfgRaster: RASTER configuration section
+    returns: dem: dictionary with header and rasterData, None if there is no
+             valid cache
+    """
+    cacheFile, metaFile = _getCacheNames(fname, cfgRaster)
+    if not (os.path.isfile(cacheFile) and os.path.isfile(metaFile)):
+        return None
+
+    try:
+        with open(metaFile, 'r') as infile:
+            meta = json.load(infile)
+    except (OSError, ValueError):
+        log.warning('Could not read raster cache meta data %s' % metaFile)
+        return None
+
+    fileStat = os.stat(fname)
+    if meta.get('size') != fileStat.st_size or meta.get('dtype') != str(getRasterDtype(cfgRaster)):
+        return None
+    if meta.get('mtime') != fileStat.st_mtime:
+        # file touched or copied, only reuse the cache if the content is unchanged
+        if meta.get('sha1') != _hashFile(fname):
+            return None
+        meta['mtime'] = fileStat.st_mtime
+        _writeJson(metaFile, meta)
+
+    log.debug('Reading dem from cache : %s', cacheFile)
+    dem = {}
+    dem['header'] = _dict2header(meta['header'])
+    dem['rasterData'] = np.load(cacheFile, mmap_mode='c')
+    # mark as recently used for pruning the cache directory
+    os.utime(cacheFile)
+    return dem
+
+
+def writeRasterCache(fname, dem, cfgRaster):
+    """ Write the binary cache of a raster
+
+    The array is saved as .npy and the header together with size, modification
+    time and content hash of the source file as .json. Both files are written
+    to a temporary file first and then moved, so that a concurrent read never
+    sees half written files.
+
+    input: fname: file name of the .asc raster
+           dem: dictionary with header and rasterData (as returned by readRaster)
+           cfgRaster: RASTER configuration section
+    """
+    cacheFile, metaFile = _getCacheNames(fname, cfgRaster)
+    cacheDir = os.path.dirname(cacheFile)
+    try:
+        os.makedirs(cacheDir, exist_ok=True)
+        fileStat = os.stat(fname)
+        meta = {'source': os.path.abspath(fname), 'size': fileStat.st_size,
+                'mtime': fileStat.st_mtime, 'sha1': _hashFile(fname),
+                'dtype': str(dem['rasterData'].dtype), 'header': _header2dict(dem['header'])}
+        tmpFile = '%s.%d.tmp' % (cacheFile, os.getpid())
+        with open(tmpFile, 'wb') as outfile:
+            np.save(outfile, np.ascontiguousarray(dem['rasterData']))
+        os.replace(tmpFile, cacheFile)
+        _writeJson(metaFile, meta)
+    except OSError as e:
+        log.warning('Could not write raster cache for %s: %s' % (fname, e))
+        return
+
+    pruneRasterCache(cacheDir, cfgRaster.getfloat('maxCacheSize', fallback=0), keep=cacheFile)
+
+
+def _writeJson(fname, content):
+    """ Write content to a json file (via a temporary file) """
+    tmpFile = '%s.%d.tmp' % (fname, os.getpid())
+    with open(tmpFile, 'w') as outfile:
+        json.dump(content, outfile)
+    os.replace(tmpFile, fname)
+
+
+def pruneRasterCache(cacheDir, maxCacheSize, keep=None):
+    """ Remove the least recently used rasters from the cache directory
+
+    input: cacheDir: cache directory
+           maxCacheSize: maximum size of all cached arrays in MB (0: no limit)
+           keep: cache file that is never removed (e.g. the one just written)
+    """
+    if maxCacheSize <= 0:
+        return
+    cacheFiles = []
+    for name in os.listdir(cacheDir):
+        if name.endswith('.npy'):
+            cacheFile = os.path.join(cacheDir, name)
+            fileStat = os.stat(cacheFile)
+            cacheFiles.append((fileStat.st_mtime, fileStat.st_size, cacheFile))
+
+    totalSize = sum(size for mtime, size, cacheFile in cacheFiles)
+    for mtime, size, cacheFile in sorted(cacheFiles):
+        if totalSize <= maxCacheSize * 1.e6:
+            break
+        if keep is not None and os.path.abspath(cacheFile) == os.path.abspath(keep):
+            continue
+        log.debug('Removing %s from raster cache' % cacheFile)
+        os.remove(cacheFile)
+        metaFile = cacheFile[:-len('.npy')] + '.json'
+        if os.path.isfile(metaFile):
+            os.remove(metaFile)
+        totalSize -= size
+
+
+def writeResultToAsc(header, resultArray, outFileName, flip=False, precision=6, blockSize=2**20):
+    """ Write a raster to an ascii file
+
+    The data is written in blocks of rows (one formatted write per block),
+    NaN values are written as noDataValue. The header values are written
+    with full precision, so that readASCheader returns exactly the same header.
+    If outFileName ends with .gz, the file is gzip compressed.
+
+    input: header: ascHeader of the raster (see class cASCheader)
+           resultArray: numpy array of shape (nrows, ncols)
+           outFileName: name of the file to write
+           flip: True if the first row of resultArray is the southern most one
+           (as returned by readRaster)
+           precision: number of decimals
+           blockSize: approximate number of values written per block
+    """
+    nrows, ncols = np.shape(resultArray)
+    if (header.nrows, header.ncols) != (nrows, ncols):
+        raise ValueError('Shape of array (%d, %d) does not fit the header (nrows x ncols = %d x %d)' %
+                         (nrows, ncols, header.nrows, header.ncols))
+    if flip:
+        resultArray = np.flipud(resultArray)
+    noDataValue = header.noDataValue if header.noDataValue is not None else -9999
+
+    # format string for a block of rows
+    rowFormat = ' '.join(['%%.%df' % precision] * ncols) + '\n'
+    nBlockRows = max(1, blockSize // ncols)
+
+    with _openASC(outFileName, 'w') as outfile:
+        outfile.write('ncols %d\n' % ncols)
+        outfile.write('nrows %d\n' % nrows)
+        outfile.write('xllcorner %r\n' % float(header.xllcorner))
+        outfile.write('yllcorner %r\n' % float(header.yllcorner))
+        outfile.write('cellsize %r\n' % float(header.cellsize))
+        outfile.write('nodata_value %r\n' % float(noDataValue))
+        for row0 in range(0, nrows, nBlockRows):
+            block = np.array(resultArray[row0:row0+nBlockRows], dtype=np.float64)
+            block[np.isnan(block)] = noDataValue
+            outfile.write((rowFormat * block.shape[0]) % tuple(block.ravel()))
+
+    log.debug('Raster written to: %s' % outFileName)
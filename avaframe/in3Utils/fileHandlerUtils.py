@@ -7,12 +7,15 @@
 # Load modules
 import os
 import glob
+import hashlib
+import json
 import logging
 import numpy as np
 import shutil
 
 # Local imports
 import avaframe.in3Utils.ascUtils as IOf
+import avaframe.in3Utils.tileUtils as tileU
 
 
 # create local logger
@@ -86,8 +89,12 @@ def getDFAData(avaDir, workDir, suffix, nameDir=''):
             if nameDir == '':
                 shutil.copy(data['files'][m], workDir)
             else:
-                shutil.copy(data['files'][m], '%s/%s/%06d.txt' % (workDir, nameDir, countsuf+1))
-                print(data['files'][m], '%s/%s/%06d.txt' % (workDir, nameDir, countsuf+1))
+                # tiled rasters keep their extension, ascii rasters are saved as .txt
+                ext = os.path.splitext(data['files'][m])[1]
+                if ext != '.npz':
+                    ext = '.txt'
+                shutil.copy(data['files'][m], '%s/%s/%06d%s' % (workDir, nameDir, countsuf+1, ext))
+                print(data['files'][m], '%s/%s/%06d%s' % (workDir, nameDir, countsuf+1, ext))
             countsuf = countsuf + 1
 
 
@@ -122,15 +129,25 @@ def getRefData(avaDir, outputDir, suffix, nameDir=''):
         log.info('Reference files copied from directory: %s' % refDir)
 
 
-def exportcom1DFAOutput(avaDir):
+def exportcom1DFAOutput(avaDir, cfg=None):
     """ Export the simulation results from com1DFA output to desired location
 
         Inputs:     avaDir:     name of avalanche
-                    workDir:    directory where data shall be exported to
+                    cfg:        GENERAL section of the com1DFA configuration (optional),
+                                peakFormat and tileSize set the format of the peak files
 
         Outputs:    simulation result files saved to Outputs/com1DFA
     """
 
+    # Format of the peak files, asc or compressed tiled rasters (npz)
+    peakFormat = 'asc'
+    tileSize = 256
+    if cfg is not None:
+        peakFormat = cfg.get('peakFormat', fallback='asc')
+        tileSize = cfg.getint('tileSize', fallback=256)
+    if peakFormat not in ['asc', 'npz']:
+        raise ValueError('Unknown peakFormat %s - options are asc or npz' % peakFormat)
+
     # Initialise directories
     inputDir = os.path.join(avaDir, 'Work', 'com1DFA')
     outDir = os.path.join(avaDir, 'Outputs', 'com1DFA')
@@ -152,15 +169,14 @@ def exportcom1DFAOutput(avaDir):
 
     # Export peak files and reports
     for k in range(sNo):
-        shutil.copy('%s%.03f/%s/raster/%s_pfd.asc' % (resPath, logDict['Mu'][k], logDict['simName'][k],
-                    logDict['simName'][k]),
-                    '%s/%s_%s_pfd.asc' % (outDirPF, logDict['simName'][k], logDict['Mu'][k]))
-        shutil.copy('%s%.03f/%s/raster/%s_ppr.asc' % (resPath, logDict['Mu'][k], logDict['simName'][k],
-                    logDict['simName'][k]),
-                    '%s/%s_%s_ppr.asc' % (outDirPF, logDict['simName'][k], logDict['Mu'][k]))
-        shutil.copy('%s%.03f/%s/raster/%s_pv.asc' % (resPath, logDict['Mu'][k], logDict['simName'][k],
-                    logDict['simName'][k]),
-                    '%s/%s_%s_pv.asc' % (outDirPF, logDict['simName'][k], logDict['Mu'][k]))
+        for resType in ['pfd', 'ppr', 'pv']:
+            peakFile = '%s%.03f/%s/raster/%s_%s.asc' % (resPath, logDict['Mu'][k], logDict['simName'][k],
+                                                        logDict['simName'][k], resType)
+            outFile = '%s/%s_%s_%s' % (outDirPF, logDict['simName'][k], logDict['Mu'][k], resType)
+            if peakFormat == 'npz':
+                tileU.convertAscToTiled(peakFile, outFile + '.npz', tileSize=tileSize)
+            else:
+                shutil.copy(peakFile, outFile + '.asc')
         shutil.copy('%s%.03f/%s.html' % (resPath, logDict['Mu'][k], logDict['simName'][k]),
                     '%s/%s_%s.html' % (outDirRep, logDict['simName'][k], logDict['Mu'][k]))
 
@@ -168,7 +184,7 @@ def exportcom1DFAOutput(avaDir):
     shutil.copy2('%s/ExpLog.txt' % inputDir, outDir)
 
 
-def makeSimDict(inputDir):
+def makeSimDict(inputDir, useIndex=True):
     """ Create a dictionary that contains all info on simulations:
 
             files:          full file path
@@ -178,28 +194,95 @@ def makeSimDict(inputDir):
             releaseArea:    release area
             Mu:             value of Mu parameter
             cellSize:       cell size of raster file
+
+        If useIndex is True, the info of every file is kept in an index file
+        (see getSimDictIndexFile), so that only the headers of new or
+        modified files have to be read.
     """
 
-    # Load input datasets from input directory
-    datafiles = glob.glob(inputDir+os.sep + '*.asc')
+    # Load input datasets from input directory (ascii or tiled rasters)
+    datafiles = glob.glob(inputDir+os.sep + '*.asc') + glob.glob(inputDir+os.sep + '*.npz')
 
     # Sort datafiles by name
     datafiles = sorted(datafiles)
 
+    # Read index of the directory
+    indexFile = getSimDictIndexFile(inputDir)
+    index = readSimDictIndex(indexFile) if useIndex else {}
+    indexNew = {}
+
     # Make dictionary of input data info
     data = {'files': [], 'names': [], 'resType': [], 'simType': [],
             'releaseArea': [], 'cellSize' : [], 'Mu' : []}
 
     for m in range(len(datafiles)):
+        fileName = os.path.basename(datafiles[m])
+        fileStat = os.stat(datafiles[m])
+        fileInfo = index.get(fileName)
+        if fileInfo is None or fileInfo['mtime'] != fileStat.st_mtime or fileInfo['size'] != fileStat.st_size:
+            name = os.path.splitext(fileName)[0]
+            nameParts = name.split('_')
+            header = IOf.readASCheader(datafiles[m])
+            fileInfo = {'mtime': fileStat.st_mtime, 'size': fileStat.st_size, 'name': name,
+                        'releaseArea': nameParts[0], 'simType': nameParts[1], 'Mu': nameParts[3],
+                        'resType': nameParts[4], 'header': IOf._header2dict(header)}
+        indexNew[fileName] = fileInfo
+
         data['files'].append(datafiles[m])
-        name = os.path.splitext(os.path.basename(datafiles[m]))[0]
-        data['names'].append(name)
-        nameParts = name.split('_')
-        data['releaseArea'].append(nameParts[0])
-        data['simType'].append(nameParts[1])
-        data['Mu'].append(nameParts[3])
-        data['resType'].append(nameParts[4])
-        header = IOf.readASCheader(datafiles[m])
-        data['cellSize'].append(header.cellsize)
+        data['names'].append(fileInfo['name'])
+        data['releaseArea'].append(fileInfo['releaseArea'])
+        data['simType'].append(fileInfo['simType'])
+        data['Mu'].append(fileInfo['Mu'])
+        data['resType'].append(fileInfo['resType'])
+        data['cellSize'].append(fileInfo['header']['cellsize'])
+
+    # Save index if files were added, modified or removed
+    if useIndex and indexNew != index:
+        writeSimDictIndex(indexFile, indexNew)
 
     return data
+
+
+def getSimDictIndexFile(inputDir):
+    """ Return the index file of makeSimDict for inputDir
+
+        The index is kept in Work/simDictIndex of the avalanche directory (see
+        ascUtils._getWorkDir), not in inputDir, so that output and reference
+        directories are not changed. It is named after inputDir and a hash of
+        its absolute path.
+    """
+
+    indexDir = os.path.join(IOf._getWorkDir(os.path.join(inputDir, 'simDictIndex.json')), 'simDictIndex')
+    pathHash = hashlib.sha1(os.path.abspath(inputDir).encode()).hexdigest()[:16]
+    dirName = os.path.basename(os.path.normpath(inputDir))
+    return os.path.join(indexDir, '%s_%s.json' % (dirName, pathHash))
+
+
+def readSimDictIndex(indexFile):
+    """ Read the index of makeSimDict, returns an empty index if the file
+        does not exist or can not be read """
+
+    if not os.path.isfile(indexFile):
+        return {}
+    try:
+        with open(indexFile, 'r') as infile:
+            index = json.load(infile)
+    except (OSError, ValueError):
+        log.warning('Could not read index %s - index is rebuilt' % indexFile)
+        return {}
+    if index.get('version') != 1:
+        return {}
+    return index['files']
+
+
+def writeSimDictIndex(indexFile, index):
+    """ Write the index of makeSimDict (via a temporary file) """
+
+    tmpFile = '%s.%d.tmp' % (indexFile, os.getpid())
+    try:
+        os.makedirs(os.path.dirname(indexFile), exist_ok=True)
+        with open(tmpFile, 'w') as outfile:
+            json.dump({'version': 1, 'files': index}, outfile)
+        os.replace(tmpFile, indexFile)
+    except OSError as e:
+        log.warning('Could not write index %s: %s' % (indexFile, e))
@@ -13,6 +13,9 @@ import os
 import configparser
 import logging
 
+# Local imports
+import avaframe.in3Utils.ascUtils as IOf
+
 # create local logger
 # change log level in calling module to DEBUG to see log messages
 log = logging.getLogger(__name__)
@@ -411,23 +414,17 @@ def writeDEM(cfg, z, outDir):
     nCols = z.shape[1]
 
     # Read lower left corner coordinates, cellsize and noDATA value
-    xllcorner = float(cfg['DEMDATA']['xl'])
-    yllcorner = float(cfg['DEMDATA']['yl'])
-    cellsize = float(cfg['TOPO']['dx'])
-    noDATA = float(cfg['DEMDATA']['nodata_value'])
+    header = IOf.cASCheader()
+    header.nrows = nRows
+    header.ncols = nCols
+    header.xllcorner = float(cfg['DEMDATA']['xl'])
+    header.yllcorner = float(cfg['DEMDATA']['yl'])
+    header.cellsize = float(cfg['TOPO']['dx'])
+    header.noDataValue = float(cfg['DEMDATA']['nodata_value'])
     dem_name = cfg['DEMDATA']['dem_name']
 
     # Save elevation data to .asc file and add header lines
-    z_mat = np.matrix(z)
-    with open(os.path.join(outDir, '%s_%s_Topo.asc' % (dem_name, nameExt)), 'w') as f:
-        f.write('nCols  %d\n' % (nCols))
-        f.write('nRows  %d\n' % (nRows))
-        f.write('xllcorner  %.02f\n' % (xllcorner))
-        f.write('yllcorner %.02f\n' % (yllcorner))
-        f.write('cellsize  %d\n' % (cellsize))
-        f.write('nodata_value %.02f\n' % (noDATA))
-        for line in z_mat:
-            np.savetxt(f, line, fmt='%f')
+    IOf.writeResultToAsc(header, z, os.path.join(outDir, '%s_%s_Topo.asc' % (dem_name, nameExt)))
 
     # Log info here
     log.info('DEM written to: %s/%s_%s_Topo.asc' % (outDir, dem_name, nameExt))
@@ -0,0 +1,141 @@
+"""
+    Compressed tiled raster store
+
+    A raster is saved as a compressed numpy archive (.npz) that contains the
+    header (as json string) and the raster data split into square tiles
+    (tile_i_j holds rows i*tileSize to (i+1)*tileSize and the corresponding
+    columns). Only the tiles that are accessed are decompressed, so windows of
+    a raster can be read without reading the whole file.
+
+    This file is part of Avaframe.
+"""
+
+import json
+import logging
+import configparser
+import numpy as np
+
+# Local imports
+import avaframe.in3Utils.ascUtils as IOf
+
+
+# create local logger
+log = logging.getLogger(__name__)
+
+
+def isTiledRaster(fname):
+    """ True if fname is a tiled raster file (.npz) """
+    return IOf._isTiledRaster(fname)
+
+
+def writeTiledRaster(fname, header, rasterData, tileSize=256):
+    """ Write a raster to a compressed tiled raster file
+
+    input: fname: file name (.npz)
+           header: ascHeader of the raster (see ascUtils.cASCheader)
+           rasterData: numpy array of shape (nrows, ncols), first row is the
+           southern most one (as returned by ascUtils.readRaster)
+           tileSize: number of rows and columns of a tile
+    """
+    nrows, ncols = np.shape(rasterData)
+    if (header.nrows, header.ncols) != (nrows, ncols):
+        raise ValueError('Shape of array (%d, %d) does not fit the header (nrows x ncols = %d x %d)' %
+                         (nrows, ncols, header.nrows, header.ncols))
+
+    headerDict = IOf._header2dict(header)
+    headerDict['tileSize'] = tileSize
+    headerDict['dtype'] = str(rasterData.dtype)
+    tiles = {'header': np.array(json.dumps(headerDict))}
+    for i in range(int(np.ceil(nrows / tileSize))):
+        for j in range(int(np.ceil(ncols / tileSize))):
+            tiles['tile_%d_%d' % (i, j)] = rasterData[i*tileSize:(i+1)*tileSize, j*tileSize:(j+1)*tileSize]
+
+    # np.savez_compressed adds .npz to the file name if it is missing
+    with open(fname, 'wb') as outfile:
+        np.savez_compressed(outfile, **tiles)
+    log.debug('Tiled raster written to: %s' % fname)
+
+
+def _readHeader(tiledFile):
+    """ Read header, tile size and dtype from an opened tiled raster file """
+    headerDict = json.loads(str(tiledFile['header']))
+    tileSize = headerDict.pop('tileSize')
+    dtype = headerDict.pop('dtype')
+    return IOf._dict2header(headerDict), tileSize, dtype
+
+
+def readTiledHeader(fname):
+    """ Read the header of a tiled raster file
+
+    input: fname: file name (.npz)
+    returns: ascHeader (see ascUtils.cASCheader)
+    """
+    with np.load(fname) as tiledFile:
+        header = _readHeader(tiledFile)[0]
+    return header
+
+
+def _readTiles(tiledFile, row0, row1, col0, col1):
+    """ Read the cells of rows row0 to row1 and columns col0 to col1 (inclusive) """
+    header, tileSize, dtype = _readHeader(tiledFile)
+    data = np.empty((row1 - row0 + 1, col1 - col0 + 1), dtype=dtype)
+    for i in range(row0 // tileSize, row1 // tileSize + 1):
+        for j in range(col0 // tileSize, col1 // tileSize + 1):
+            tile = tiledFile['tile_%d_%d' % (i, j)]
+            # part of the tile inside the window (in full raster indices)
+            r0 = max(row0, i*tileSize)
+            r1 = min(row1 + 1, i*tileSize + tile.shape[0])
+            c0 = max(col0, j*tileSize)
+            c1 = min(col1 + 1, j*tileSize + tile.shape[1])
+            data[r0-row0:r1-row0, c0-col0:c1-col0] = tile[r0-i*tileSize:r1-i*tileSize,
+                                                          c0-j*tileSize:c1-j*tileSize]
+    return header, data
+
+
+def readTiledRaster(fname):
+    """ Read a tiled raster file
+
+    input: fname: file name (.npz)
+    returns: dem: dictionary with header and rasterData (as ascUtils.readRaster)
+    """
+    log.debug('Reading tiled dem : %s', fname)
+    with np.load(fname) as tiledFile:
+        header = _readHeader(tiledFile)[0]
+        header, data = _readTiles(tiledFile, 0, header.nrows - 1, 0, header.ncols - 1)
+    dem = {}
+    dem['header'] = header
+    dem['rasterData'] = data
+    return dem
+
+
+def readTiledWindow(fname, xMin, xMax, yMin, yMax):
+    """ Read the window of a tiled raster file covering a bounding box
+
+    Only the tiles overlapping the window are read.
+
+    input: fname: file name (.npz)
+           xMin, xMax, yMin, yMax: bounding box
+    returns: window: dictionary (see ascUtils.getRasterWindow)
+    """
+    log.debug('Reading window of tiled dem : %s', fname)
+    with np.load(fname) as tiledFile:
+        header = _readHeader(tiledFile)[0]
+        row0, row1, col0, col1 = IOf._getWindowIndices(header, xMin, xMax, yMin, yMax)
+        header, data = _readTiles(tiledFile, row0, row1, col0, col1)
+    return IOf._makeWindow(header, data, row0, col0)
+
+
+def convertAscToTiled(ascFile, tiledFile, tileSize=256):
+    """ Convert an ascii raster file to a tiled raster file
+
+    The raster is stored in float64 whatever the precision set in the RASTER
+    section of avaframeCfg.ini, so that no values of the ascii file are lost.
+
+    input: ascFile: file name of the ascii raster
+           tiledFile: file name of the tiled raster (.npz)
+           tileSize: number of rows and columns of a tile
+    """
+    cfg = configparser.ConfigParser()
+    cfg['RASTER'] = {'precision': 'float64', 'useCache': 'False'}
+    dem = IOf.readRaster(ascFile, cfgRaster=cfg['RASTER'])
+    writeTiledRaster(tiledFile, dem['header'], dem['rasterData'], tileSize=tileSize)
@@ -4,8 +4,8 @@
     This file is part of Avaframe.
 """
 
-import pickle
 import os
+import csv
 import logging
 import copy
 import datetime
@@ -16,6 +16,7 @@ from mpl_toolkits.axes_grid1 import make_axes_locatable
 import seaborn as sns
 
 # Local imports
+from avaframe.com2AB import com2AB
 from avaframe.out3SimpPlot.plotSettings import *
 
 # create local logger
@@ -25,24 +26,6 @@ colors = ["#393955", "#8A8A9B", "#E9E940"]
 mpl.rcParams['axes.prop_cycle'] = mpl.cycler(color=colors)
 
 
-def readABresults(saveOutPath, name, flags):
-    """ read the results generated by com2AB """
-    savename = name + '_com2AB_eqparam.pickle'
-    save_file = os.path.join(saveOutPath, savename)
-    with open(save_file, 'rb') as handle:
-        eqParams = pickle.load(handle)
-    if not flags.getboolean('fullOut'):
-        os.remove(save_file)
-    savename = name + '_com2AB_eqout.pickle'
-    save_file = os.path.join(saveOutPath, savename)
-    with open(save_file, 'rb') as handle:
-        eqOut = pickle.load(handle)
-    if not flags.getboolean('fullOut'):
-        os.remove(save_file)
-
-    return eqParams, eqOut
-
-
 def processABresults(eqParams, eqOut):
     """ prepare AlphaBeta results for plotting and writing results """
 
@@ -103,17 +86,30 @@ def processABresults(eqParams, eqOut):
     return eqOut
 
 
-def writeABpostOut(DGM, Avapath, SplitPoint, saveOutPath, flags):
+def writeABpostOut(DGM, Avapath, SplitPoint, saveOutPath, flags, resAB=None):
     """ Loops on the given Avapath, runs AlpahBeta Postprocessing
     plots Results and Write Results
+    The results are taken from the table resAB (see com2AB.com2ABMain), one
+    row per path of Avapath in the same order.
+    With the flag writeTable, the results of all paths are also appended to
+    the table com2AB_results.csv in saveOutPath (see writeABtable)
     """
-    NameAva = Avapath['Name']
+    if resAB is None:
+        # com2ABMain used to save the results to files read here
+        raise ValueError('writeABpostOut needs the results of com2ABMain (resAB), '
+                         'the intermediate result files are not written anymore')
+    if 'fullOut' in flags:
+        log.warning('fullOut is not used anymore (no intermediate result files), '
+                    'use writeTable to save the results of all paths')
+    NameAva = resAB['Name']
     FileNamePlot_ext = [None] * len(NameAva)
     FileNameWrite_ext = [None] * len(NameAva)
-    for i in range(len(NameAva)):
-        name = NameAva[i]
-        eqParams, eqOut = readABresults(saveOutPath, name, flags)
+    eqPosts = []
+    eqParams = resAB['eqParams']
+    for i, name in enumerate(NameAva):
+        eqOut = com2AB.getABpath(resAB, i)
         eqPost = processABresults(eqParams, eqOut)
+        eqPosts.append(eqPost)
         # Plot the whole profile with beta, alpha ... points and lines
         savename = name + '_AlphaBeta.pdf'
         save_file = os.path.join(saveOutPath, savename)
@@ -121,6 +117,10 @@ def writeABpostOut(DGM, Avapath, SplitPoint, saveOutPath, flags):
         FileNamePlot_ext[i] = plotProfile(DGM, eqPost, save_file, flags)
         if flags.getboolean('WriteRes'):
             FileNameWrite_ext[i] = WriteResults(eqPost, saveOutPath)
+    if flags.getboolean('writeTable', fallback=False):
+        tableFile = os.path.join(saveOutPath, 'com2AB_results.csv')
+        writeABtable(tableFile, eqPosts)
+        log.info('Results table written to: %s', tableFile)
     if flags.getboolean('PlotPath') or flags.getboolean('PlotProfile'):
         plt.pause(0.001)
         input("Press [enter] to continue.")
@@ -331,3 +331,71 @@ def WriteResults(eqOutput, saveOutPath):
                 0))
 
     return FileName_ext
+
+
+# points written to the results table: (name, index key, angle)
+tablePoints = [('alpha', 'ids_alpha', lambda eqPost: eqPost['alpha']),
+               ('beta', 'ids10Point', lambda eqPost: eqPost['beta']),
+               ('alphaM1SD', 'ids_alphaM1SD', lambda eqPost: eqPost['alphaSD'][1]),
+               ('alphaM2SD', 'ids_alphaM2SD', lambda eqPost: eqPost['alphaSD'][2]),
+               ('alphaP1SD', 'ids_alphaP1SD', lambda eqPost: eqPost['alphaSD'][0])]
+tableColumns = ['Name', 'ParameterSet'] + [point + suffix for point, _, _ in tablePoints
+                                           for suffix in ['', 'X', 'Y', 'Z', 'S']]
+
+
+def writeABtable(fileName, eqPosts):
+    """ Write the AB results of several paths to one table (csv file)
+
+    The table has one row per path and one column per value (see
+    tableColumns): name, parameter set and for the alpha, beta and SD points
+    the angle and the coordinates (x, y, z, s) of the point (nan if the point
+    is not on the profile). If fileName exists, the rows are appended to it.
+
+    input: fileName: name of the csv file
+           eqPosts: list of results of processABresults
+    """
+    append = os.path.isfile(fileName)
+    if append:
+        with open(fileName, 'r', newline='') as infile:
+            header = next(csv.reader(infile), [])
+        if header != tableColumns:
+            raise ValueError('Columns of the existing table %s do not match the AB results' % fileName)
+    with open(fileName, 'a', newline='') as outfile:
+        writer = csv.writer(outfile)
+        if not append:
+            writer.writerow(tableColumns)
+        for eqPost in eqPosts:
+            row = [eqPost['Name'], eqPost['ParameterSet']]
+            for _, indKey, getAngle in tablePoints:
+                ind = eqPost[indKey]
+                row.append(repr(float(getAngle(eqPost))))
+                for key in ['x', 'y', 'z', 's']:
+                    row.append(repr(float(np.nan if ind is None else eqPost[key][ind])))
+            writer.writerow(row)
+
+
+def readABtable(fileName, names=None, columns=None):
+    """ Read the AB results table written by writeABtable
+
+    input: fileName: name of the csv file
+           names: list of path names to read (default: all rows)
+           columns: list of columns to read (default: all columns)
+    returns: table: dictionary with one entry per column (list of strings for
+             Name and ParameterSet, numpy array otherwise), one element per row
+    """
+    if columns is None:
+        columns = tableColumns
+    unknown = [column for column in columns if column not in tableColumns]
+    if unknown:
+        raise ValueError('Unknown columns of the AB results table: %s' % ', '.join(unknown))
+    table = {column: [] for column in columns}
+    with open(fileName, 'r', newline='') as infile:
+        for row in csv.DictReader(infile):
+            if names is not None and row['Name'] not in names:
+                continue
+            for column in columns:
+                table[column].append(row[column])
+    for column in columns:
+        if column not in ['Name', 'ParameterSet']:
+            table[column] = np.array(table[column], dtype=float)
+    return table
@@ -27,6 +27,15 @@ from avaframe.out3SimpPlot.plotSettings import *
 log = logging.getLogger(__name__)
 
 
+def readPeakData(fname):
+    """ Read a peak file (.asc or tiled .npz) as it is stored in the file:
+    first row is the northern most one and no data cells keep the no data value
+    """
+    raster = IOf.readRaster(fname)
+    data = np.flipud(raster['rasterData'])
+    return np.where(np.isnan(data), raster['header'].noDataValue, data)
+
+
 def quickPlot(avaDir, suffix, cfg, simName):
     """ Plot two raster datasets of identical dimension:
 
@@ -73,8 +82,8 @@ def quickPlot(avaDir, suffix, cfg, simName):
                 indSuffix.append(m)
 
         # Load data
-        data1 = np.loadtxt(data['files'][indSuffix[0]], skiprows=6)
-        data2 = np.loadtxt(data['files'][indSuffix[1]], skiprows=6)
+        data1 = readPeakData(data['files'][indSuffix[0]])
+        data2 = readPeakData(data['files'][indSuffix[1]])
         ny = data1.shape[0]
         nx = data1.shape[1]
         Ly = ny*cellSize
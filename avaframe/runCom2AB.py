@@ -44,15 +44,14 @@ avaPath = shpConv.readLine(cfgPath['profileLayer'], cfgPath['defaultName'], dem[
 splitPoint = shpConv.readPoints(cfgPath['splitPointSource'], dem['header'])
 
 # Calculate ALPHABETA
-com2AB.com2ABMain(dem, avaPath, splitPoint, cfgPath['saveOutPath'],
-                  cfgSetup)
+resAB = com2AB.com2ABMain(dem, avaPath, splitPoint, cfgSetup)
 
 
 # Analyse/ plot/ write results #
 plotFile, writeFile = outAB.writeABpostOut(dem,
                                            avaPath, splitPoint,
                                            cfgPath['saveOutPath'],
-                                           cfgFlags)
+                                           cfgFlags, resAB=resAB)
 
 log.info('Plotted to: %s', plotFile)
 log.info('Data written: %s', writeFile)
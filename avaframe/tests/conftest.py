@@ -0,0 +1,19 @@
+"""Shared fixtures for the tests"""
+import numpy as np
+import pytest
+
+# Local imports
+import avaframe.in3Utils.ascUtils as IOf
+
+
+@pytest.fixture
+def slopeDem():
+    '''synthetic DEM (301 x 51 cells of 10 m) sloping down in x direction'''
+    header = IOf.cASCheader()
+    header.xllcorner = 0
+    header.yllcorner = 0
+    header.cellsize = 10
+    header.ncols = 301
+    header.nrows = 51
+    x, y = np.meshgrid(np.arange(301) * 10., np.arange(51) * 10.)
+    return {'header': header, 'rasterData': 2000 * np.exp(-x / 800) + 0.01 * y}
@@ -0,0 +1,175 @@
+"""Tests for module ana3AIMEC"""
+import numpy as np
+import os
+import configparser
+
+# Local imports
+import avaframe.in3Utils.ascUtils as IOf
+from avaframe.ana3AIMEC import ana3AIMEC
+
+
+def makeRasters(tmp_path, nFiles):
+    '''write nFiles small rasters and return their names and a new grid'''
+    header = IOf.cASCheader()
+    header.nrows = 20
+    header.ncols = 30
+    header.xllcorner = 100.
+    header.yllcorner = 200.
+    header.cellsize = 5.
+    header.noDataValue = -9999.
+    x, y = np.meshgrid(np.arange(30), np.arange(20))
+    fnames = []
+    for i in range(nFiles):
+        fname = os.path.join(tmp_path, '%06d.txt' % (i+1))
+        IOf.writeResultToAsc(header, np.sin(x / (i+1)) + y * i, fname, precision=4)
+        fnames.append(fname)
+
+    # skewed grid, partly outside of the rasters
+    s, l = np.meshgrid(np.linspace(0, 1, 15), np.linspace(0, 1, 7), indexing='ij')
+    rasterTransfo = {'gridx': 90. + 150. * s + 20. * l, 'gridy': 210. + 80. * l + 10. * s,
+                     'cellsize': 5.}
+    return fnames, rasterTransfo
+
+
+def test_assignData(tmp_path):
+    '''assignData gives the same results with and without process pool'''
+    fnames, rasterTransfo = makeRasters(tmp_path, 5)
+    for interpMethod in ['bilinear', 'nearest']:
+        avalData = ana3AIMEC.assignData(fnames, rasterTransfo, interpMethod)
+        avalDataPar = ana3AIMEC.assignData(fnames, rasterTransfo, interpMethod, nCPU=3)
+        assert avalData.shape == (5, 15, 7)
+        assert np.array_equal(avalData, avalDataPar, equal_nan=True)
+        # grid points outside of the rasters are NaN
+        assert np.isnan(avalData[0][0, 0]) and not np.isnan(avalData[0][5, 3])
+
+
+def test_getMaxMeanValues(capfd):
+    '''cross section values and runout indices of all simulations at once'''
+    rasterdata = np.zeros((3, 6, 4))
+    rasterdata[0, 1:4, 1] = [2, 5, 3]
+    rasterdata[1, 2:6, 2] = [4, 4, 4, 4]
+    # threshold exceeded only in the first cross section does not count
+    rasterdata[2, 0, :] = 10
+    rasterArea = np.ones((3, 6, 4))
+    rasterArea[:, :, 3] = np.nan
+
+    ama, mma, cInd, aCrossMax = ana3AIMEC.getMaxMeanValues(rasterdata, rasterArea, 1)
+    assert np.array_equal(cInd['cupper'], [1, 2, 0])
+    assert np.array_equal(cInd['clower'], [3, 5, 0])
+    assert np.array_equal(cInd['cupperm'], [1, 2, 0])
+    assert np.array_equal(cInd['clowerm'], [3, 5, 0])
+    assert np.allclose(ama, [10/3, 4, 10])
+    assert np.array_equal(mma, [5, 4, 10])
+    assert np.array_equal(aCrossMax[0], [0, 2, 5, 3, 0, 0])
+
+    # same indices for a second field
+    ama, mma, cInd2, aCrossMax = ana3AIMEC.getMaxMeanValues(2*rasterdata, rasterArea, 1, cInd=cInd)
+    assert cInd2 is cInd
+    assert np.array_equal(mma, [10, 8, 20])
+
+
+def test_getThresholdRange(capfd):
+    '''first and last index above a threshold'''
+    exceed = np.array([[False, True, True, False, True],
+                       [True, False, False, False, False],
+                       [False, False, False, False, False]])
+    first, last, found = ana3AIMEC.getThresholdRange(exceed)
+    assert np.array_equal(first, [1, 0, 0])
+    assert np.array_equal(last, [4, 0, 0])
+    assert np.array_equal(found, [True, False, False])
+
+
+def test_cLazyRasters(tmp_path, monkeypatch):
+    '''lazily loaded rasters give the same analysis as the stacked rasters'''
+    fnames, rasterTransfo = makeRasters(tmp_path, 3)
+    avalData = ana3AIMEC.assignData(fnames, rasterTransfo, 'bilinear')
+    lazyData = ana3AIMEC.assignFieldData(fnames, rasterTransfo, 'bilinear', 1, True)
+    assert isinstance(lazyData, ana3AIMEC.cLazyRasters)
+    assert len(lazyData) == 3
+    for i in range(3):
+        assert np.array_equal(lazyData[i], avalData[i], equal_nan=True)
+
+    # the reference and the last accessed simulation are not read again
+    nRead = []
+    transform = ana3AIMEC.transform
+    monkeypatch.setattr(ana3AIMEC, 'transform', lambda *args: nRead.append(1) or transform(*args))
+    lazyData = ana3AIMEC.assignFieldData(fnames, rasterTransfo, 'bilinear', 1, True)
+    for i in [0, 1, 1, 2, 0, 2, -1]:
+        assert np.array_equal(lazyData[i], avalData[i], equal_nan=True)
+    assert len(nRead) == 3
+
+    # one simulation at a time with a common area gives the same results
+    # as all simulations with an area for each simulation
+    rasterArea = np.ones(np.shape(avalData))
+    rasterArea[np.isnan(avalData)] = np.nan
+    ama, mma, cInd, _ = ana3AIMEC.getMaxMeanValues(avalData, rasterArea, 0.5)
+    for i in range(3):
+        cIndSim = {key: value[i:i+1] for key, value in cInd.items()}
+        amaLazy, mmaLazy, _, _ = ana3AIMEC.getMaxMeanValues(lazyData[i][np.newaxis],
+                                                            rasterArea[i:i+1], 0.5, cInd=cIndSim)
+        assert amaLazy[0] == ama[i]
+        assert mmaLazy[0] == mma[i]
+    amaLazy, mmaLazy = ana3AIMEC.getFieldMaxMeanValues(lazyData, rasterArea, 0.5, cInd)
+    assert np.array_equal(ama, amaLazy)
+    assert np.array_equal(mma, mmaLazy)
+
+
+def test_makeTransfoMat(capfd):
+    '''domain grid identical to the row by row np.linspace construction'''
+    rasterTransfo = {'domainWidth': 12, 'cellsize': 1}
+    # one section parallel to the y axis (zero step in x direction)
+    rasterTransfo['DBXl'] = np.array([0., 0., 3.3, 7.1])
+    rasterTransfo['DBXr'] = np.array([10., 10., 13.7, 16.2])
+    rasterTransfo['DBYl'] = np.array([0., 4.5, 9.2, 11.])
+    rasterTransfo['DBYr'] = np.array([0., 4.5, 6.1, 8.4])
+    rasterTransfo = ana3AIMEC.makeTransfoMat(rasterTransfo)
+
+    rowsX = []
+    rowsY = []
+    for i in range(3):
+        bxl, byl, bxr, byr, m = ana3AIMEC.split_section(rasterTransfo, i)
+        last = m if i == 2 else m-1
+        for j in range(last):
+            rowsX.append(np.linspace(bxl[j], bxr[j], 13))
+            rowsY.append(np.linspace(byl[j], byr[j], 13))
+    assert np.array_equal(rasterTransfo['gridx'], np.array(rowsX))
+    assert np.array_equal(rasterTransfo['gridy'], np.array(rowsY))
+    assert np.array_equal(rasterTransfo['l'], np.arange(-6, 7))
+
+
+def test_transfoCache(tmp_path):
+    '''domain transformation cache round trip and cache key'''
+    for name in ['dem.asc', 'path_aimec.shp', 'path_aimec.dbf', 'split.shp']:
+        with open(os.path.join(tmp_path, name), 'w') as outfile:
+            outfile.write(name)
+    cfgPath = {'demSource': os.path.join(tmp_path, 'dem.asc'),
+               'profileLayer': os.path.join(tmp_path, 'path_aimec.shp'),
+               'splitPointSource': os.path.join(tmp_path, 'split.shp'),
+               'pathResult': os.path.join(tmp_path, 'Outputs', 'ana3AIMEC', 'com1DFA')}
+    cfg = configparser.ConfigParser()
+    cfg['AIMECSETUP'] = {'domainWidth': '600', 'runoutAngle': '10'}
+    header = IOf.cASCheader()
+    header.nrows = 4
+    header.ncols = 5
+
+    cacheFile = ana3AIMEC.getTransfoCacheFile(cfgPath, cfg['AIMECSETUP'], header)
+    assert os.path.dirname(cacheFile) == os.path.join(tmp_path, 'Outputs', 'ana3AIMEC', 'transfoCache')
+    assert ana3AIMEC.readTransfoCache(cacheFile) == (None, None)
+
+    rasterTransfo = {'domainWidth': 600., 'indSplit': 3, 'indRunoutPoint': np.int64(7),
+                     'gridx': np.arange(6.).reshape(2, 3), 'header': header}
+    Avapath = {'x': np.arange(3.), 'y': np.ones(3)}
+    ana3AIMEC.writeTransfoCache(cacheFile, rasterTransfo, Avapath)
+    cached, cachedPath = ana3AIMEC.readTransfoCache(cacheFile)
+    assert 'header' not in cached
+    assert cached['domainWidth'] == 600. and cached['indSplit'] == 3 and cached['indRunoutPoint'] == 7
+    assert np.array_equal(cached['gridx'], rasterTransfo['gridx'])
+    assert np.array_equal(cachedPath['x'], Avapath['x'])
+
+    # a different domain width, path or raster header gives a different cache
+    cfg['AIMECSETUP']['domainWidth'] = '400'
+    assert ana3AIMEC.getTransfoCacheFile(cfgPath, cfg['AIMECSETUP'], header) != cacheFile
+    cfg['AIMECSETUP']['domainWidth'] = '600'
+    with open(os.path.join(tmp_path, 'path_aimec.dbf'), 'w') as outfile:
+        outfile.write('new path')
+    assert ana3AIMEC.getTransfoCacheFile(cfgPath, cfg['AIMECSETUP'], header) != cacheFile
@@ -1,5 +1,9 @@
 """Tests for module com2AB"""
 import avaframe.in3Utils.ascUtils as IOf
+import numpy as np
+import pytest
+import shutil
+import configparser
 import os
 
 
@@ -21,3 +25,211 @@ def test_readASCdata2numpyArray(capfd):
 
     assert((data[0][0] == 1752.60) and (data[2][1] == 1749.10)
            and (data[0][3] == 1742.10))
+
+    # compare to numpy's reader on the test rasters
+    dataRef = np.loadtxt(DGMSource, skiprows=6)
+    assert np.array_equal(data, dataRef)
+    assert data.dtype == np.float64
+
+    header = IOf.readASCheader(DGMSource)
+    data32 = IOf.readASCdata2numpyArray(DGMSource, header, dtype=np.float32)
+    assert data32.dtype == np.float32
+    assert np.array_equal(data32, dataRef.astype(np.float32))
+
+
+def test_readASCdata2numpyArrayShape(tmp_path):
+    '''readASCdata2numpyArray raises if the data block does not fit the header'''
+    fName = os.path.join(tmp_path, 'wrongShape.asc')
+    with open(fName, 'w') as f:
+        f.write('ncols 3\nnrows 2\nxllcorner 0\nyllcorner 0\ncellsize 1\nnodata_value -9999\n')
+        f.write('1 2 3\n4 5\n')
+
+    with pytest.raises(ValueError):
+        IOf.readASCdata2numpyArray(fName)
+
+
+def test_readRasterCache(tmp_path):
+    '''readRaster uses the binary cache as long as the source is unchanged'''
+    dirname = os.path.dirname(__file__)
+    DGMSource = os.path.join(dirname, '../data/avaSlide/Inputs/slideTopo.asc')
+    fName = os.path.join(tmp_path, 'slideTopo.asc')
+    shutil.copy(DGMSource, fName)
+    cacheDir = os.path.join(tmp_path, 'cache')
+    cfg = configparser.ConfigParser()
+    cfg['RASTER'] = {'useCache': 'True', 'cacheDir': cacheDir, 'maxCacheSize': '0'}
+
+    demRef = IOf.readRaster(fName, cfgRaster=cfg['RASTER'])
+    cacheFile, metaFile = IOf._getCacheNames(fName, cfg['RASTER'])
+    assert os.path.isfile(cacheFile) and os.path.isfile(metaFile)
+
+    # second read comes from the cache
+    dem = IOf.readRaster(fName, cfgRaster=cfg['RASTER'])
+    assert isinstance(dem['rasterData'], np.memmap)
+    assert np.array_equal(dem['rasterData'], demRef['rasterData'])
+    assert IOf.isEqualASCheader(dem['header'], demRef['header'])
+    assert dem['header'].noDataValue == demRef['header'].noDataValue
+
+    # only the modification time changed (e.g. copy): cache is still valid
+    os.utime(fName, (0, 0))
+    dem = IOf.readRaster(fName, cfgRaster=cfg['RASTER'])
+    assert isinstance(dem['rasterData'], np.memmap)
+
+    # content changed: cache is rewritten
+    with open(fName, 'r') as f:
+        lines = f.readlines()
+    lines[6] = lines[6].replace('1752.60', '1752.70', 1)
+    with open(fName, 'w') as f:
+        f.writelines(lines)
+    dem = IOf.readRaster(fName, cfgRaster=cfg['RASTER'])
+    assert not isinstance(dem['rasterData'], np.memmap)
+    assert dem['rasterData'][-1, 0] == 1752.70
+    dem = IOf.readRaster(fName, cfgRaster=cfg['RASTER'])
+    assert dem['rasterData'][-1, 0] == 1752.70
+
+    # cache switched off
+    cfg['RASTER']['useCache'] = 'False'
+    dem = IOf.readRaster(fName, cfgRaster=cfg['RASTER'])
+    assert not isinstance(dem['rasterData'], np.memmap)
+
+
+def test_rasterCacheDir(tmp_path):
+    '''without cacheDir the cache is written to Work/rasterCache of the avalanche directory'''
+    dirname = os.path.dirname(__file__)
+    DGMSource = os.path.join(dirname, '../data/avaSlide/Inputs/slideTopo.asc')
+    avaDir = os.path.join(tmp_path, 'avaTest')
+    os.makedirs(os.path.join(avaDir, 'Inputs'))
+    fName = os.path.join(avaDir, 'Inputs', 'slideTopo.asc')
+    shutil.copy(DGMSource, fName)
+    cfg = configparser.ConfigParser()
+    cfg['RASTER'] = {'useCache': 'True', 'cacheDir': ''}
+
+    IOf.readRaster(fName, cfgRaster=cfg['RASTER'])
+    assert os.listdir(os.path.join(avaDir, 'Inputs')) == ['slideTopo.asc']
+    cacheFile, metaFile = IOf._getCacheNames(fName, cfg['RASTER'])
+    assert os.path.dirname(cacheFile) == os.path.join(avaDir, 'Work', 'rasterCache')
+    assert os.path.isfile(cacheFile) and os.path.isfile(metaFile)
+    assert isinstance(IOf.readRaster(fName, cfgRaster=cfg['RASTER'])['rasterData'], np.memmap)
+
+
+def test_pruneRasterCache(tmp_path):
+    '''least recently used rasters are removed if the cache is too large'''
+    dirname = os.path.dirname(__file__)
+    DGMSource = os.path.join(dirname, '../data/avaSlide/Inputs/slideTopo.asc')
+    cacheDir = os.path.join(tmp_path, 'cache')
+    cfg = configparser.ConfigParser()
+    # one cached slideTopo has about 0.67 MB
+    cfg['RASTER'] = {'useCache': 'True', 'cacheDir': cacheDir, 'maxCacheSize': '1'}
+
+    fNames = []
+    for i in range(2):
+        fName = os.path.join(tmp_path, 'topo%d.asc' % i)
+        shutil.copy(DGMSource, fName)
+        IOf.readRaster(fName, cfgRaster=cfg['RASTER'])
+        fNames.append(fName)
+        # make sure the modification times differ
+        cacheFile, metaFile = IOf._getCacheNames(fName, cfg['RASTER'])
+        os.utime(cacheFile, (i, i))
+
+    assert not os.path.isfile(IOf._getCacheNames(fNames[0], cfg['RASTER'])[0])
+    assert os.path.isfile(IOf._getCacheNames(fNames[1], cfg['RASTER'])[0])
+
+
+def test_readRasterWindow(tmp_path):
+    '''readRasterWindow returns the same cells as readRaster'''
+    dirname = os.path.dirname(__file__)
+    DGMSource = os.path.join(dirname, '../data/avaSlide/Inputs/slideTopo.asc')
+    dem = IOf.readRaster(DGMSource)
+    header = dem['header']
+    xMin = header.xllcorner + 10.2 * header.cellsize
+    xMax = header.xllcorner + 50.7 * header.cellsize
+    yMin = header.yllcorner + 20.5 * header.cellsize
+    yMax = header.yllcorner + 30 * header.cellsize
+
+    cfg = configparser.ConfigParser()
+    cfg['RASTER'] = {'useCache': 'False'}
+    window = IOf.readRasterWindow(DGMSource, xMin, xMax, yMin, yMax, cfgRaster=cfg['RASTER'])
+    assert window['windowOffset'] == (20, 10)
+    assert window['rasterData'].shape == (12, 42)
+    assert np.array_equal(window['rasterData'], dem['rasterData'][20:32, 10:52])
+    assert window['header'].xllcorner == header.xllcorner + 10 * header.cellsize
+    assert window['header'].yllcorner == header.yllcorner + 20 * header.cellsize
+    assert IOf.isEqualASCheader(window['parentHeader'], header)
+
+    # same window from the binary cache
+    cfg['RASTER'] = {'useCache': 'True', 'cacheDir': os.path.join(tmp_path, 'cache')}
+    for i in range(2):
+        windowCache = IOf.readRasterWindow(DGMSource, xMin, xMax, yMin, yMax, cfgRaster=cfg['RASTER'])
+        assert np.array_equal(windowCache['rasterData'], window['rasterData'])
+        assert windowCache['windowOffset'] == window['windowOffset']
+
+
+def test_writeResultToAsc(tmp_path):
+    '''writeResultToAsc round trips header and data through the readers'''
+    header = IOf.cASCheader()
+    header.nrows = 3
+    header.ncols = 4
+    header.xllcorner = 1000.123456789
+    header.yllcorner = -5.1
+    header.cellsize = 2.5
+    header.xllcenter = header.xllcorner + header.cellsize / 2
+    header.yllcenter = header.yllcorner + header.cellsize / 2
+    header.noDataValue = -9999
+    data = np.arange(12, dtype=float).reshape((3, 4)) / 3.
+    data[1, 2] = np.nan
+
+    for fName in ['result.asc', 'result.asc.gz']:
+        outFile = os.path.join(tmp_path, fName)
+        IOf.writeResultToAsc(header, data, outFile, flip=True, precision=4)
+        headerRead = IOf.readASCheader(outFile)
+        assert IOf.isEqualASCheader(headerRead, header)
+        assert headerRead.noDataValue == header.noDataValue
+        dem = IOf.readRaster(outFile)
+        assert np.allclose(dem['rasterData'], data, atol=5.e-5, equal_nan=True)
+        assert np.isnan(dem['rasterData'][1, 2])
+
+    # small blocks give the same file
+    IOf.writeResultToAsc(header, data, os.path.join(tmp_path, 'block.asc'), flip=True, precision=4,
+                         blockSize=1)
+    with open(os.path.join(tmp_path, 'block.asc')) as f1, open(os.path.join(tmp_path, 'result.asc')) as f2:
+        assert f1.read() == f2.read()
+
+    with pytest.raises(ValueError):
+        IOf.writeResultToAsc(header, data.T, outFile)
+
+
+def test_readASCheaderOnly(tmp_path):
+    '''readASCheader only reads the six header lines'''
+    fName = os.path.join(tmp_path, 'headerOnly.asc')
+    with open(fName, 'w') as f:
+        f.write('ncols 3\nnrows 2\nxllcenter 0.5\nyllcenter 1.5\ncellsize 1\nnodata_value -9999\n')
+        f.write('not a data line\n')
+    header = IOf.readASCheader(fName)
+    assert (header.ncols == 3) and (header.nrows == 2) and (header.noDataValue == -9999)
+    assert (header.xllcorner == 0) and (header.yllcorner == 1)
+
+
+def test_readRasterPrecision(tmp_path):
+    '''readRaster returns float32 rasters if precision is float32'''
+    dirname = os.path.dirname(__file__)
+    DGMSource = os.path.join(dirname, '../data/avaSlide/Inputs/slideTopo.asc')
+    dem = IOf.readRaster(DGMSource)
+    assert dem['rasterData'].dtype == np.float64
+
+    cfg = configparser.ConfigParser()
+    cfg['RASTER'] = {'precision': 'float32', 'useCache': 'True', 'cacheDir': os.path.join(tmp_path, 'cache')}
+    for i in range(2):
+        dem32 = IOf.readRaster(DGMSource, cfgRaster=cfg['RASTER'])
+        assert dem32['rasterData'].dtype == np.float32
+        assert np.array_equal(dem32['rasterData'], dem['rasterData'].astype(np.float32))
+    window = IOf.readRasterWindow(DGMSource, 1000, 1100, -4000, -3900, cfgRaster=cfg['RASTER'])
+    assert window['rasterData'].dtype == np.float32
+
+    # the cache is rewritten if the precision changes
+    cfg['RASTER']['precision'] = 'float64'
+    dem64 = IOf.readRaster(DGMSource, cfgRaster=cfg['RASTER'])
+    assert dem64['rasterData'].dtype == np.float64
+    assert not isinstance(dem64['rasterData'], np.memmap)
+
+    cfg['RASTER']['precision'] = 'float16'
+    with pytest.raises(ValueError):
+        IOf.readRaster(DGMSource, cfgRaster=cfg['RASTER'])
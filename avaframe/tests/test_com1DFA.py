@@ -0,0 +1,108 @@
+"""Tests for module com1DFA"""
+import os
+import sys
+import asyncio
+import configparser
+import pytest
+
+# Local imports
+from avaframe.com1DFA import com1DFA
+
+
+def test_gatherSimJobs(tmp_path):
+    '''gatherSimJobs collects the results of the jobs as for a serial run'''
+    avaDir = str(tmp_path)
+    workDir = os.path.join(avaDir, 'Work', 'com1DFA')
+    os.makedirs(workDir)
+    with open(os.path.join(workDir, 'ExpLog.txt'), 'w') as logFile:
+        logFile.write('NoOfSimulation,SimulationRunName,Mu\n')
+
+    jobs = []
+    for countRel, relName in zip([0, 2], ['release1', 'release2']):
+        jobDir = os.path.join(workDir, 'jobs', relName)
+        jobs.append({'relName': relName, 'countRel': countRel, 'jobDir': jobDir})
+        for i, simType in zip([1, 2], ['entres', 'null']):
+            simName = '%s_%s_dfa_0.155' % (relName, simType)
+            rasterDir = os.path.join(jobDir, 'FullOutput_mu_0.155', simName, 'raster')
+            os.makedirs(rasterDir)
+            with open(os.path.join(rasterDir, '%s_ppr.asc' % simName), 'w') as f:
+                f.write(relName)
+            with open(os.path.join(jobDir, 'ExpLog.txt'), 'a') as f:
+                f.write('%d  %s  0.155000\n' % (countRel + i, simName))
+
+    # results of a previous run are replaced
+    oldDir = os.path.join(workDir, 'FullOutput_mu_0.155', 'release1_null_dfa_0.155', 'raster')
+    os.makedirs(oldDir)
+    with open(os.path.join(oldDir, 'old.asc'), 'w') as f:
+        f.write('old')
+
+    com1DFA.gatherSimJobs(avaDir, jobs)
+
+    with open(os.path.join(workDir, 'ExpLog.txt'), 'r') as logFile:
+        lines = logFile.read().splitlines()
+    assert lines[0] == 'NoOfSimulation,SimulationRunName,Mu'
+    assert [line.split()[0] for line in lines[1:]] == ['1', '2', '3', '4']
+    assert lines[3].split()[1] == 'release2_entres_dfa_0.155'
+
+    resDir = os.path.join(workDir, 'FullOutput_mu_0.155')
+    assert sorted(os.listdir(resDir)) == ['release1_entres_dfa_0.155', 'release1_null_dfa_0.155',
+                                          'release2_entres_dfa_0.155', 'release2_null_dfa_0.155']
+    rasterDir = os.path.join(resDir, 'release1_null_dfa_0.155', 'raster')
+    assert os.listdir(rasterDir) == ['release1_null_dfa_0.155_ppr.asc']
+    assert not os.listdir(os.path.join(jobs[0]['jobDir'], 'FullOutput_mu_0.155'))
+
+
+def test_execSamos(tmp_path, caplog):
+    '''execSamos streams and filters the output and stops runs exceeding the timeout'''
+    avaDir = str(tmp_path)
+    os.makedirs(os.path.join(avaDir, 'Outputs', 'com1DFA'))
+    fakeSamos = os.path.join(avaDir, 'fakeSamos.py')
+    with open(fakeSamos, 'w') as f:
+        f.write('import sys, time\n'
+                'print("[BatchSamos] start", sys.argv[1:])\n'
+                'print("some output")\n'
+                'print("an error", file=sys.stderr)\n'
+                'sys.stdout.flush()\n'
+                'time.sleep(float(sys.argv[1]))\n'
+                'sys.exit(3)\n')
+
+    samosAT = '%s %s 0' % (sys.executable, fakeSamos)
+    with caplog.at_level('INFO'):
+        reVal = com1DFA.execSamos(samosAT, 'run.cint', avaDir, simName='release1')
+    assert reVal == 3
+    assert 'some output' not in caplog.text
+    assert '[BatchSamos] start' in caplog.text
+    assert 'an error' in caplog.text
+    with open(os.path.join(avaDir, 'Outputs', 'com1DFA', 'startrelease1.log'), 'r') as f:
+        lines = f.read().splitlines()
+    assert sorted(lines) == sorted(["[BatchSamos] start ['0', '-offscreen', 'run.cint']",
+                                    'some output', 'an error'])
+
+    samosAT = '%s %s 10' % (sys.executable, fakeSamos)
+    with pytest.raises(TimeoutError):
+        com1DFA.execSamos(samosAT, 'run.cint', avaDir, simName='release2', timeout=0.5)
+
+
+def test_runSimJobs(tmp_path):
+    '''a failing SamosAT step is reported with its release area after all jobs are run'''
+    avaDir = str(tmp_path)
+    os.makedirs(os.path.join(avaDir, 'Outputs', 'com1DFA'))
+    fakeSamos = os.path.join(avaDir, 'fakeSamos.py')
+    with open(fakeSamos, 'w') as f:
+        f.write('import sys\n'
+                'sys.exit(1 if "release2" in sys.argv[-1] else 0)\n')
+
+    cfg = configparser.ConfigParser()
+    cfg['GENERAL'] = {'samosAT': '%s %s' % (sys.executable, fakeSamos), 'RunCint': 'runBasic',
+                      'flagOut': 'False', 'flagVarMu': 'False', 'nCPU': '2', 'timeout': '10'}
+    jobs = []
+    for countRel, relName in zip([0, 2, 4], ['release1', 'release2', 'release3']):
+        jobDir = os.path.join(avaDir, 'Work', 'com1DFA', 'jobs', relName)
+        jobs.append({'rel': relName + '.shp', 'relName': relName, 'countRel': countRel,
+                     'jobDir': jobDir})
+
+    with pytest.raises(RuntimeError, match='release areas: release2$'):
+        asyncio.run(com1DFA.runSimJobs(cfg['GENERAL'], avaDir, 'dem.asc', 5, '', '', jobs))
+    # the other release areas are run to the end
+    logDir = os.path.join(avaDir, 'Outputs', 'com1DFA')
+    assert sorted(os.listdir(logDir)) == ['startrelease1.log', 'startrelease3.log']
@@ -114,3 +114,83 @@ def test_calcAB(capfd):
     tol = 0.001  # here 0.1% relative diff
     assert (alpha == pytest.approx(alpharef, rel=tol)) and (alphaSD[0] == pytest.approx(alphaSDref[0], rel=tol)) and (
         alphaSD[1] == pytest.approx(alphaSDref[1], rel=tol)) and (alphaSD[2] == pytest.approx(alphaSDref[2], rel=tol))
+
+
+def test_com2ABBatch(capfd, slopeDem):
+    '''com2ABBatch gives the results of com2AB path by path'''
+    dem = slopeDem
+    # the second path goes from bottom to top (is reversed)
+    Avapath = {'Name': ['path1', 'path2'], 'Start': np.array([0., 3.]), 'Length': np.array([3., 2.]),
+               'x': np.array([10., 1200., 2900., 2950., 20.]),
+               'y': np.array([100., 110., 120., 400., 350.])}
+    splitPoint = {'x': np.array([600., 800.]), 'y': np.array([100., 370.])}
+    eqParams = com2AB.setEqParameters(smallAva=False, customParam=None)
+
+    resAB = com2AB.com2ABBatch(dem, Avapath, splitPoint, eqParams, 10)
+    assert resAB['Name'] == ['path1', 'path2']
+    for i in range(2):
+        start = int(Avapath['Start'][i])
+        end = start + int(Avapath['Length'][i])
+        avapath = {'x': Avapath['x'][start:end], 'y': Avapath['y'][start:end]}
+        AvaProfile, projSplitPoint = geoTrans.prepareLine(dem, avapath, 10, splitPoint)
+        projSplitPoint, AvaProfile = geoTrans.checkProfile(AvaProfile, projSplitPoint)
+        AvaProfile['indSplit'] = projSplitPoint['indSplit']
+        eqOut = com2AB.calcAB(AvaProfile, eqParams)
+
+        eqBatch = com2AB.getABpath(resAB, i)
+        for key in ['x', 'y', 'z', 's', 'indSplit', 'CuSplit', 'ids10Point', 'beta']:
+            assert np.array_equal(eqBatch[key], eqOut[key])
+        assert np.allclose(eqBatch['poly'].coeffs, eqOut['poly'].coeffs, rtol=1.e-10)
+        assert eqBatch['alpha'] == pytest.approx(eqOut['alpha'], abs=1.e-10)
+        assert np.allclose(eqBatch['alphaSD'], eqOut['alphaSD'], rtol=0, atol=1.e-10)
+    assert eqBatch['x'][0] == 20.
+
+    # no beta point on a profile
+    Avapath['x'][2] = 1300.
+    with pytest.raises(ValueError, match='path1'):
+        com2AB.com2ABBatch(dem, Avapath, splitPoint, eqParams, 10)
+
+    # path with only one point
+    Avapath1 = {'Name': ['path0', 'path1'], 'Start': np.array([0, 1]), 'Length': np.array([1, 3]),
+                'x': Avapath['x'][2:], 'y': Avapath['y'][2:]}
+    with pytest.raises(ValueError, match='at least two points: path0$'):
+        com2AB.com2ABBatch(dem, Avapath1, splitPoint, eqParams, 10)
+
+
+def test_com2ABParallel(slopeDem):
+    '''com2ABParallel gives the results of com2ABPath in the order of the paths'''
+    dem = slopeDem
+    avapaths = [{'Name': 'path%d' % i, 'x': np.array([10., 1200., 2900.]),
+                 'y': np.array([100., 110., 120.]) + 10 * i} for i in range(5)]
+    splitPoint = {'x': np.array([600.]), 'y': np.array([100.])}
+    eqParams = com2AB.setEqParameters(smallAva=False, customParam=None)
+
+    eqOuts = list(com2AB.com2ABParallel(dem, avapaths, splitPoint, eqParams, 10, False, 2))
+    assert [eqOut['Name'] for eqOut in eqOuts] == ['path%d' % i for i in range(5)]
+    for avapath, eqPar in zip(avapaths, eqOuts):
+        eqOut = com2AB.com2ABPath(dem, avapath, splitPoint, eqParams, 10)
+        for key in ['x', 'y', 'z', 's', 'indSplit', 'ids10Point', 'beta', 'alpha', 'alphaSD']:
+            assert np.array_equal(eqPar[key], eqOut[key])
+
+    # the table of com2ABMain gives back the results of each path
+    resAB = com2AB.makeABtable(eqOuts, eqParams)
+    for i, eqOut in enumerate(eqOuts):
+        eqTable = com2AB.getABpath(resAB, i)
+        for key in ['Name', 'x', 'y', 'z', 's', 'indSplit', 'CuSplit', 'ids10Point', 'beta', 'alpha',
+                    'alphaSD', 'SDs']:
+            assert np.array_equal(eqTable[key], eqOut[key])
+        assert np.array_equal(eqTable['poly'].coeffs, eqOut['poly'].coeffs)
+
+
+def test_com2ABDeprecated(slopeDem):
+    '''the former call of com2AB with OutPath still gives the right results'''
+    avapath = {'Name': 'path0', 'x': np.array([10., 1200., 2900.]), 'y': np.array([100., 110., 120.])}
+    splitPoint = {'x': np.array([600.]), 'y': np.array([100.])}
+    eqParams, eqOut = com2AB.com2AB(slopeDem, avapath, splitPoint, True, False, 10)
+    with pytest.deprecated_call():
+        eqParamsOld, eqOutOld = com2AB.com2AB(slopeDem, avapath, splitPoint, 'outPath', True, False, 10)
+    assert eqParamsOld == eqParams
+    assert eqParams['ParameterSet'] == 'Small avalanches'
+    assert eqOutOld['alpha'] == eqOut['alpha']
+    with pytest.raises(TypeError):
+        com2AB.com2AB(slopeDem, avapath, splitPoint, 'outPath', True, False, 10, False)
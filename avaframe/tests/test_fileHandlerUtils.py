@@ -0,0 +1,60 @@
+"""Tests for module fileHandlerUtils"""
+import numpy as np
+import os
+import json
+
+# Local imports
+import avaframe.in3Utils.ascUtils as IOf
+from avaframe.in3Utils import fileHandlerUtils as fU
+
+
+def writePeakFile(fName, cellsize):
+    '''write a small peak file'''
+    with open(fName, 'w') as f:
+        f.write('ncols 3\nnrows 2\nxllcorner 0\nyllcorner 0\ncellsize %s\nnodata_value -9999\n' % cellsize)
+        f.write('1 2 3\n4 5 6\n')
+
+
+def test_makeSimDict(tmp_path):
+    '''makeSimDict keeps an index that is updated if files change'''
+    inputDir = os.path.join(tmp_path, 'Outputs', 'com1DFA', 'peakFiles')
+    os.makedirs(inputDir)
+    writePeakFile(os.path.join(inputDir, 'release1_entres_dfa_0.155_ppr.asc'), 5)
+    writePeakFile(os.path.join(inputDir, 'release1_null_dfa_0.155_pfd.asc'), 5)
+
+    data = fU.makeSimDict(inputDir)
+    assert data['names'] == ['release1_entres_dfa_0.155_ppr', 'release1_null_dfa_0.155_pfd']
+    assert data['simType'] == ['entres', 'null']
+    assert data['resType'] == ['ppr', 'pfd']
+    assert data['releaseArea'] == ['release1', 'release1']
+    assert data['Mu'] == ['0.155', '0.155']
+    assert data['cellSize'] == [5., 5.]
+    # the index is kept in Work of the avalanche directory, not in inputDir
+    indexFile = fU.getSimDictIndexFile(inputDir)
+    assert os.path.dirname(indexFile) == os.path.join(tmp_path, 'Work', 'simDictIndex')
+    assert os.path.isfile(indexFile)
+    assert sorted(os.listdir(inputDir)) == ['release1_entres_dfa_0.155_ppr.asc',
+                                            'release1_null_dfa_0.155_pfd.asc']
+
+    # second call gives the same result from the index
+    assert fU.makeSimDict(inputDir) == data
+    assert fU.makeSimDict(inputDir, useIndex=False) == data
+
+    # modified, added and removed files are taken into account
+    fName = os.path.join(inputDir, 'release1_entres_dfa_0.155_ppr.asc')
+    writePeakFile(fName, 10)
+    os.utime(fName, (1, 1))
+    os.remove(os.path.join(inputDir, 'release1_null_dfa_0.155_pfd.asc'))
+    writePeakFile(os.path.join(inputDir, 'release2_entres_dfa_0.055_pv.asc'), 5)
+    data = fU.makeSimDict(inputDir)
+    assert data['names'] == ['release1_entres_dfa_0.155_ppr', 'release2_entres_dfa_0.055_pv']
+    assert data['cellSize'] == [10., 5.]
+    with open(indexFile, 'r') as f:
+        index = json.load(f)
+    assert sorted(index['files']) == ['release1_entres_dfa_0.155_ppr.asc',
+                                      'release2_entres_dfa_0.055_pv.asc']
+
+    # a broken index is rebuilt
+    with open(indexFile, 'w') as f:
+        f.write('{broken')
+    assert fU.makeSimDict(inputDir) == data
@@ -143,6 +143,28 @@ def test_findAngleProfile(capfd):
     ids10Point = geoTrans.findAngleProfile(tmp, deltaInd)
     assert ids10Point == 9
 
+    # no long enough run or no point under the angle
+    tmp = (np.array([3, 4, 6, 7, 8]), )
+    with pytest.raises(ValueError, match='No beta point'):
+        geoTrans.findAngleProfile(tmp, deltaInd)
+    with pytest.raises(ValueError, match='No beta point'):
+        geoTrans.findAngleProfile((np.array([], dtype=int), ), deltaInd)
+
+    # batch of profiles: the same as profile by profile, runs do not go over
+    # two profiles
+    mask = np.zeros(41, dtype=bool)
+    mask[[30, 31, 32, 33, 34, 35, 38, 39, 40]] = True
+    mask2 = np.zeros(10, dtype=bool)
+    mask2[[0, 1, 2, 5, 6, 7, 8]] = True
+    iProfile = np.repeat([0, 1], [41, 10])
+    ids = geoTrans.findAngleProfileBatch(np.concatenate((mask, mask2)), iProfile, np.array([3, 2]), 2)
+    assert np.array_equal(ids, [geoTrans.findAngleProfile(np.where(mask), 3),
+                                geoTrans.findAngleProfile(np.where(mask2), 2) + 41])
+    assert np.array_equal(ids, [29, 40])
+    with pytest.raises(ValueError, match='profileB'):
+        geoTrans.findAngleProfileBatch(np.concatenate((mask, mask2)), iProfile, np.array([3, 4]), 2,
+                                       names=['profileA', 'profileB'])
+
 
 def test_path2domain(capfd):
     '''test_path2domain'''
@@ -176,3 +198,213 @@ def test_path2domain(capfd):
     zSol = np.array([ 2.23223305,  7.23223305, 12.23223305, 17.23223305, 22.23223305])
     testRes = np.allclose(DB['DBYr'], zSol, atol=atol)
     assert (testRes == True)
+
+
+def test_projectOnRasterVectWindow(capfd):
+    '''projectOnRasterVect on a raster window gives the same values as on the full raster'''
+    header = IOf.cASCheader()
+    header.xllcorner = 1
+    header.yllcorner = 2
+    header.cellsize = 1
+    header.ncols = 6
+    header.nrows = 5
+    dem = {'header': header, 'rasterData': np.arange(30, dtype=float).reshape((5, 6))}
+
+    Points = {'x': np.array([2.2, 3.5, 4.9, 3.1]), 'y': np.array([3.3, 4.5, 4.1, 3.9])}
+    for interp in ['bilinear', 'nearest']:
+        PointsRef, itot, ioobRef = geoTrans.projectOnRasterVect(dem, dict(Points), interp=interp)
+        window = IOf.getRasterWindow(dem, np.min(Points['x']), np.max(Points['x']),
+                                     np.min(Points['y']), np.max(Points['y']))
+        assert window['rasterData'].shape == (3, 4)
+        assert window['windowOffset'] == (1, 1)
+        PointsWin, itot, ioob = geoTrans.projectOnRasterVect(window, dict(Points), interp=interp)
+        assert np.array_equal(PointsWin['z'], PointsRef['z'])
+        assert ioob == ioobRef
+
+    # float32 rasters are interpolated in float32
+    dem['rasterData'] = dem['rasterData'].astype(np.float32)
+    Points32, itot, ioob = geoTrans.projectOnRasterVect(dem, dict(Points))
+    assert Points32['z'].dtype == np.float32
+    PointsRef, itot, ioob = geoTrans.projectOnRasterVect(window, dict(Points), interp='bilinear')
+    assert np.allclose(Points32['z'], PointsRef['z'], rtol=1.e-6)
+
+    # points outside of the window are out of bounds
+    PointsOut = {'x': np.array([1.5, 3.5]), 'y': np.array([2.5, 4.5])}
+    PointsOut, itot, ioob = geoTrans.projectOnRasterVect(window, PointsOut)
+    assert np.isnan(PointsOut['z'][0]) and ioob == 1
+
+
+def test_interpOperator(capfd):
+    '''sparse interpolation operator gives the values of projectOnRasterVect'''
+    header = IOf.cASCheader()
+    header.xllcorner = 1
+    header.yllcorner = 2
+    header.cellsize = 1
+    header.ncols = 6
+    header.nrows = 5
+    rasterData = np.sin(np.arange(30, dtype=float)).reshape((5, 6))
+    dem = {'header': header, 'rasterData': rasterData}
+    # last point is out of bounds
+    Points = {'x': np.array([2.2, 3.5, 4.9, 3.1, 0.5]), 'y': np.array([3.3, 4.5, 4.1, 3.9, 3.])}
+    for interp in ['bilinear', 'nearest']:
+        PointsRef, itot, ioob = geoTrans.projectOnRasterVect(dem, dict(Points), interp=interp)
+        operator = geoTrans.makeInterpOperator(dem, Points, interp=interp)
+        assert (operator['itot'], operator['ioob']) == (itot, ioob) == (5, 1)
+        values = geoTrans.applyInterpOperator(operator, rasterData)
+        assert np.allclose(values, PointsRef['z'], rtol=1.e-14, atol=0, equal_nan=True)
+
+    # stack of rasters, a nan corner gives nan (as in projectOnRasterVect)
+    stack = np.stack((rasterData, 2*rasterData))
+    stack[1, 1, 1] = np.nan
+    values = geoTrans.applyInterpOperator(operator, stack)
+    assert values.shape == (2, 5)
+    assert np.array_equal(values[0], geoTrans.applyInterpOperator(operator, rasterData), equal_nan=True)
+    assert np.isnan(values[1, 0]) and np.isnan(values[1, 4]) and not np.isnan(values[1, 1])
+
+    # the raster has to fit the operator
+    with pytest.raises(ValueError):
+        geoTrans.applyInterpOperator(operator, rasterData[1:])
+
+
+def test_projectOnRasterVectPolicies(capfd):
+    '''bicubic interpolation, out of bounds and nan policies'''
+    header = IOf.cASCheader()
+    header.xllcorner = 0
+    header.yllcorner = 0
+    header.cellsize = 2
+    header.ncols = 8
+    header.nrows = 7
+    col, row = np.meshgrid(np.arange(8.), np.arange(7.))
+    # cubic convolution reproduces quadratic functions away from the border
+    dem = {'header': header, 'rasterData': col**2 - 3*row + col*row}
+    Points = {'x': np.array([5.3, 7.9, 8.4]), 'y': np.array([4.1, 6.6, 5.7])}
+    Points, itot, ioob = geoTrans.projectOnRasterVect(dem, Points, interp='bicubic')
+    x = Points['x'] / 2
+    y = Points['y'] / 2
+    assert np.allclose(Points['z'], x**2 - 3*y + x*y, rtol=1.e-12)
+    operator = geoTrans.makeInterpOperator(dem, Points, interp='bicubic')
+    assert np.allclose(geoTrans.applyInterpOperator(operator, dem['rasterData']), Points['z'], rtol=1.e-12)
+
+    # out of bounds: nan, value at the closest raster point or error
+    Points = {'x': np.array([-3., 20., 3.]), 'y': np.array([4., 3., 3.])}
+    Points, itot, ioob = geoTrans.projectOnRasterVect(dem, Points)
+    assert np.isnan(Points['z'][0]) and np.isnan(Points['z'][1]) and ioob == 2
+    PointsClip, itot, ioob = geoTrans.projectOnRasterVect(dem, dict(Points), outOfBounds='clip')
+    assert ioob == 0
+    assert np.allclose(PointsClip['z'], [-6, 49 - 4.5 + 7*1.5, Points['z'][2]])
+    with pytest.raises(ValueError):
+        geoTrans.projectOnRasterVect(dem, Points, outOfBounds='raise')
+
+    # nan cells: propagate or normalize the weights of the other cells
+    dem['rasterData'] = np.ones((7, 8))
+    dem['rasterData'][1, 1] = np.nan
+    # (the second point is on a cell border, the nan cell has a zero weight)
+    Points = {'x': np.array([2.5, 0., 12.]), 'y': np.array([2.5, 2., 5.])}
+    Points, itot, ioob = geoTrans.projectOnRasterVect(dem, Points)
+    assert np.isnan(Points['z'][0]) and np.isnan(Points['z'][1]) and Points['z'][2] == 1
+    Points, itot, ioob = geoTrans.projectOnRasterVect(dem, Points, nanPolicy='ignore')
+    assert np.array_equal(Points['z'], [1, 1, 1])
+    with pytest.raises(ValueError):
+        geoTrans.projectOnRasterVect(dem, Points, interp='linear')
+
+
+def test_resampleLine(capfd):
+    '''resampleLine gives the points of the per segment resampling'''
+    xcoor = np.array([0., 3., 3., 10.5, 11.])
+    ycoor = np.array([0., 4., 4., 4., 2.])
+    x, y, s = geoTrans.resampleLine(xcoor, ycoor, distance=2)
+
+    xRef = [xcoor[0]]
+    yRef = [ycoor[0]]
+    sRef = [0]
+    for i in range(len(xcoor) - 1):
+        Vx = xcoor[i + 1] - xcoor[i]
+        Vy = ycoor[i + 1] - ycoor[i]
+        D = np.sqrt(Vx**2 + Vy**2)
+        nd = int(np.floor(D / 2) + 1)
+        S0 = sRef[-1]
+        for j in range(1, nd + 1):
+            xRef.append(j / nd * Vx + xcoor[i])
+            yRef.append(j / nd * Vy + ycoor[i])
+            sRef.append(S0 + D * j / nd)
+    assert np.array_equal(x, xRef)
+    assert np.array_equal(y, yRef)
+    assert np.array_equal(s, sRef)
+
+    # equal arc length
+    x, y, s = geoTrans.resampleLine(xcoor, ycoor, distance=2, equalSpacing=True)
+    ds = np.sqrt(np.diff(x)**2 + np.diff(y)**2)
+    assert len(s) == 9 and s[-1] == pytest.approx(sRef[-1])
+    assert np.allclose(np.diff(s), s[-1] / 8)
+    # (the distance between points is shorter than the arc length around corners)
+    assert np.allclose(np.delete(ds, [2, 6]), s[-1] / 8)
+    assert np.all(ds[[2, 6]] < s[-1] / 8)
+    assert x[-1] == xcoor[-1] and y[-1] == ycoor[-1]
+
+
+def test_inpolygon(capfd):
+    '''inpolygon gives the mask of the cell by cell even-odd test'''
+    xv = np.array([1, 8, 6, 3, 2, 1])
+    yv = np.array([1, 2, 7, 9, 4, 1])
+    X, Y = np.meshgrid(np.arange(11.), np.arange(10.))
+    X[2, 3] = 4.5
+    IN = geoTrans.inpolygon(X, Y, xv, yv)
+    ref = np.zeros(np.shape(X))
+    j = len(xv) - 1
+    for i in range(len(xv) - 1):
+        distance = (xv[j]-xv[i])*(Y-yv[i]) - (X-xv[i])*(yv[j]-yv[i])
+        cross = (((yv[i] <= Y) & (Y < yv[j])) | ((yv[j] <= Y) & (Y < yv[i]))) & (0 < distance*(yv[j]-yv[i]))
+        ref[cross] = 1 - ref[cross]
+        j = i
+    ref[yv[:-1], xv[:-1]] = 1
+    assert np.array_equal(IN, ref)
+    assert np.sum(IN) > 10
+
+    mask = geoTrans.poly2maskSimple(np.array([1, 8, 6]), np.array([1, 2, 7]), 10, 9)
+    assert mask.shape == (9, 10)
+    assert mask[4, 5] == 1
+    assert mask[1, 7] == 0
+
+
+def test_shpPoly2Mask(capfd):
+    '''shpPoly2Mask with several polygons'''
+    header = IOf.cASCheader()
+    header.xllcorner = 100
+    header.yllcorner = 200
+    header.cellsize = 10
+    header.ncols = 8
+    header.nrows = 6
+    # a closed square and a triangle partly out of the raster
+    Polygons = {'x': np.array([115., 145., 145., 115., 115., 160., 200., 200.]),
+                'y': np.array([205., 205., 235., 235., 205., 240., 200., 280.]),
+                'Start': np.array([0., 5.]), 'Length': np.array([5., 3.])}
+    mask = geoTrans.shpPoly2Mask(Polygons, header)
+    ref = np.zeros((6, 8))
+    ref[1:4, 2:5] = 1
+    ref[4, 6:8] = 1
+    ref[3:6, 7] = 1
+    assert np.array_equal(mask, ref)
+
+
+def test_findSplitPointIndex(capfd):
+    '''nearest profile point and projection on the profile segments'''
+    AvaProfile = {'x': np.array([0., 10., 20., 20.]), 'y': np.array([0., 0., 0., 30.]),
+                  'z': np.array([100., 90., 80., 50.]), 's': np.array([0., 10., 20., 50.])}
+    Points = {'x': np.array([14., 5., 40.]), 'y': np.array([2., 0., 14.])}
+    profileIndex = geoTrans.makeProfileIndex(AvaProfile)
+    dist, ind = geoTrans.findNearestVertex(AvaProfile, Points, profileIndex=profileIndex)
+    # the second point is at the same distance of the first two profile points
+    assert np.array_equal(ind, [1, 0, 2])
+    assert np.allclose(dist, [np.sqrt(20), 5, np.sqrt(596)])
+
+    projPoint = geoTrans.findSplitPoint(AvaProfile, Points, profileIndex=profileIndex)
+    assert projPoint['indSplit'] == 1
+    assert projPoint['s'] == 10
+
+    projPoints = geoTrans.projectOnProfile(AvaProfile, Points, profileIndex=profileIndex)
+    assert np.array_equal(projPoints['indSegment'], [1, 0, 2])
+    assert np.allclose(projPoints['x'], [14., 5., 20.])
+    assert np.allclose(projPoints['y'], [0., 0., 14.])
+    assert np.allclose(projPoints['dist'], [2., 0., 20.])
+    assert np.allclose(projPoints['s'], [14., 5., 34.])
+    assert np.allclose(projPoints['z'], [86., 95., 66.])
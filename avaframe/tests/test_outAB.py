@@ -0,0 +1,73 @@
+"""
+    Pytest for module outAB
+
+    This file is part of Avaframe.
+"""
+
+#  Load modules
+import numpy as np
+import pytest
+import configparser
+from avaframe.com2AB import com2AB
+from avaframe.out3SimpPlot import outAB
+
+
+def test_ABtable(tmp_path):
+    '''writeABtable appends rows and readABtable reads them back selectively'''
+    s = np.arange(5) * 10.
+    eqPosts = []
+    for i in range(3):
+        eqPost = {'Name': 'path%d' % i, 'ParameterSet': 'Standard', 's': s, 'x': s + i,
+                  'y': s + 100, 'z': 1000 - s, 'alpha': 25. + i, 'beta': 30. + i,
+                  'alphaSD': np.array([26.25, 23.75, 22.5]) + i, 'ids_alpha': 3, 'ids10Point': 2,
+                  'ids_alphaM1SD': 4, 'ids_alphaM2SD': None, 'ids_alphaP1SD': 1}
+        eqPosts.append(eqPost)
+    fileName = tmp_path / 'com2AB_results.csv'
+    outAB.writeABtable(fileName, eqPosts[:2])
+    outAB.writeABtable(fileName, eqPosts[2:])
+
+    table = outAB.readABtable(fileName)
+    assert table['Name'] == ['path0', 'path1', 'path2']
+    assert np.array_equal(table['alpha'], [25., 26., 27.])
+    assert np.array_equal(table['alphaX'], [30., 31., 32.])
+    assert np.array_equal(table['betaZ'], [980., 980., 980.])
+    assert np.array_equal(table['alphaP1SD'], [26.25, 27.25, 28.25])
+    assert np.all(np.isnan(table['alphaM2SDS']))
+
+    table = outAB.readABtable(fileName, names=['path2', 'path0'], columns=['Name', 'beta'])
+    assert list(table) == ['Name', 'beta']
+    assert table['Name'] == ['path0', 'path2']
+    assert np.array_equal(table['beta'], [30., 32.])
+
+    with pytest.raises(ValueError, match='Unknown columns'):
+        outAB.readABtable(fileName, columns=['gamma'])
+    with open(fileName, 'w') as outfile:
+        outfile.write('Name,alpha\n')
+    with pytest.raises(ValueError, match='do not match'):
+        outAB.writeABtable(fileName, eqPosts)
+
+
+def test_writeABpostOut(tmp_path, slopeDem):
+    '''writeABpostOut takes the results row by row, also for repeated path names'''
+    dem = slopeDem
+    Avapath = {'Name': ['path', 'path'], 'Start': np.array([0, 3]), 'Length': np.array([3, 3]),
+               'x': np.array([10., 1200., 2900., 10., 1000., 2500.]),
+               'y': np.array([100., 110., 120., 300., 310., 320.])}
+    splitPoint = {'x': np.array([600.]), 'y': np.array([100.])}
+    cfg = configparser.ConfigParser()
+    cfg['ABSETUP'] = {'smallAva': 'False', 'customParam': 'False', 'distance': '10'}
+    cfg['FLAGS'] = {'PlotPath': 'False', 'PlotProfile': 'False', 'SaveProfile': 'False',
+                    'WriteRes': 'False', 'writeTable': 'True'}
+
+    resAB = com2AB.com2ABMain(dem, Avapath, splitPoint, cfg['ABSETUP'])
+    outAB.writeABpostOut(dem, Avapath, splitPoint, str(tmp_path), cfg['FLAGS'], resAB)
+    table = outAB.readABtable(tmp_path / 'com2AB_results.csv', columns=['Name', 'betaY'])
+    assert table['Name'] == ['path', 'path']
+    assert table['betaY'][0] < 200 and table['betaY'][1] > 200
+
+    # former interface
+    with pytest.deprecated_call():
+        resABOld = com2AB.com2ABMain(dem, Avapath, splitPoint, str(tmp_path), cfg['ABSETUP'])
+    assert np.array_equal(resABOld['beta'], resAB['beta'])
+    with pytest.raises(ValueError, match='resAB'):
+        outAB.writeABpostOut(dem, Avapath, splitPoint, str(tmp_path), cfg['FLAGS'])
@@ -0,0 +1,68 @@
+"""
+    Pytest for module shpConversion
+
+    This file is part of Avaframe.
+"""
+
+#  Load modules
+import os
+import shapefile
+import numpy as np
+import pytest
+import avaframe.in2Trans.shpConversion as shpConv
+import avaframe.in3Utils.ascUtils as IOf
+
+
+def test_SHP2Array(tmp_path):
+    '''names, offsets and coordinates of the shapes'''
+    fname = os.path.join(tmp_path, 'lines.shp')
+    with shapefile.Writer(fname, shapeType=shapefile.POLYLINE) as w:
+        w.field('NAME', 'C')
+        w.field('d0', 'N', decimal=2)
+        w.line([[[0, 0], [1, 1], [2, 3]]])
+        w.record('path1', 1.5)
+        w.line([[[5, 5], [6, 7]]])
+        w.record('path2', 1.)
+    SHPdata = shpConv.SHP2Array(fname, 'defName')
+    assert SHPdata['Name'] == ['path1', 'path2']
+    assert np.array_equal(SHPdata['Start'], [0., 3.])
+    assert np.array_equal(SHPdata['Length'], [3., 2.])
+    assert np.array_equal(SHPdata['x'], [0., 1., 2., 5., 6.])
+    assert np.array_equal(SHPdata['y'], [0., 1., 3., 5., 7.])
+    assert np.array_equal(SHPdata['z'], np.zeros(5))
+    assert SHPdata['sks'] is None
+
+    # no name field: default name
+    fname = os.path.join(tmp_path, 'points.shp')
+    with shapefile.Writer(fname, shapeType=shapefile.POINT) as w:
+        w.field('other', 'C')
+        w.point(1, 2)
+        w.record('a')
+    with open(os.path.join(tmp_path, 'points.prj'), 'w') as prjf:
+        prjf.write('PROJCS["test"]\n')
+    SHPdata = shpConv.SHP2Array(fname, 'defName')
+    assert SHPdata['Name'] == ['defName']
+    assert np.array_equal(SHPdata['Start'], [0.])
+    assert np.array_equal(SHPdata['x'], [1.])
+    assert SHPdata['sks'] == 'PROJCS["test"]\n'
+
+
+def test_checkExtent(capfd):
+    '''all points outside of the dem are reported'''
+    header = IOf.cASCheader()
+    header.xllcorner = 10
+    header.yllcorner = 20
+    header.cellsize = 5
+    header.ncols = 4
+    header.nrows = 3
+    SHPdata = {'Name': ['path1', 'path2', 'path3'], 'Start': np.array([0., 2., 4.]),
+               'Length': np.array([2., 2., 3.]),
+               'x': np.array([10., 29.9, 10., 30., 9.9, 15., 20.]),
+               'y': np.array([20., 34.9, 20., 20., 20., 35., 25.])}
+    with pytest.raises(ValueError) as e:
+        shpConv.checkExtent(SHPdata, header, 'Not on dem')
+    assert str(e.value) == 'Not on dem: path2 (points 1); path3 (points 0, 1)'
+
+    SHPdata['x'][[3, 4]] = 15.
+    SHPdata['y'][5] = 30.
+    shpConv.checkExtent(SHPdata, header, 'Not on dem')
@@ -0,0 +1,84 @@
+"""Tests for module tileUtils"""
+import numpy as np
+import os
+import configparser
+
+# Local imports
+import avaframe.in3Utils.ascUtils as IOf
+import avaframe.in3Utils.tileUtils as tileU
+from avaframe.in3Utils import fileHandlerUtils as fU
+
+
+def test_tiledRaster(tmp_path):
+    '''convert an ascii raster to a tiled raster and read it back'''
+    dirname = os.path.dirname(__file__)
+    DGMSource = os.path.join(dirname, '../data/avaSlide/Inputs/slideTopo.asc')
+    dem = IOf.readRaster(DGMSource)
+    tiledFile = os.path.join(tmp_path, 'slideTopo.npz')
+    tileU.convertAscToTiled(DGMSource, tiledFile, tileSize=64)
+    assert tileU.isTiledRaster(tiledFile) and not tileU.isTiledRaster(DGMSource)
+
+    # ascUtils readers read tiled rasters as well
+    header = IOf.readASCheader(tiledFile)
+    assert IOf.isEqualASCheader(header, dem['header'])
+    assert header.noDataValue == dem['header'].noDataValue
+    demTiled = IOf.readRaster(tiledFile)
+    assert np.array_equal(demTiled['rasterData'], dem['rasterData'])
+
+    # window over several tiles
+    xMin = header.xllcorner + 60.2 * header.cellsize
+    xMax = header.xllcorner + 150.7 * header.cellsize
+    yMin = header.yllcorner + 10.5 * header.cellsize
+    yMax = header.yllcorner + 130 * header.cellsize
+    window = IOf.readRasterWindow(tiledFile, xMin, xMax, yMin, yMax)
+    windowRef = IOf.getRasterWindow(dem, xMin, xMax, yMin, yMax)
+    assert window['windowOffset'] == windowRef['windowOffset']
+    assert np.array_equal(window['rasterData'], windowRef['rasterData'])
+
+
+def test_convertAscToTiledPrecision(tmp_path, monkeypatch):
+    '''tiled rasters keep the values of the ascii file also with precision float32'''
+    dirname = os.path.dirname(__file__)
+    DGMSource = os.path.join(dirname, '../data/avaSlide/Inputs/slideTopo.asc')
+    cfg = configparser.ConfigParser()
+    cfg['RASTER'] = {'precision': 'float32'}
+    monkeypatch.setattr(IOf, 'getRasterConfig', lambda: cfg['RASTER'])
+    tiledFile = os.path.join(tmp_path, 'slideTopo.npz')
+    tileU.convertAscToTiled(DGMSource, tiledFile, tileSize=64)
+
+    demTiled = tileU.readTiledRaster(tiledFile)
+    assert demTiled['rasterData'].dtype == np.float64
+    data = IOf.readASCdata2numpyArray(DGMSource)
+    data[data == demTiled['header'].noDataValue] = np.nan
+    assert np.array_equal(demTiled['rasterData'], np.flipud(data), equal_nan=True)
+
+
+def test_tiledRasterPeakFile(tmp_path, monkeypatch):
+    '''tiled peak files are much smaller and found by makeSimDict'''
+    header = IOf.cASCheader()
+    header.nrows = 300
+    header.ncols = 400
+    header.xllcorner = 0.
+    header.yllcorner = 0.
+    header.cellsize = 5.
+    header.xllcenter = 2.5
+    header.yllcenter = 2.5
+    header.noDataValue = -9999.
+    x, y = np.meshgrid(np.arange(400), np.arange(300))
+    # avalanche covers a small part of the domain
+    data = np.round(np.maximum(0, 50 - np.sqrt((x - 200)**2 + (y - 150)**2)), 2)
+
+    ascFile = os.path.join(tmp_path, 'release1_entres_dfa_0.155_ppr.asc')
+    IOf.writeResultToAsc(header, data, ascFile, flip=True, precision=2)
+    tiledFile = os.path.join(tmp_path, 'release1_entres_dfa_0.155_ppr.npz')
+    tileU.writeTiledRaster(tiledFile, header, data)
+    assert os.path.getsize(tiledFile) * 10 < os.path.getsize(ascFile)
+    assert np.array_equal(IOf.readRaster(tiledFile)['rasterData'], data)
+
+    os.remove(ascFile)
+    # the index of makeSimDict goes to Work in the current directory
+    monkeypatch.chdir(tmp_path)
+    simDict = fU.makeSimDict(str(tmp_path))
+    assert simDict['files'] == [tiledFile]
+    assert simDict['resType'] == ['ppr'] and simDict['Mu'] == ['0.155']
+    assert simDict['cellSize'] == [5.]
@@ -0,0 +1,65 @@
+"""
+    Benchmark for the process pool of ana3AIMEC.assignData
+
+    Writes nFiles synthetic result rasters of nCells x nCells cells (default
+    16 files of 1500 x 1500 cells, use e.g. python3 benchAssignData.py 8 1000
+    for a smaller case) and times assignData with 1, 2, 4 and 8 processes
+    (at most the number of available cores).
+    Requires avaframe to be installed (e.g. pip install -e .).
+
+    This file is part of Avaframe.
+"""
+
+import os
+import sys
+import time
+import logging
+import tempfile
+import numpy as np
+
+# Local imports
+import avaframe.in3Utils.ascUtils as IOf
+from avaframe.ana3AIMEC import ana3AIMEC
+
+logging.basicConfig(level=logging.WARNING)
+log = logging.getLogger(__name__)
+log.setLevel(logging.INFO)
+
+
+if __name__ == '__main__':
+    nFiles = int(sys.argv[1]) if len(sys.argv) > 1 else 16
+    nCells = int(sys.argv[2]) if len(sys.argv) > 2 else 1500
+
+    header = IOf.cASCheader()
+    header.nrows = nCells
+    header.ncols = nCells
+    header.xllcorner = 0.
+    header.yllcorner = 0.
+    header.cellsize = 5.
+    header.noDataValue = -9999.
+    x = np.linspace(0, 1, nCells)
+
+    # path domain: 600 m wide corridor along the diagonal of the rasters
+    s, l = np.meshgrid(np.linspace(0, 1, nCells), np.linspace(-1, 1, 120), indexing='ij')
+    length = nCells * header.cellsize
+    rasterTransfo = {'gridx': 0.1 * length + 0.8 * length * s + 300 * l / np.sqrt(2),
+                     'gridy': 0.1 * length + 0.8 * length * s - 300 * l / np.sqrt(2)}
+
+    with tempfile.TemporaryDirectory() as tmpDir:
+        fnames = []
+        for i in range(nFiles):
+            fname = os.path.join(tmpDir, '%06d.txt' % (i+1))
+            z = np.maximum(0, 100 * np.sin((i + 1) * x[np.newaxis, :]) * np.cos(x[:, np.newaxis]) - 20)
+            IOf.writeResultToAsc(header, z, fname, precision=2)
+            fnames.append(fname)
+        log.info('%d rasters of %d x %d cells' % (nFiles, nCells, nCells))
+
+        tRef = None
+        for nCPU in [1, 2, 4, 8]:
+            if nCPU > 1 and nCPU > (os.cpu_count() or 1):
+                break
+            t0 = time.perf_counter()
+            ana3AIMEC.assignData(fnames, rasterTransfo, 'bilinear', nCPU=nCPU)
+            tAssign = time.perf_counter() - t0
+            tRef = tRef or tAssign
+            log.info('nCPU {:d} {:>8.3f} s speedup {:>5.2f}'.format(nCPU, tAssign, tRef / tAssign))
@@ -0,0 +1,58 @@
+"""
+    Benchmark for com2AB with many avalanche paths
+
+    Generates nPaths straight avalanche paths (default 1000, use e.g.
+    python3 benchCom2ABBatch.py 200 for less) on a synthetic DEM of 1000 x 2000
+    cells and times com2ABMain path by path and with batch = True.
+    Requires avaframe to be installed (e.g. pip install -e .).
+
+    This file is part of Avaframe.
+"""
+
+import sys
+import time
+import logging
+import configparser
+import numpy as np
+
+# Local imports
+import avaframe.in3Utils.ascUtils as IOf
+from avaframe.com2AB import com2AB
+
+logging.basicConfig(level=logging.WARNING)
+log = logging.getLogger(__name__)
+log.setLevel(logging.INFO)
+
+
+if __name__ == '__main__':
+    nPaths = int(sys.argv[1]) if len(sys.argv) > 1 else 1000
+
+    header = IOf.cASCheader()
+    header.nrows = 2000
+    header.ncols = 1000
+    header.xllcorner = 0.
+    header.yllcorner = 0.
+    header.cellsize = 5.
+    x, y = np.meshgrid(np.arange(1000) * 5., np.arange(2000) * 5.)
+    dem = {'header': header, 'rasterData': 2000 * np.exp(-x / 800) + 20 * np.sin(y / 300)}
+
+    # paths from the top to the valley with 3 vertices each, one split point per path
+    yPath = np.linspace(100, 9900, nPaths)
+    Avapath = {'Name': ['path%d' % i for i in range(nPaths)],
+               'Start': np.arange(nPaths) * 3., 'Length': np.full(nPaths, 3.),
+               'x': np.tile([10., 1500., 4900.], nPaths),
+               'y': np.repeat(yPath, 3) + np.tile([0., 30., -20.], nPaths)}
+    splitPoint = {'x': np.full(nPaths, 600.), 'y': yPath}
+    log.info('%d paths, %d split points' % (nPaths, nPaths))
+
+    cfg = configparser.ConfigParser()
+    cfg['ABSETUP'] = {'smallAva': 'False', 'customParam': 'False', 'distance': '10'}
+    t0 = time.perf_counter()
+    com2AB.com2ABMain(dem, Avapath, splitPoint, cfg['ABSETUP'])
+    tPath = time.perf_counter() - t0
+    cfg['ABSETUP']['batch'] = 'True'
+    t0 = time.perf_counter()
+    com2AB.com2ABMain(dem, Avapath, splitPoint, cfg['ABSETUP'])
+    tBatch = time.perf_counter() - t0
+    log.info('{: <16} {:>8.3f} s'.format('path by path', tPath))
+    log.info('{: <16} {:>8.3f} s'.format('batch', tBatch))
@@ -0,0 +1,64 @@
+"""
+    Benchmark for the projection of split points on a profile (geoTrans)
+
+    Projects nPoints random split points (default 5000, use e.g.
+    python3 benchFindSplitPoint.py 500 for less) on a dense winding profile of
+    20000 points and times findSplitPoint against the former loop computing the
+    distance of every split point to every profile point, checking that both
+    give the same profile point. It also times the projection on the profile
+    segments (projectOnProfile) with the same spatial index.
+    Requires avaframe to be installed (e.g. pip install -e .).
+
+    This file is part of Avaframe.
+"""
+
+import sys
+import time
+import logging
+import numpy as np
+
+# Local imports
+import avaframe.in2Trans.geoTrans as geoTrans
+
+logging.basicConfig(level=logging.INFO)
+log = logging.getLogger(__name__)
+
+
+def findSplitPointLoop(AvaProfile, Points):
+    """ Former split point search (distance to all profile points) """
+    Dist = np.empty((0))
+    IndSplit = np.empty((0))
+    for i in range(len(Points['x'])):
+        dist = np.sqrt((AvaProfile['x'] - Points['x'][i])**2 + (AvaProfile['y'] - Points['y'][i])**2)
+        indSplit = np.argmin(dist)
+        IndSplit = np.append(IndSplit, indSplit)
+        Dist = np.append(Dist, dist[indSplit])
+    return int(IndSplit[np.argmin(Dist)])
+
+
+if __name__ == '__main__':
+    nPoints = int(sys.argv[1]) if len(sys.argv) > 1 else 5000
+
+    s = np.linspace(0, 10000, 20000)
+    AvaProfile = {'x': s, 'y': 200 * np.sin(s / 300), 'z': 3000 - 0.2 * s, 's': s}
+    rng = np.random.default_rng(0)
+    Points = {'x': rng.uniform(0, 10000, nPoints), 'y': rng.uniform(-400, 400, nPoints)}
+
+    t0 = time.perf_counter()
+    indLoop = findSplitPointLoop(AvaProfile, Points)
+    tOld = time.perf_counter() - t0
+    t0 = time.perf_counter()
+    profileIndex = geoTrans.makeProfileIndex(AvaProfile)
+    tIndex = time.perf_counter() - t0
+    t0 = time.perf_counter()
+    projPoint = geoTrans.findSplitPoint(AvaProfile, Points, profileIndex=profileIndex)
+    tNew = time.perf_counter() - t0
+    t0 = time.perf_counter()
+    geoTrans.projectOnProfile(AvaProfile, Points, profileIndex=profileIndex)
+    tProj = time.perf_counter() - t0
+
+    log.info('{: <24} {:>8.3f} s'.format('distance loop', tOld))
+    log.info('{: <24} {:>8.3f} s'.format('makeProfileIndex', tIndex))
+    log.info('{: <24} {:>8.3f} s'.format('findSplitPoint', tNew))
+    log.info('{: <24} {:>8.3f} s'.format('projectOnProfile', tProj))
+    log.info('Speedup %.1f, same profile point: %s' % (tOld / (tIndex + tNew), indLoop == projPoint['indSplit']))
@@ -0,0 +1,76 @@
+"""
+    Benchmark for the domain grid construction of ana3AIMEC.makeTransfoMat
+
+    Builds a synthetic winding path of nPoints vertices (default 2000, use
+    e.g. python3 benchMakeTransfoMat.py 500 for a shorter one) and times
+    makeTransfoMat against the former row by row np.append construction,
+    checking that both give identical grids.
+    Requires avaframe to be installed (e.g. pip install -e .).
+
+    This file is part of Avaframe.
+"""
+
+import sys
+import time
+import logging
+import numpy as np
+
+# Local imports
+from avaframe.ana3AIMEC import ana3AIMEC
+
+logging.basicConfig(level=logging.INFO)
+log = logging.getLogger(__name__)
+
+
+def makeTransfoMatAppend(rasterTransfo, nTot):
+    """ Former construction of the domain grid (appending row by row) """
+    n_pnt = np.shape(rasterTransfo['DBXr'])[0]
+    for i in range(n_pnt-1):
+        bxl, byl, bxr, byr, m = ana3AIMEC.split_section(rasterTransfo, i)
+        for j in range(m-1):
+            x = np.linspace(bxl[j], bxr[j], nTot)
+            y = np.linspace(byl[j], byr[j], nTot)
+            if i == 0 and j == 0:
+                newGridRasterX = x.reshape(1, nTot)
+                newGridRasterY = y.reshape(1, nTot)
+            else:
+                newGridRasterX = np.append(newGridRasterX, x.reshape(1, nTot), axis=0)
+                newGridRasterY = np.append(newGridRasterY, y.reshape(1, nTot), axis=0)
+    x = np.linspace(bxl[m-1], bxr[m-1], nTot)
+    y = np.linspace(byl[m-1], byr[m-1], nTot)
+    newGridRasterX = np.append(newGridRasterX, x.reshape(1, nTot), axis=0)
+    newGridRasterY = np.append(newGridRasterY, y.reshape(1, nTot), axis=0)
+    return newGridRasterX, newGridRasterY
+
+
+if __name__ == '__main__':
+    nPoints = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+
+    # winding path with 3 cells between vertices, domain of 601 cells width
+    t = np.arange(nPoints) * 3.
+    x = t
+    y = 200 * np.sin(t / 500)
+    dx = np.gradient(x)
+    dy = np.gradient(y)
+    norm = np.sqrt(dx**2 + dy**2)
+    rasterTransfo = {'domainWidth': 600, 'cellsize': 1}
+    rasterTransfo['DBXl'] = x - 300 * dy / norm
+    rasterTransfo['DBYl'] = y + 300 * dx / norm
+    rasterTransfo['DBXr'] = x + 300 * dy / norm
+    rasterTransfo['DBYr'] = y - 300 * dx / norm
+
+    t0 = time.perf_counter()
+    rasterTransfo = ana3AIMEC.makeTransfoMat(rasterTransfo)
+    tNew = time.perf_counter() - t0
+    nTot = len(rasterTransfo['l'])
+    log.info('Domain grid: %d x %d points' % np.shape(rasterTransfo['gridx']))
+
+    t0 = time.perf_counter()
+    gridx, gridy = makeTransfoMatAppend(rasterTransfo, nTot)
+    tOld = time.perf_counter() - t0
+
+    identical = (np.array_equal(gridx, rasterTransfo['gridx']) and
+                 np.array_equal(gridy, rasterTransfo['gridy']))
+    log.info('{: <24} {:>8.3f} s'.format('np.append loop', tOld))
+    log.info('{: <24} {:>8.3f} s'.format('makeTransfoMat', tNew))
+    log.info('Speedup %.1f, identical grids: %s' % (tOld / tNew, identical))
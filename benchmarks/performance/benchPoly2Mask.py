@@ -0,0 +1,91 @@
+"""
+    Benchmark for the polygon rasterization of geoTrans
+
+    Rasterizes a synthetic star shaped release area polygon on a grid of
+    nCells x nCells cells (default 2000, use e.g. python3 benchPoly2Mask.py
+    500 for a smaller one) with shpPoly2Mask (polygon coordinates) and
+    poly2maskSimple (polygon in cell indices). On a small grid, the mask of
+    poly2maskSimple is checked against the former cell by cell inpolygon loop.
+    Requires avaframe to be installed (e.g. pip install -e .).
+
+    This file is part of Avaframe.
+"""
+
+import sys
+import time
+import logging
+import numpy as np
+
+# Local imports
+import avaframe.in2Trans.geoTrans as geoTrans
+import avaframe.in3Utils.ascUtils as IOf
+
+logging.basicConfig(level=logging.INFO)
+log = logging.getLogger(__name__)
+
+
+def inpolygonLoop(X, Y, xv, yv):
+    """ Former inpolygon (loop on the edges and on the cells) """
+    npol = len(xv)
+    lx = np.shape(X)[0]
+    ly = np.shape(Y)[1]
+    IN = np.zeros(np.shape(X))
+    j = npol-1
+    for i in range(npol-1):
+        deltaxv = xv[j] - xv[i]
+        deltayv = yv[j] - yv[i]
+        distance = deltaxv*(Y-yv[i]) - (X-xv[i])*deltayv
+        for ii in range(lx):
+            for jj in range(ly):
+                if (((yv[i] <= Y[ii][jj] and Y[ii][jj] < yv[j]) or (yv[j] <= Y[ii][jj] and Y[ii][jj] < yv[i]))
+                        and 0 < distance[ii][jj]*deltayv):
+                    IN[ii][jj] = 1 - IN[ii][jj]
+        j = i
+    for i in range(npol-1):
+        IN[yv[i]][xv[i]] = 1
+    return IN
+
+
+def starPolygon(nCells, nVertices=200):
+    """ Star shaped polygon in cell index coordinates covering most of the grid """
+    t = np.linspace(0, 2*np.pi, nVertices, endpoint=False)
+    r = nCells * (0.3 + 0.15 * np.sin(7 * t))
+    return nCells / 2 + r * np.cos(t), nCells / 2 + r * np.sin(t)
+
+
+if __name__ == '__main__':
+    nCells = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+
+    header = IOf.cASCheader()
+    header.ncols = nCells
+    header.nrows = nCells
+    header.xllcorner = 0
+    header.yllcorner = 0
+    header.cellsize = 5
+    x, y = starPolygon(nCells)
+    Polygons = {'x': x * 5, 'y': y * 5, 'Start': np.array([0.]), 'Length': np.array([len(x)])}
+    t0 = time.perf_counter()
+    mask = geoTrans.shpPoly2Mask(Polygons, header)
+    log.info('{: <24} {:>8.3f} s ({:d} x {:d} cells, {:d} inside)'.format(
+        'shpPoly2Mask', time.perf_counter() - t0, nCells, nCells, int(np.sum(mask))))
+
+    t0 = time.perf_counter()
+    mask = geoTrans.poly2maskSimple(np.round(x), np.round(y), nCells, nCells)
+    log.info('{: <24} {:>8.3f} s'.format('poly2maskSimple', time.perf_counter() - t0))
+
+    # comparison with the former loop on a small grid
+    nSmall = 60
+    x, y = starPolygon(nSmall, nVertices=20)
+    t0 = time.perf_counter()
+    mask = geoTrans.poly2maskSimple(np.round(x), np.round(y), nSmall, nSmall)
+    tNew = time.perf_counter() - t0
+    orig = geoTrans.inpolygon
+    geoTrans.inpolygon = inpolygonLoop
+    try:
+        t0 = time.perf_counter()
+        maskLoop = geoTrans.poly2maskSimple(np.round(x), np.round(y), nSmall, nSmall)
+        tOld = time.perf_counter() - t0
+    finally:
+        geoTrans.inpolygon = orig
+    log.info('%d x %d cells: loop %.3f s, vectorized %.4f s, speedup %.0f, identical masks: %s' %
+             (nSmall, nSmall, tOld, tNew, tOld / tNew, np.array_equal(mask, maskLoop)))
@@ -0,0 +1,72 @@
+"""
+    Benchmark for reading ascii rasters with ascUtils
+
+    Generates a synthetic DEM of nRows x nCols cells (default 4000 x 4000,
+    use e.g. python3 benchReadASC.py 2000 2000 for a smaller one), writes it
+    to a temporary .asc file and reports the read throughput in MB/s
+    (for readRaster also with the binary raster cache).
+    Requires avaframe to be installed (e.g. pip install -e .).
+
+    This file is part of Avaframe.
+"""
+
+import os
+import sys
+import time
+import logging
+import tempfile
+import configparser
+import numpy as np
+
+# Local imports
+import avaframe.in3Utils.ascUtils as IOf
+
+logging.basicConfig(level=logging.INFO)
+log = logging.getLogger(__name__)
+
+
+def writeSyntheticDEM(fname, nRows, nCols):
+    """ Write a synthetic DEM with two decimals per cell """
+    x = np.linspace(0, 1, nCols)
+    y = np.linspace(0, 1, nRows)
+    z = 3000 - 1500 * x[np.newaxis, :] + 50 * np.sin(10 * y[:, np.newaxis])
+    with open(fname, 'w') as f:
+        f.write('ncols %d\nnrows %d\nxllcorner 0\nyllcorner 0\ncellsize 5\nNODATA_value -9999\n'
+                % (nCols, nRows))
+        np.savetxt(f, z, fmt='%.2f')
+
+
+def timeReader(reader, fname, nRepeat=3):
+    """ Return the best wall clock time of nRepeat calls of reader(fname) """
+    tBest = np.inf
+    for i in range(nRepeat):
+        t0 = time.perf_counter()
+        reader(fname)
+        tBest = min(tBest, time.perf_counter() - t0)
+    return tBest
+
+
+if __name__ == '__main__':
+    nRows = int(sys.argv[1]) if len(sys.argv) > 1 else 4000
+    nCols = int(sys.argv[2]) if len(sys.argv) > 2 else 4000
+
+    with tempfile.TemporaryDirectory() as tmpDir:
+        fname = os.path.join(tmpDir, 'benchDEM.asc')
+        writeSyntheticDEM(fname, nRows, nCols)
+        sizeMB = os.path.getsize(fname) / 1.e6
+        log.info('Synthetic DEM: %d x %d cells, %.1f MB' % (nRows, nCols, sizeMB))
+
+        readers = {'readASCheader': IOf.readASCheader,
+                   'readASCdata2numpyArray float64':
+                       lambda f: IOf.readASCdata2numpyArray(f, dtype=np.float64),
+                   'readASCdata2numpyArray float32':
+                       lambda f: IOf.readASCdata2numpyArray(f, dtype=np.float32),
+                   'readRaster': IOf.readRaster}
+        # binary cache in the temporary directory, the first call writes it
+        cfg = configparser.ConfigParser()
+        cfg['RASTER'] = {'useCache': 'True', 'cacheDir': os.path.join(tmpDir, 'cache')}
+        IOf.readRaster(fname, cfgRaster=cfg['RASTER'])
+        readers['readRaster cached'] = lambda f: IOf.readRaster(f, cfgRaster=cfg['RASTER'])
+        for name, reader in readers.items():
+            tRead = timeReader(reader, fname)
+            log.info('{: <32} {:>8.3f} s {:>10.1f} MB/s'.format(name, tRead, sizeMB / tRead))
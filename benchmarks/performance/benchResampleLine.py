@@ -0,0 +1,73 @@
+"""
+    Benchmark for the resampling of avalanche paths with geoTrans.resampleLine
+
+    Resamples synthetic paths of 100 to nMax vertices (default 10000, use
+    e.g. python3 benchResampleLine.py 2000 for shorter paths) with a resampling
+    distance of 1 m and compares the time to the former loop with np.append
+    (only up to 2000 vertices, it is quadratic) and to the equal arc length
+    mode.
+    Requires avaframe to be installed (e.g. pip install -e .).
+
+    This file is part of Avaframe.
+"""
+
+import sys
+import time
+import logging
+import numpy as np
+
+# Local imports
+import avaframe.in2Trans.geoTrans as geoTrans
+
+logging.basicConfig(level=logging.INFO)
+log = logging.getLogger(__name__)
+
+
+def resampleLineAppend(xcoor, ycoor, distance):
+    """ Former resampling of prepareLine (loops and np.append) """
+    xcoornew = np.array([xcoor[0]])
+    ycoornew = np.array([ycoor[0]])
+    s = np.array([0])
+    for i in range(np.shape(xcoor)[0] - 1):
+        Vx = xcoor[i + 1] - xcoor[i]
+        Vy = ycoor[i + 1] - ycoor[i]
+        D = np.sqrt(Vx**2 + Vy**2)
+        nd = int(np.floor(D / distance) + 1)
+        S0 = s[-1]
+        for j in range(1, nd + 1):
+            xn = j / (nd) * Vx + xcoor[i]
+            yn = j / (nd) * Vy + ycoor[i]
+            xcoornew = np.append(xcoornew, xn)
+            ycoornew = np.append(ycoornew, yn)
+            s = np.append(s, S0 + D * j / nd)
+    return xcoornew, ycoornew, s
+
+
+def timeCall(function, *args, **kwargs):
+    """ Return the result and the wall clock time of a call """
+    t0 = time.perf_counter()
+    result = function(*args, **kwargs)
+    return result, time.perf_counter() - t0
+
+
+if __name__ == '__main__':
+    nMax = int(sys.argv[1]) if len(sys.argv) > 1 else 10000
+    distance = 1.
+
+    log.info('{: >9} {: >9} {: >12} {: >12} {: >12} {: >10}'.format(
+        'vertices', 'points', 'np.append', 'resampleLine', 'equalSpacing', 'identical'))
+    for nVertices in [n for n in [100, 200, 500, 1000, 2000, 5000, 10000, 20000, 50000, 100000]
+                      if n <= nMax]:
+        # winding path with segments of 5 to 15 m
+        t = np.cumsum(np.random.default_rng(0).uniform(5, 15, nVertices))
+        xcoor = t
+        ycoor = 100 * np.sin(t / 200)
+        (x, y, s), tNew = timeCall(geoTrans.resampleLine, xcoor, ycoor, distance=distance)
+        _, tEqual = timeCall(geoTrans.resampleLine, xcoor, ycoor, distance=distance, equalSpacing=True)
+        tOld = np.nan
+        identical = ''
+        if nVertices <= 2000:
+            (xOld, yOld, sOld), tOld = timeCall(resampleLineAppend, xcoor, ycoor, distance)
+            identical = str(np.array_equal(x, xOld) and np.array_equal(y, yOld) and np.array_equal(s, sOld))
+        log.info('{: >9d} {: >9d} {: >10.4f} s {: >10.4f} s {: >10.4f} s {: >10}'.format(
+            nVertices, len(x), tOld, tNew, tEqual, identical))
@@ -0,0 +1,76 @@
+"""
+    Benchmark for reading shape files with shpConversion.SHP2Array
+
+    Generates a polyline shape file with nShapes lines of nPoints vertices
+    each (default 50 x 2000, use e.g. python3 benchSHP2Array.py 20 1000 for
+    a smaller one) and times SHP2Array against the former vertex by vertex
+    np.append reading, checking that both give the same arrays.
+    Requires avaframe to be installed (e.g. pip install -e .).
+
+    This file is part of Avaframe.
+"""
+
+import os
+import sys
+import time
+import logging
+import tempfile
+import shapefile
+import numpy as np
+
+# Local imports
+import avaframe.in2Trans.shpConversion as shpConv
+
+logging.basicConfig(level=logging.INFO)
+log = logging.getLogger(__name__)
+
+
+def SHP2ArrayAppend(infile):
+    """ Former reading of the coordinates (appending vertex by vertex) """
+    sf = shapefile.Reader(infile)
+    Length = np.empty((0))
+    Start = np.empty((0))
+    Coordx = np.empty((0))
+    Coordy = np.empty((0))
+    start = 0
+    for item in sf.shapes():
+        pts = item.points
+        Start = np.append(Start, start)
+        Length = np.append(Length, len(pts))
+        start += len(pts)
+        for pt in pts:
+            Coordx = np.append(Coordx, pt[0])
+            Coordy = np.append(Coordy, pt[1])
+    return {'Start': Start, 'Length': Length, 'x': Coordx, 'y': Coordy}
+
+
+def writeSyntheticLines(fname, nShapes, nPoints):
+    """ Write nShapes wavy lines of nPoints vertices with a name field """
+    t = np.linspace(0, 5000, nPoints)
+    with shapefile.Writer(fname, shapeType=shapefile.POLYLINE) as w:
+        w.field('name', 'C')
+        for i in range(nShapes):
+            w.line([np.column_stack((t, 100 * i + 20 * np.sin(t / 100))).tolist()])
+            w.record('path%d' % i)
+
+
+if __name__ == '__main__':
+    nShapes = int(sys.argv[1]) if len(sys.argv) > 1 else 50
+    nPoints = int(sys.argv[2]) if len(sys.argv) > 2 else 2000
+
+    with tempfile.TemporaryDirectory() as tmpDir:
+        fname = os.path.join(tmpDir, 'benchLines.shp')
+        writeSyntheticLines(fname, nShapes, nPoints)
+        log.info('Synthetic shape file: %d lines, %d vertices' % (nShapes, nShapes * nPoints))
+
+        t0 = time.perf_counter()
+        SHPdata = shpConv.SHP2Array(fname, 'defName')
+        tNew = time.perf_counter() - t0
+        t0 = time.perf_counter()
+        SHPappend = SHP2ArrayAppend(fname)
+        tOld = time.perf_counter() - t0
+
+    identical = all(np.array_equal(SHPdata[key], SHPappend[key]) for key in ['Start', 'Length', 'x', 'y'])
+    log.info('{: <24} {:>8.3f} s'.format('np.append loop', tOld))
+    log.info('{: <24} {:>8.3f} s'.format('SHP2Array', tNew))
+    log.info('Speedup %.1f, identical arrays: %s' % (tOld / tNew, identical))
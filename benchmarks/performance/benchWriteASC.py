@@ -0,0 +1,49 @@
+"""
+    Benchmark for writing ascii rasters with ascUtils.writeResultToAsc
+
+    Writes a synthetic DEM of nRows x nCols cells (default 4000 x 4000,
+    use e.g. python3 benchWriteASC.py 2000 2000 for a smaller one) to a
+    temporary .asc (and .asc.gz) file and reports the write throughput in MB/s.
+    Requires avaframe to be installed (e.g. pip install -e .).
+
+    This file is part of Avaframe.
+"""
+
+import os
+import sys
+import time
+import logging
+import tempfile
+import numpy as np
+
+# Local imports
+import avaframe.in3Utils.ascUtils as IOf
+
+logging.basicConfig(level=logging.INFO)
+log = logging.getLogger(__name__)
+
+
+if __name__ == '__main__':
+    nRows = int(sys.argv[1]) if len(sys.argv) > 1 else 4000
+    nCols = int(sys.argv[2]) if len(sys.argv) > 2 else 4000
+
+    header = IOf.cASCheader()
+    header.nrows = nRows
+    header.ncols = nCols
+    header.xllcorner = 0.
+    header.yllcorner = 0.
+    header.cellsize = 5.
+    header.noDataValue = -9999.
+    x = np.linspace(0, 1, nCols)
+    y = np.linspace(0, 1, nRows)
+    z = 3000 - 1500 * x[np.newaxis, :] + 50 * np.sin(10 * y[:, np.newaxis])
+
+    with tempfile.TemporaryDirectory() as tmpDir:
+        for name, precision in [('benchDEM.asc', 2), ('benchDEM.asc', 6), ('benchDEM.asc.gz', 2)]:
+            fname = os.path.join(tmpDir, name)
+            t0 = time.perf_counter()
+            IOf.writeResultToAsc(header, z, fname, precision=precision)
+            tWrite = time.perf_counter() - t0
+            sizeMB = os.path.getsize(fname) / 1.e6
+            log.info('{: <16} precision {:d} {:>8.3f} s {:>8.1f} MB {:>8.1f} MB/s'.format(
+                name, precision, tWrite, sizeMB, sizeMB / tWrite))